@@ -0,0 +1,347 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This benchmark script measures the framework itself. It generates a synthetic test-data tree - flow count, test
+# cases per flow, attributes per test case and payload size are configurable, every binary_every-th test case has a
+# binary payload - whose expected output equals its input, so that it passes against identity flows. The suite is run
+# against fake_nifi.py started in-process (optionally with injected latency) or against the NiFi / Registry configured
+# in config/env, eg: the docker NiFi, whose test bucket must hold identity flows named like the generated flows.
+# Each run reports tests/sec, setup / teardown secs per flow, REST calls per test (counted by the fake, or taken from
+# the api latency histogram of the tracer for other endpoints) and the peak RSS of the test process. Results are saved
+# as JSON, and compared with a saved baseline to see the effect of changes to flow_utils and flow_unit_test:
+#   py benchmark.py --flows 4 --tests-per-flow 10 --payload-bytes 65536 --save before
+#   py benchmark.py --flows 4 --tests-per-flow 10 --payload-bytes 65536 --baseline ../benchmarks/baselines/before.json
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import statistics
+import string
+import subprocess
+import sys
+import time
+
+from fake_nifi import FakeNifi, start_fake_nifi, stop_fake_nifi, parse_latency_rule
+
+TEST_PROPERTIES = '../config/test.properties'
+BENCHMARK_DIR = '../benchmarks'
+FLOW_PREFIX = 'bench-flow-'
+TEST_CASE_PREFIX = 'tc'
+LINE_CHARS = string.ascii_letters + string.digits + ' ,;'
+ATTRIBUTE_CHARS = string.ascii_letters + string.digits
+ATTRIBUTE_VALUE_LENGTH = 16
+LINE_LENGTH = 80
+# metrics that are better when lower, every other metric is better when higher
+LOWER_IS_BETTER = ('wall_clock_secs', 'flow_setup_secs', 'flow_teardown_secs', 'test_case_secs', 'rest_calls_per_test',
+                   'peak_rss_mb')
+
+
+# --------------------------------- Test data --------------------------------- #
+def _text_payload(rng, size):
+    lines = []
+    remaining = size
+    while remaining > 0:
+        line = ''.join(rng.choice(LINE_CHARS) for _ in range(min(LINE_LENGTH, remaining)))
+        lines.append(line)
+        remaining -= len(line) + 1
+    return '\n'.join(lines)
+
+
+# Generates <test_data_dir>/<flow>/<flow>_tcN.json with input and expected output files, returns the flow names.
+# The same seed generates the same tree
+def generate_test_data(test_data_dir, flow_count, tests_per_flow, attribute_count, payload_bytes, binary_every=0,
+                       seed=0, flow_prefix=FLOW_PREFIX):
+    rng = random.Random(seed)
+    shutil.rmtree(test_data_dir, ignore_errors=True)
+    flow_names = [flow_prefix + str(index) for index in range(1, flow_count + 1)]
+    for flow_name in flow_names:
+        flow_dir = os.path.join(test_data_dir, flow_name)
+        os.makedirs(flow_dir)
+        for index in range(1, tests_per_flow + 1):
+            tc_name = flow_name + '_' + TEST_CASE_PREFIX + str(index)
+            is_binary = binary_every > 0 and index % binary_every == 0
+            attributes = {'attr_' + str(number): ''.join(rng.choice(ATTRIBUTE_CHARS)
+                                                         for _ in range(ATTRIBUTE_VALUE_LENGTH))
+                          for number in range(1, attribute_count + 1)}
+            test_case = {'input': {'attributes': attributes}, 'expected_output': {'attributes': attributes}}
+            if payload_bytes > 0 and is_binary:
+                # binary input is posted as is, its output content is not asserted
+                input_file_name = tc_name + '_input.bin'
+                with open(os.path.join(flow_dir, input_file_name), 'wb') as payload_file:
+                    payload_file.write(rng.randbytes(payload_bytes))
+                test_case['input']['flow_content'] = {'file_name': input_file_name}
+                test_case['expected_output']['flow_content'] = {'file_name': ''}
+                test_case['settings'] = {'load_file_type': 'binary', 'skip_replace_text_in': 'true',
+                                         'skip_check_out_content': 'true'}
+            elif payload_bytes > 0:
+                payload = _text_payload(rng, payload_bytes)
+                for file_name in (tc_name + '_input.txt', tc_name + '_output.txt'):
+                    with open(os.path.join(flow_dir, file_name), 'w') as payload_file:
+                        payload_file.write(payload)
+                test_case['input']['flow_content'] = {'file_name': tc_name + '_input.txt'}
+                test_case['expected_output']['flow_content'] = {'file_name': tc_name + '_output.txt'}
+            with open(os.path.join(flow_dir, tc_name + '.json'), 'w') as json_file:
+                json.dump(test_case, json_file, indent=2)
+    return flow_names
+
+
+# Copies the base test properties with overridden values, keys that are not in the base file are appended and keys
+# overridden with None are left out
+def write_properties(base_file, properties_file, overrides):
+    with open(base_file, 'r') as prop_file:
+        base_lines = prop_file.read().splitlines()
+    remaining = dict(overrides)
+    lines = []
+    for line in base_lines:
+        key = line.split('=', 1)[0].strip()
+        if '=' in line and not line.lstrip().startswith('#') and key in overrides:
+            value = remaining.pop(key, None)
+            if value is not None:
+                lines.append(key + '=' + str(value))
+        else:
+            lines.append(line)
+    lines += [key + '=' + str(value) for key, value in remaining.items() if value is not None]
+    with open(properties_file, 'w') as prop_file:
+        prop_file.write('\n'.join(lines) + '\n')
+
+
+def _parse_override(value):
+    key, separator, override = value.partition('=')
+    if not separator or not key.strip():
+        raise argparse.ArgumentTypeError('property override must be key=value: ' + value)
+    return key.strip(), override
+
+
+# --------------------------------- Runs --------------------------------- #
+# Runs flow_unit_test.py in a child process, returns its exit code and peak RSS (MB, None where wait4 is missing)
+def _run_suite(properties_file, suite_args, env, log_file_name):
+    with open(log_file_name, 'w') as log_file:
+        process = subprocess.Popen([sys.executable, 'flow_unit_test.py', '--properties', properties_file] + suite_args,
+                                   env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        if not hasattr(os, 'wait4'):
+            return process.wait(), None
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in KB on Linux, in bytes on macOS
+        peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        return process.returncode, round(peak_rss_mb, 1)
+
+
+def _latest(pattern):
+    files = sorted(glob.glob(pattern))
+    if not files:
+        return None
+    with open(files[-1], 'r') as json_file:
+        return json.load(json_file)
+
+
+def _median(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+# Metrics of a run from its JSON report and REST call count
+def run_metrics(report, rest_calls, exit_code, peak_rss_mb):
+    flows = report['flows'] if report else []
+    test_cases = [test_case for flow in flows for test_case in flow['test_cases']]
+    tests = len(test_cases)
+    wall_clock_secs = report['wall_clock_secs'] if report else None
+    return {
+        'exit_code': exit_code,
+        'result': report['result'] if report else 'NO REPORT',
+        'tests': tests,
+        'passed': sum(1 for test_case in test_cases if test_case['result'] == 'PASSED'),
+        'wall_clock_secs': wall_clock_secs,
+        'tests_per_sec': round(tests / wall_clock_secs, 3) if tests and wall_clock_secs else None,
+        'flow_setup_secs': _median(flow['setup_secs'] for flow in flows),
+        'flow_teardown_secs': _median(flow['teardown_secs'] for flow in flows),
+        'test_case_secs': _median(test_case['secs'] for test_case in test_cases),
+        'rest_calls': rest_calls,
+        'rest_calls_per_test': round(rest_calls / tests, 2) if rest_calls is not None and tests else None,
+        'peak_rss_mb': peak_rss_mb,
+        'flows': {flow['flow']: {'setup_secs': flow['setup_secs'], 'teardown_secs': flow['teardown_secs'],
+                                 'phases': flow['phases']} for flow in flows},
+    }
+
+
+# Runs the generated suite repeat times, against an in-process fake NiFi unless use_env_endpoint is set
+def run_benchmark(args, flow_names, test_data_dir, run_dir):
+    fake_server = None
+    env = dict(os.environ)
+    if not args.use_env_endpoint:
+        fake = FakeNifi(args.fake_latency, args.fake_default_latency, args.fake_transition_secs)
+        for flow_name in flow_names:
+            fake.add_flow(args.bucket, flow_name, 1)
+        fake_server = start_fake_nifi(fake, '127.0.0.1', args.fake_port)
+        fake_port = str(fake_server.server_address[1])
+        env.update({'NIFI_SCHEME': 'http', 'NIFI_HOSTNAME': '127.0.0.1', 'NIFI_PORT': fake_port,
+                    'NIFI_REGISTRY_HOSTNAME': '127.0.0.1', 'NIFI_REGISTRY_PORT': fake_port,
+                    'NIFI_TEST_API_HOSTNAME': '127.0.0.1'})
+
+    runs = []
+    try:
+        for run_index in range(1, args.repeat + 1):
+            report_dir = os.path.join(run_dir, 'run-' + str(run_index))
+            # the tracer counts REST calls of endpoints other than the fake
+            trace_dir = os.path.join(report_dir, 'traces') if args.use_env_endpoint else ''
+            properties_file = os.path.join(report_dir, 'test.properties')
+            os.makedirs(report_dir)
+            write_properties(args.properties, properties_file, {
+                **dict(args.set),
+                'repo_base_dir': os.path.abspath(os.path.dirname(test_data_dir)) + os.sep,
+                'test_data_dir': os.path.basename(test_data_dir),
+                'test_bucket_name': args.bucket,
+                'flow_version_mapping': json.dumps({flow_name: 1 for flow_name in flow_names}),
+                # the external repo would be cloned over repo_base_dir
+                'skip_test_dirs': '', 'skip_tests': '', 'include_only': '', 'external_repo_git_url': None,
+                'report_dir': os.path.abspath(report_dir), 'trace_dir': trace_dir and os.path.abspath(trace_dir),
+                'history_db': ''})
+            if fake_server is not None:
+                fake_server.fake.calls.clear()
+
+            print('Benchmark run', run_index, 'of', args.repeat, '...')
+            exit_code, peak_rss_mb = _run_suite(properties_file, args.suite_args, env,
+                                                os.path.join(report_dir, 'flow_unit_test.log'))
+            if fake_server is not None:
+                rest_calls = sum(fake_server.fake.calls.values())
+            else:
+                histogram = _latest(os.path.join(trace_dir, 'api-latency-*.json'))
+                rest_calls = sum(entry['count'] for entry in histogram) if histogram is not None else None
+            metrics = run_metrics(_latest(os.path.join(report_dir, 'report-*.json')), rest_calls, exit_code,
+                                  peak_rss_mb)
+            print('  {} tests, {} passed, {} tests/sec, {} REST calls/test, peak RSS {} MB'.format(
+                metrics['tests'], metrics['passed'], metrics['tests_per_sec'], metrics['rest_calls_per_test'],
+                metrics['peak_rss_mb']))
+            runs.append(metrics)
+    finally:
+        if fake_server is not None:
+            stop_fake_nifi(fake_server)
+    return runs
+
+
+def summarize(runs):
+    return {metric: _median(run[metric] for run in runs)
+            for metric in ('wall_clock_secs', 'tests_per_sec', 'flow_setup_secs', 'flow_teardown_secs',
+                           'test_case_secs', 'rest_calls_per_test', 'peak_rss_mb')}
+
+
+# Prints the summary next to the baseline summary, returns the metrics that got worse by more than max_change_pct
+def compare(summary, baseline_summary, max_change_pct):
+    print(' ')
+    print('===== Benchmark vs Baseline =====')
+    print('{:<22} {:>12} {:>12} {:>9}'.format('metric', 'baseline', 'current', 'change'))
+    worse = []
+    for metric, value in summary.items():
+        baseline_value = baseline_summary.get(metric)
+        change_pct = None
+        if value is not None and baseline_value:
+            change_pct = round((value - baseline_value) / baseline_value * 100, 1)
+            got_worse = change_pct > 0 if metric in LOWER_IS_BETTER else change_pct < 0
+            if got_worse and abs(change_pct) > max_change_pct:
+                worse.append(metric)
+        print('{:<22} {:>12} {:>12} {:>9}'.format(metric, str(baseline_value), str(value),
+                                                 '' if change_pct is None else '{:+}%'.format(change_pct)))
+    return worse
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Benchmark of the Nifi Flow Unit Testing framework on synthetic test data. Arguments after -- are '
+                    'passed to flow_unit_test.py, eg: -- --parallel-flows 4')
+    arg_parser.add_argument('--flows', type=int, default=2, help='number of generated flows')
+    arg_parser.add_argument('--tests-per-flow', type=int, default=5, help='test cases per generated flow')
+    arg_parser.add_argument('--attributes', type=int, default=5, help='input / expected attributes per test case')
+    arg_parser.add_argument('--payload-bytes', type=int, default=1024, help='size of input / expected output files')
+    arg_parser.add_argument('--binary-every', type=int, default=0,
+                            help='every N-th test case has a binary payload, 0 for none')
+    arg_parser.add_argument('--seed', type=int, default=0, help='seed of the generated test data')
+    arg_parser.add_argument('--generate-only', action='store_true', help='only generate the test data')
+    arg_parser.add_argument('--repeat', type=int, default=1, help='number of runs, the summary holds their medians')
+    arg_parser.add_argument('--properties', default=TEST_PROPERTIES,
+                            help='test properties the generated properties are based on')
+    arg_parser.add_argument('--set', type=_parse_override, action='append', default=[], metavar='KEY=VALUE',
+                            help='test property override, eg: --set batch_test_cases=true, may be repeated')
+    arg_parser.add_argument('--bucket', default='nifi-testing', help='Registry bucket of the generated flows')
+    arg_parser.add_argument('--use-env-endpoint', action='store_true',
+                            help='run against the NiFi and Registry of config/env instead of an in-process fake NiFi')
+    arg_parser.add_argument('--fake-port', type=int, default=0, help='port of the fake NiFi, 0 for any free port')
+    arg_parser.add_argument('--fake-latency', type=parse_latency_rule, action='append', default=[],
+                            help='latency rule of the fake NiFi, "METHOD /path/pattern=secs", may be repeated')
+    arg_parser.add_argument('--fake-default-latency', type=float, default=0.0,
+                            help='latency of fake NiFi endpoints no --fake-latency rule matches, in secs')
+    arg_parser.add_argument('--fake-transition-secs', type=float, default=0.0,
+                            help='secs fake processors and controller services take to change state')
+    arg_parser.add_argument('--output-dir', default=BENCHMARK_DIR,
+                            help='directory of generated test data, run logs and results')
+    arg_parser.add_argument('--save', default=None, metavar='NAME',
+                            help='also save the results as baseline <output-dir>/baselines/NAME.json')
+    arg_parser.add_argument('--baseline', default=None, help='baseline json file to compare the results with')
+    arg_parser.add_argument('--max-change-pct', type=float, default=10.0,
+                            help='exit with 1 when a metric is worse than the baseline by more than this')
+    args, suite_args = arg_parser.parse_known_args()
+    args.suite_args = [suite_arg for suite_arg in suite_args if suite_arg != '--']
+
+    test_data_dir = os.path.join(args.output_dir, 'test-data')
+    flow_names = generate_test_data(test_data_dir, args.flows, args.tests_per_flow, args.attributes,
+                                    args.payload_bytes, args.binary_every, args.seed)
+    print('Generated', args.flows * args.tests_per_flow, 'test cases of', args.flows, 'flows in',
+          os.path.abspath(test_data_dir))
+    if args.generate_only:
+        return 0
+
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    run_dir = os.path.join(args.output_dir, 'runs', stamp)
+    runs = run_benchmark(args, flow_names, test_data_dir, run_dir)
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': _git_commit(),
+        'endpoint': 'env' if args.use_env_endpoint else 'fake',
+        'params': {'flows': args.flows, 'tests_per_flow': args.tests_per_flow, 'attributes': args.attributes,
+                   'payload_bytes': args.payload_bytes, 'binary_every': args.binary_every, 'seed': args.seed,
+                   'repeat': args.repeat, 'set': dict(args.set), 'suite_args': args.suite_args,
+                   'fake_latency': args.fake_latency, 'fake_default_latency': args.fake_default_latency,
+                   'fake_transition_secs': args.fake_transition_secs},
+        'summary': summarize(runs),
+        'runs': runs,
+    }
+    results_file_name = os.path.join(run_dir, 'benchmark.json')
+    with open(results_file_name, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print('Results written to:', os.path.abspath(results_file_name))
+    if args.save:
+        baseline_file_name = os.path.join(args.output_dir, 'baselines', args.save + '.json')
+        os.makedirs(os.path.dirname(baseline_file_name), exist_ok=True)
+        shutil.copyfile(results_file_name, baseline_file_name)
+        print('Baseline saved to:', os.path.abspath(baseline_file_name))
+
+    exit_code = 0 if all(run['exit_code'] == 0 and run['tests'] for run in runs) else 1
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['params'] != results['params']:
+            print('Warning: baseline was run with other parameters:', baseline['params'])
+        worse = compare(results['summary'], baseline['summary'], args.max_change_pct)
+        if worse:
+            print('Worse than baseline by more than', args.max_change_pct, '%:', worse)
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -30,6 +30,7 @@ def _parse_bool(val: Union[str, bool]) -> bool:  # pylint: disable=E1136
 class AppConfig:
     DEBUG: bool = False
     ENV: str = 'local'
+    NIFI_SCHEME: str = 'https'
     NIFI_HOSTNAME: str
     NIFI_PORT: int
     VERIFY_SSL: bool
@@ -39,6 +40,7 @@ class AppConfig:
     NIFI_PASSWORD: str
     NIFI_REGISTRY_HOSTNAME: str
     NIFI_REGISTRY_PORT: int
+    NIFI_TEST_API_HOSTNAME: str = 'nifi'
 
     """
     Map environment variables to class fields according to these rules:
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This content compare script compares the output content returned by HandleHttpResponse with the expected output
+# file as streams. Both sides are cut into fixed size blocks and hashed block by block, memory stays bounded no matter
+# how big the content is. Only when the hashes differ the first differing block is located and a bounded unified diff
+# of the lines around the first difference is computed.
+
+import difflib
+import hashlib
+import tempfile
+from dataclasses import dataclass
+
+from utils import iter_file_chunks, normalized_chunks, FileContentType
+
+BLOCK_SIZE = 64 * 1024
+# actual content is kept in memory up to this size, bigger content is spooled to a temporary file
+SPOOL_MAX_MEMORY = 1024 * 1024
+DIFF_CONTEXT_BYTES = 4 * 1024
+DIFF_MAX_LINES = 50
+
+
+@dataclass(slots=True)
+class ContentComparison:
+    match: bool
+    actual_size: int
+    expected_size: int
+    first_difference: int = -1
+    diff: str = ''
+
+
+# Re-cuts a stream of chunks of any size into BLOCK_SIZE blocks, the last block may be shorter
+def _blocks(chunks):
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= BLOCK_SIZE:
+            yield bytes(buffer[:BLOCK_SIZE])
+            del buffer[:BLOCK_SIZE]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _digests(chunks, spool=None):
+    digests = []
+    size = 0
+    for block in _blocks(chunks):
+        if spool is not None:
+            spool.write(block)
+        digests.append(hashlib.sha256(block).digest())
+        size += len(block)
+    return digests, size
+
+
+def _read_window(chunks, start, end):
+    window = bytearray()
+    offset = 0
+    for chunk in chunks:
+        if offset + len(chunk) > start:
+            window += chunk[max(0, start - offset):end - offset]
+        offset += len(chunk)
+        if offset >= end:
+            break
+    return bytes(window)
+
+
+def _spooled_chunks(spool):
+    spool.seek(0)
+    return iter(lambda: spool.read(BLOCK_SIZE), b'')
+
+
+# difflib.unified_diff treats frequent lines as junk, which turns diffs of repetitive content into full rewrites
+def _unified_diff(expected_lines, actual_lines):
+    yield '--- expected\n'
+    yield '+++ actual\n'
+    matcher = difflib.SequenceMatcher(None, expected_lines, actual_lines, autojunk=False)
+    for group in matcher.get_grouped_opcodes(3):
+        first, last = group[0], group[-1]
+        yield '@@ -{},{} +{},{} @@\n'.format(first[1] + 1, last[2] - first[1], first[3] + 1, last[4] - first[3])
+        for tag, expected_start, expected_end, actual_start, actual_end in group:
+            if tag == 'equal':
+                yield from (' ' + line for line in expected_lines[expected_start:expected_end])
+                continue
+            yield from ('-' + line for line in expected_lines[expected_start:expected_end])
+            yield from ('+' + line for line in actual_lines[actual_start:actual_end])
+
+
+# Unified diff of the lines around the first difference, bounded to DIFF_MAX_LINES lines
+def _bounded_diff(actual_window, expected_window):
+    actual_lines = actual_window.decode('utf-8', 'replace').splitlines(keepends=True)
+    expected_lines = expected_window.decode('utf-8', 'replace').splitlines(keepends=True)
+    bounded = []
+    for line in _unified_diff(expected_lines, actual_lines):
+        if len(bounded) == DIFF_MAX_LINES:
+            bounded.append('... diff truncated\n')
+            break
+        bounded.append(line if line.endswith('\n') else line + '\n')
+    return ''.join(bounded)
+
+
+# Compares streamed actual content with the expected output file, in TEXT mode line endings of both sides are converted
+# to Unix ones
+def compare_content(actual_chunks, expected_file_name, mode=FileContentType.TEXT):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+        actual_digests, actual_size = _digests(normalized_chunks(actual_chunks, mode), spool)
+        expected_digests, expected_size = _digests(iter_file_chunks(expected_file_name, mode))
+        if actual_digests == expected_digests:
+            return ContentComparison(True, actual_size, expected_size)
+
+        # First differing block, a shorter side differs at its end
+        block = next((index for index, (actual, expected) in enumerate(zip(actual_digests, expected_digests))
+                      if actual != expected), min(len(actual_digests), len(expected_digests)))
+        block_start = block * BLOCK_SIZE
+        actual_block = _read_window(_spooled_chunks(spool), block_start, block_start + BLOCK_SIZE)
+        expected_block = _read_window(iter_file_chunks(expected_file_name, mode), block_start,
+                                      block_start + BLOCK_SIZE)
+        first_difference = block_start + next(
+            (index for index, (actual, expected) in enumerate(zip(actual_block, expected_block)) if actual != expected),
+            min(len(actual_block), len(expected_block)))
+
+        window_start = max(0, first_difference - DIFF_CONTEXT_BYTES)
+        window_end = first_difference + DIFF_CONTEXT_BYTES
+        diff = _bounded_diff(_read_window(_spooled_chunks(spool), window_start, window_end),
+                             _read_window(iter_file_chunks(expected_file_name, mode), window_start, window_end))
+        return ContentComparison(False, actual_size, expected_size, first_difference, diff)
@@ -0,0 +1,150 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This assertions script compares the state of database tables a flow wrote with the expected rows of a test case
+# ('expected_output' -> 'db'). Expected rows from a csv file or inline are bulk loaded into a temporary table with the
+# columns of the actual table, then row count and an order independent checksum of both are computed inside the
+# database and compared, so that matching tables of any size cost two aggregate queries. Only when they differ are
+# both sides streamed ordered by row hash in fixed size batches (named cursor on PostgreSQL) and merged to find the
+# rows that are missing or unexpected, keeping at most max_diff_rows of them in memory.
+
+import uuid
+from dataclasses import dataclass
+
+from db_utils.fixtures import FixtureError, database_driver, open_csv, parse_table_rows
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_MAX_DIFF_ROWS = 10
+
+
+# this object keeps a database assertion of a test case
+@dataclass(frozen=True, slots=True)
+class DbAssertion:
+    database: str
+    table: str
+    # filter of the actual rows, eg: the rows of a batch id
+    where: str
+    # csv file next to the test case, '' for inline rows
+    file_name: str
+    columns: tuple
+    rows: tuple
+
+
+# this object keeps the outcome of a database assertion that failed
+@dataclass(slots=True)
+class DbMismatch:
+    table: str
+    expected_count: int
+    actual_count: int
+    missing_count: int = 0
+    unexpected_count: int = 0
+    missing_rows: list = None
+    unexpected_rows: list = None
+
+    def __str__(self):
+        message = '{}: {} rows expected, {} found, {} missing, {} unexpected'.format(
+            self.table, self.expected_count, self.actual_count, self.missing_count, self.unexpected_count)
+        if self.missing_rows:
+            message += ', missing: ' + ', '.join(map(str, self.missing_rows))
+        if self.unexpected_rows:
+            message += ', unexpected: ' + ', '.join(map(str, self.unexpected_rows))
+        return message
+
+
+def _parse_assertion(json_assertion):
+    database, table, file_name, columns, rows = parse_table_rows(json_assertion, 'db assertion')
+    if not file_name and not columns:
+        raise FixtureError('db assertion of ' + table + ' needs a file, rows or columns')
+    return DbAssertion(database, table, json_assertion.get('where', ''), file_name, columns, rows)
+
+
+# Database assertions of the test case json found with the compiled JSONPath, in the order they are declared
+def parse_db_assertions(path, json_data):
+    found = path.find(json_data)
+    json_assertions = found[0].value if found else []
+    if not isinstance(json_assertions, list):
+        raise FixtureError('db assertions must be a json array')
+    return tuple(_parse_assertion(json_assertion) for json_assertion in json_assertions)
+
+
+# Merges expected and actual (row hash, row) streams ordered by row hash, rows only on one side are missing or
+# unexpected. Duplicate rows are matched one to one
+def diff_rows(expected_rows, actual_rows, columns, mismatch, max_diff_rows):
+    mismatch.missing_rows, mismatch.unexpected_rows = [], []
+
+    def _missing(row):
+        mismatch.missing_count += 1
+        if len(mismatch.missing_rows) < max_diff_rows:
+            mismatch.missing_rows.append(dict(zip(columns, row)))
+
+    def _unexpected(row):
+        mismatch.unexpected_count += 1
+        if len(mismatch.unexpected_rows) < max_diff_rows:
+            mismatch.unexpected_rows.append(dict(zip(columns, row)))
+
+    expected = next(expected_rows, None)
+    actual = next(actual_rows, None)
+    while expected is not None or actual is not None:
+        if actual is None or (expected is not None and expected[0] < actual[0]):
+            _missing(expected[1])
+            expected = next(expected_rows, None)
+        elif expected is None or actual[0] < expected[0]:
+            _unexpected(actual[1])
+            actual = next(actual_rows, None)
+        else:
+            expected = next(expected_rows, None)
+            actual = next(actual_rows, None)
+    return mismatch
+
+
+# Bulk loads the expected rows of the assertion into a temporary table, returns its name and the columns compared
+def _load_expected(driver, connection, tc_dir, assertion):
+    name = 'expected_' + uuid.uuid4().hex
+    if assertion.file_name:
+        with open_csv(tc_dir, assertion.file_name) as (columns, csv_file):
+            if not columns:
+                raise FixtureError('expected rows file ' + assertion.file_name + ' has no header row')
+            expected_table = driver.create_temp_table_like(connection, name, assertion.table, columns)
+            driver.bulk_load_csv(connection, expected_table, columns, csv_file)
+        return expected_table, columns
+    expected_table = driver.create_temp_table_like(connection, name, assertion.table, assertion.columns)
+    if assertion.rows:
+        driver.bulk_load_rows(connection, expected_table, assertion.columns, assertion.rows)
+    return expected_table, assertion.columns
+
+
+# Compares a table with the expected rows of the assertion, returns a DbMismatch or None when they match
+def assert_table(pools, tc_dir, assertion, batch_size=DEFAULT_BATCH_SIZE, max_diff_rows=DEFAULT_MAX_DIFF_ROWS):
+    database = pools.databases.get(assertion.database)
+    if database is None:
+        raise FixtureError('database ' + assertion.database + ' is not configured')
+    driver = database_driver(database['type'])
+    with pools.transaction(assertion.database) as connection:
+        expected_table, columns = _load_expected(driver, connection, tc_dir, assertion)
+        expected_count, expected_checksum = driver.table_checksum(connection, expected_table, columns)
+        actual_count, actual_checksum = driver.table_checksum(connection, assertion.table, columns, assertion.where)
+        mismatch = None
+        if (expected_count, expected_checksum) != (actual_count, actual_checksum):
+            # The temporary table is only visible to its connection, actual rows are streamed over another one
+            with pools.transaction(assertion.database) as actual_connection:
+                mismatch = diff_rows(driver.stream_row_hashes(connection, expected_table, columns, '', batch_size),
+                                     driver.stream_row_hashes(actual_connection, assertion.table, columns,
+                                                              assertion.where, batch_size),
+                                     columns, DbMismatch(assertion.table, expected_count, actual_count),
+                                     max_diff_rows)
+        # on errors the temporary table is rolled back with the transaction
+        driver.drop_table(connection, expected_table)
+        return mismatch
+
+
+# Compares the tables of the database assertions of a test case, returns the mismatches
+def assert_tables(pools, tc_dir, assertions, batch_size=DEFAULT_BATCH_SIZE, max_diff_rows=DEFAULT_MAX_DIFF_ROWS):
+    mismatches = []
+    for assertion in assertions:
+        mismatch = assert_table(pools, tc_dir, assertion, batch_size, max_diff_rows)
+        if mismatch is not None:
+            mismatches.append(mismatch)
+    return mismatches
@@ -0,0 +1,182 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This fixtures script seeds databases with the declarative fixtures of a test case ('settings' -> 'fixtures'). Each
+# fixture names a database of config/databases.json and a table, optionally runs sql statements (eg: create table)
+# and truncates the table, then bulk loads rows from a csv file next to the test case (header row = columns) or inline
+# rows - COPY FROM STDIN on PostgreSQL, fast_executemany on SQL Server. The fixtures of a database are loaded in one
+# transaction over a pooled connection, pools are kept per database for the whole run. Database drivers are imported
+# when a database of their type is first used.
+
+import csv
+import json
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from utils import file_name_with_path, get_value_or_default
+
+POSTGRES = 'postgres'
+SQL_SERVER = 'sqlserver'
+DATABASE_TYPES = (POSTGRES, SQL_SERVER)
+
+
+class FixtureError(ValueError):
+    pass
+
+
+# this object keeps a fixture of a test case
+@dataclass(frozen=True, slots=True)
+class Fixture:
+    database: str
+    table: str
+    truncate: bool
+    sql: tuple
+    # csv file next to the test case, '' for inline rows
+    file_name: str
+    columns: tuple
+    rows: tuple
+
+
+def database_driver(database_type):
+    if database_type == POSTGRES:
+        from db_utils import postgres_utils
+        return postgres_utils
+    from db_utils import sql_server_utils
+    return sql_server_utils
+
+
+# Inline values are loaded as they are, json objects and arrays as json text
+def _row_value(value):
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+# Database, table, csv file name, columns and inline rows of a fixture (or of another json object with rows of a
+# table, eg: a database assertion), json objects as rows are turned into sequences in the order of columns
+def parse_table_rows(json_table, description):
+    if not isinstance(json_table, dict):
+        raise FixtureError(description + ' must be a json object')
+    database = json_table.get('database')
+    table = json_table.get('table')
+    if not isinstance(database, str) or not database or not isinstance(table, str) or not table:
+        raise FixtureError(description + ' needs a database and a table')
+    file_name = json_table.get('file', '')
+    rows = json_table.get('rows', [])
+    if file_name and rows:
+        raise FixtureError(description + ' of ' + table + ' has both a file and rows')
+    if not isinstance(rows, list):
+        raise FixtureError('rows of ' + description + ' of ' + table + ' must be a json array')
+    columns = tuple(json_table.get('columns', ()))
+    if rows and isinstance(rows[0], dict):
+        columns = columns or tuple(rows[0])
+        rows = [[row.get(column) for column in columns] if isinstance(row, dict) else row for row in rows]
+    if rows and not columns:
+        raise FixtureError(description + ' of ' + table + ' has rows without columns')
+    if any(not isinstance(row, list) or len(row) != len(columns) for row in rows):
+        raise FixtureError('rows of ' + description + ' of ' + table + ' must have ' + str(len(columns)) + ' values')
+    return database, table, file_name, columns, tuple(tuple(_row_value(value) for value in row) for row in rows)
+
+
+def _parse_fixture(json_fixture):
+    database, table, file_name, columns, rows = parse_table_rows(json_fixture, 'fixture')
+    sql = json_fixture.get('sql', [])
+    sql = (sql,) if isinstance(sql, str) else tuple(sql)
+    return Fixture(database, table, str(json_fixture.get('truncate', True)).lower() == 'true', sql, file_name,
+                   columns, rows)
+
+
+# Fixtures of the test case json, in the order they are declared
+def parse_fixtures(json_data):
+    json_fixtures = get_value_or_default(json_data, '$.settings.fixtures', [])
+    if not isinstance(json_fixtures, list):
+        raise FixtureError('fixtures must be a json array')
+    return tuple(_parse_fixture(json_fixture) for json_fixture in json_fixtures)
+
+
+# Database name -> {"type": "postgres" | "sqlserver", "dsn": libpq or ODBC connection string}
+def load_databases(file_name):
+    with open(file_name, 'r') as json_file:
+        databases = json.load(json_file)
+    for name, database in databases.items():
+        if database.get('type') not in DATABASE_TYPES or not database.get('dsn'):
+            raise FixtureError('database ' + name + ' needs a type (' + ', '.join(DATABASE_TYPES) + ') and a dsn')
+    return databases
+
+
+# Connection pools of the databases, a pool is created when its database is first used. Callers wait for a free
+# connection instead of failing when max_connections of a database are in use
+class DatabasePools:
+    def __init__(self, databases, max_connections):
+        self.databases = databases
+        self.max_connections = max(1, max_connections)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, name):
+        with self._lock:
+            if name not in self._pools:
+                database = self.databases.get(name)
+                if database is None:
+                    raise FixtureError('database ' + name + ' is not configured')
+                pool = database_driver(database['type']).create_pool(database['dsn'], self.max_connections)
+                self._pools[name] = (pool, threading.BoundedSemaphore(self.max_connections))
+            return self._pools[name]
+
+    # Pooled connection of the database in a transaction, committed on success and rolled back on error
+    @contextmanager
+    def transaction(self, name):
+        pool, slots = self._pool(name)
+        with slots:
+            connection = pool.getconn()
+            try:
+                yield connection
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            finally:
+                pool.putconn(connection)
+
+    def close(self):
+        with self._lock:
+            for pool, _ in self._pools.values():
+                pool.closeall()
+            self._pools.clear()
+
+
+# Opens a csv file next to the test case, yields the columns of its header row and the file positioned after it
+@contextmanager
+def open_csv(tc_dir, file_name):
+    with open(file_name_with_path(tc_dir, file_name), 'r', newline='') as csv_file:
+        yield tuple(column.strip() for column in next(csv.reader([csv_file.readline()]), [])), csv_file
+
+
+def _load_fixture(driver, connection, tc_dir, fixture):
+    cursor = connection.cursor()
+    try:
+        for statement in fixture.sql:
+            cursor.execute(statement)
+        if fixture.truncate:
+            cursor.execute('TRUNCATE TABLE ' + fixture.table)
+    finally:
+        cursor.close()
+    if fixture.file_name:
+        with open_csv(tc_dir, fixture.file_name) as (columns, csv_file):
+            if columns:
+                driver.bulk_load_csv(connection, fixture.table, columns, csv_file)
+    elif fixture.rows:
+        driver.bulk_load_rows(connection, fixture.table, fixture.columns, fixture.rows)
+
+
+# Loads the fixtures of a test case, those of a database in one transaction, databases in the order they are first
+# declared
+def load_fixtures(pools, tc_dir, fixtures):
+    for database in dict.fromkeys(fixture.database for fixture in fixtures):
+        with pools.transaction(database) as connection:
+            driver = database_driver(pools.databases[database]['type'])
+            for fixture in fixtures:
+                if fixture.database == database:
+                    _load_fixture(driver, connection, tc_dir, fixture)
@@ -4,8 +4,12 @@
 #  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
 #  that should have been included as part of this package.
 
+import io
+import uuid
+
 import psycopg2
 from psycopg2 import OperationalError, Error
+from psycopg2.pool import ThreadedConnectionPool
 
 
 def create_connection(db_name, db_user, db_password, db_host, db_port):
@@ -44,6 +48,80 @@ def execute_select_query(connection, query):
         print(f"The error '{e}' occurred")
     return cursor
 
+
+# Pool of connections to a PostgreSQL DSN (libpq connection string), connections are opened on demand and shared by
+# threads
+def create_pool(dsn, max_connections):
+    return ThreadedConnectionPool(0, max_connections, dsn)
+
+
+# Bulk loads csv rows (without header) from a file like object into table with COPY FROM STDIN, empty unquoted values
+# are NULL. Committed by the caller
+def bulk_load_csv(connection, table, columns, csv_file):
+    with connection.cursor() as cursor:
+        cursor.copy_expert('COPY ' + table + ' (' + ', '.join(columns) + ') FROM STDIN WITH (FORMAT csv)', csv_file)
+
+
+# Value in COPY text format, None is NULL (\N)
+def _copy_text_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+# Bulk loads rows (sequences of values, None is NULL) into table with COPY FROM STDIN. Committed by the caller
+def bulk_load_rows(connection, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_text_value(value) for value in row) + '\n')
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert('COPY ' + table + ' (' + ', '.join(columns) + ') FROM STDIN', buffer)
+
+
+def _where(where):
+    return ' WHERE ' + where if where else ''
+
+
+# md5 of the text form of the row of columns (NULL and empty text differ)
+def _row_md5(columns):
+    return 'md5(ROW(' + ', '.join(columns) + ')::text)'
+
+
+# Row count and order independent checksum of the rows of relation, computed in the database - the sum of the first
+# 64 bits of the md5 of every row
+def table_checksum(connection, relation, columns, where=''):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*), coalesce(sum(('x' || substr(" + _row_md5(columns) + ", 1, 16))::bit(64)"
+                       "::bigint::numeric), 0) FROM " + relation + _where(where))
+        count, checksum = cursor.fetchone()
+    return count, str(checksum)
+
+
+# Empty temporary table with the columns (and their types) of relation, returns its name
+def create_temp_table_like(connection, name, relation, columns):
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TEMPORARY TABLE ' + name + ' AS SELECT ' + ', '.join(columns) + ' FROM ' + relation +
+                       ' WITH NO DATA')
+    return name
+
+
+def drop_table(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS ' + name)
+
+
+# Rows of relation as (md5 bytes, row) ordered by md5, streamed with a named (server side) cursor in batches
+def stream_row_hashes(connection, relation, columns, where='', batch_size=10000):
+    with connection.cursor(name='row_hashes_' + uuid.uuid4().hex) as cursor:
+        cursor.itersize = batch_size
+        cursor.execute("SELECT decode(" + _row_md5(columns) + ", 'hex'), " + ', '.join(columns) + ' FROM ' +
+                       relation + _where(where) + ' ORDER BY 1')
+        while rows := cursor.fetchmany(batch_size):
+            for row in rows:
+                yield bytes(row[0]), tuple(row[1:])
+
+
 # Testing
 # connection = create_connection("postgres", "postgres", "postgres", "127.0.0.1", "5432")
 #
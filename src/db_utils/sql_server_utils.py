@@ -8,8 +8,15 @@
 Connects to a SQL database using pyodbc
 """
 
+import csv
+import queue
+from itertools import islice
+
 import pyodbc
 
+# rows sent per executemany call, fast_executemany binds all rows of a call as one parameter array
+BULK_BATCH_SIZE = 10000
+
 
 def create_connection(db_name, db_user, db_password, db_host):
     conn = pyodbc.connect('Driver={ODBC Driver 18 for SQL Server};'
@@ -40,6 +47,117 @@ def execute_select_query(connection, query):
         print(f"The error '{e}' occurred")
     return cursor
 
+
+# Pool of connections to a SQL Server ODBC connection string with the getconn / putconn / closeall interface of the
+# psycopg2 pools, connections are opened on demand and reused
+class ConnectionPool:
+    def __init__(self, connection_string, max_connections):
+        self.connection_string = connection_string
+        self.max_connections = max_connections
+        self._idle = queue.LifoQueue()
+
+    def getconn(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return pyodbc.connect(self.connection_string, autocommit=False)
+
+    def putconn(self, conn, close=False):
+        if close or self._idle.qsize() >= self.max_connections:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def closeall(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def create_pool(connection_string, max_connections):
+    return ConnectionPool(connection_string, max_connections)
+
+
+# Bulk inserts rows (sequences of values, None is NULL) into table with fast_executemany, committed by the caller
+def bulk_load_rows(connection, table, columns, rows):
+    statement = 'INSERT INTO ' + table + ' (' + ', '.join(columns) + ') VALUES (' + ', '.join('?' * len(columns)) + ')'
+    cursor = connection.cursor()
+    try:
+        cursor.fast_executemany = True
+        rows = iter(rows)
+        while batch := list(islice(rows, BULK_BATCH_SIZE)):
+            cursor.executemany(statement, batch)
+    finally:
+        cursor.close()
+
+
+# Bulk inserts csv rows (without header) from a file like object into table, empty values are NULL. Committed by the
+# caller
+def bulk_load_csv(connection, table, columns, csv_file):
+    bulk_load_rows(connection, table, columns,
+                   ([value if value != '' else None for value in row] for row in csv.reader(csv_file)))
+
+
+def _where(where):
+    return ' WHERE ' + where if where else ''
+
+
+# md5 of the columns of a row as text separated by unit separators, NULL as \N
+def _row_md5(columns):
+    return "HASHBYTES('MD5', CONCAT(N''" + ''.join(", NCHAR(31), ISNULL(CONVERT(NVARCHAR(MAX), " + column + "), N'\\N')"
+                                                  for column in columns) + '))'
+
+
+# Row count and order independent checksum of the rows of relation, computed in the database - the sum of the first
+# 64 bits of the md5 of every row
+def table_checksum(connection, relation, columns, where=''):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT COUNT_BIG(*), ISNULL(SUM(CAST(CAST(CAST(' + _row_md5(columns) +
+                       ' AS BINARY(8)) AS BIGINT) AS DECIMAL(38, 0))), 0) FROM ' + relation + _where(where))
+        count, checksum = cursor.fetchone()
+    finally:
+        cursor.close()
+    return count, str(checksum)
+
+
+# Empty temporary table with the columns (and their types, without identity) of relation, returns its name
+def create_temp_table_like(connection, name, relation, columns):
+    name = '#' + name
+    select_list = ', '.join(columns)
+    cursor = connection.cursor()
+    try:
+        # the union drops the identity property of columns
+        cursor.execute('SELECT ' + select_list + ' INTO ' + name + ' FROM ' + relation +
+                       ' WHERE 1 = 0 UNION ALL SELECT ' + select_list + ' FROM ' + relation + ' WHERE 1 = 0')
+    finally:
+        cursor.close()
+    return name
+
+
+def drop_table(connection, name):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('DROP TABLE IF EXISTS ' + name)
+    finally:
+        cursor.close()
+
+
+# Rows of relation as (md5 bytes, row) ordered by md5, streamed from a forward only cursor in batches
+def stream_row_hashes(connection, relation, columns, where='', batch_size=10000):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT ' + _row_md5(columns) + ', ' + ', '.join(columns) + ' FROM ' + relation + _where(where) +
+                       ' ORDER BY 1')
+        while rows := cursor.fetchmany(batch_size):
+            for row in rows:
+                yield bytes(row[0]), tuple(row[1:])
+    finally:
+        cursor.close()
+
+
 # Testing
 # create_users_table = """
 # if not exists (select * from sysobjects where name='users' and xtype='U')
@@ -0,0 +1,1429 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This fake NiFi script is a lightweight in-process stand-in for NiFi and NiFi Registry, to measure and optimise the
+# overhead of the framework without booting a real node. It serves the REST endpoints this project uses through
+# nipyapi - process groups, processors, connections, controller services, ports, parameter contexts, templates,
+# registry clients, flow deployment and version changes - from an in-memory canvas, and the Registry endpoints from an
+# in-memory bucket with identity flows (input port -> output port) for every flow of flow_version_mapping.
+# Revisions, running components and enabled controller services are checked like NiFi does, so teardown ordering
+# mistakes fail here too. Latency can be injected per endpoint and state changes can be made to take time, so that the
+# readiness polling is exercised.
+# Starting a HandleHttpRequest processor starts a listener on its Listening Port. A test request is walked through the
+# connections of the canvas - UpdateAttribute, ReplaceText, ExtractText (with its buffer size and capture group length
+# limits) and RouteOnAttribute are emulated with a small subset of the NiFi expression language, every other processor
+# passes FlowFiles through - and HandleHttpResponse answers with the report JSON of the harness.
+# Run it next to the tests with NIFI_SCHEME=http, NIFI_HOSTNAME / NIFI_REGISTRY_HOSTNAME / NIFI_TEST_API_HOSTNAME
+# pointing to localhost and NIFI_PORT / NIFI_REGISTRY_PORT set to its port:
+#   py fake_nifi.py --port 8080 --latency "GET /processors/*=0.01" --transition-secs 0.2
+
+import argparse
+import collections
+import copy
+import email.parser
+import fnmatch
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, parse_qsl, quote_plus
+
+from jproperties import Properties
+
+NIFI_API = '/nifi-api'
+REGISTRY_API = '/nifi-registry-api'
+STATS_PATH = '/fake-nifi/stats'
+NIFI_VERSION = '1.23.2'
+DEFAULT_PORT = 8080
+TEST_PROPERTIES = '../config/test.properties'
+BUNDLE = {'group': 'org.apache.nifi', 'artifact': 'nifi-standard-nar', 'version': NIFI_VERSION}
+STANDARD = 'org.apache.nifi.processors.standard.'
+HANDLE_HTTP_REQUEST = STANDARD + 'HandleHttpRequest'
+HANDLE_HTTP_RESPONSE = STANDARD + 'HandleHttpResponse'
+UPDATE_ATTRIBUTE = 'org.apache.nifi.processors.attributes.UpdateAttribute'
+REPLACE_TEXT = STANDARD + 'ReplaceText'
+EXTRACT_TEXT = STANDARD + 'ExtractText'
+ROUTE_ON_ATTRIBUTE = STANDARD + 'RouteOnAttribute'
+# processor type -> (static relationships, properties that are not dynamic)
+PROCESSOR_TYPES = {
+    HANDLE_HTTP_REQUEST: (['success'], {'Listening Port', 'HTTP Context Map', 'Allowed Paths', 'Hostname',
+                                        'parameters-to-attributes', 'SSL Context Service',
+                                        'Default URL Character Set'}),
+    HANDLE_HTTP_RESPONSE: (['success', 'failure'], {'HTTP Context Map', 'HTTP Status Code',
+                                                    'Attributes to add to the HTTP Response (Regex)'}),
+    UPDATE_ATTRIBUTE: (['success'], {'Delete Attributes Expression', 'Store State', 'Stateful Variables Initial Value',
+                                     'canonical-value-lookup-cache-size'}),
+    REPLACE_TEXT: (['success', 'failure'], {'Regular Expression', 'Replacement Value', 'Character Set',
+                                            'Maximum Buffer Size', 'Replacement Strategy', 'Evaluation Mode',
+                                            'Line-by-Line Evaluation Mode'}),
+    EXTRACT_TEXT: (['matched', 'unmatched'], {'Character Set', 'Maximum Buffer Size', 'Maximum Capture Group Length',
+                                              'Enable Canonical Equivalence', 'Enable Case-insensitive Matching',
+                                              'Permit Whitespace and Comments in Pattern', 'Include Capture Group 0',
+                                              'Enable DOTALL Mode', 'Enable Literal Parsing of the Pattern',
+                                              'Enable Multiline Mode', 'Enable Unicode-aware Case Folding',
+                                              'Enable Unicode Predefined Character Classes', 'Enable Unix Lines Mode',
+                                              'extract-text-enable-repeating-capture-group',
+                                              'extract-text-enable-named-groups'}),
+    ROUTE_ON_ATTRIBUTE: (['unmatched'], {'Routing Strategy'}),
+    STANDARD + 'LogAttribute': (['success'], set()),
+    STANDARD + 'GenerateFlowFile': (['success'], set()),
+}
+CONTROLLER_TYPES = ['org.apache.nifi.http.StandardHttpContextMap', 'org.apache.nifi.ssl.StandardSSLContextService']
+RUNNING = 'RUNNING'
+STOPPED = 'STOPPED'
+ENABLED = 'ENABLED'
+DISABLED = 'DISABLED'
+PROCESS_GROUP = 'process_group'
+PROCESSOR = 'processor'
+CONNECTION = 'connection'
+CONTROLLER_SERVICE = 'controller_service'
+INPUT_PORT = 'input_port'
+OUTPUT_PORT = 'output_port'
+PORT_TYPES = {INPUT_PORT: 'INPUT_PORT', OUTPUT_PORT: 'OUTPUT_PORT'}
+CONNECTABLE_TYPES = {PROCESSOR: 'PROCESSOR', **PORT_TYPES}
+MAX_FLOW_STEPS = 100
+# ExtractText defaults of NiFi
+EXTRACT_TEXT_MAX_BUFFER_SIZE = '1 MB'
+EXTRACT_TEXT_MAX_CAPTURE_GROUP_LENGTH = 1024
+DATA_SIZE_PATTERN = re.compile(r'\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB|TB)?\s*', re.IGNORECASE)
+DATA_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+LISTENER_POLL_SECS = 0.05
+
+
+class FakeNifiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _new_id():
+    return str(uuid.uuid4())
+
+
+# --------------------------------- Expression Language --------------------------------- #
+# Subset of the NiFi expression language the harness uses - attribute references, nested expressions and a few
+# functions. Booleans are the strings 'true' / 'false' as in NiFi
+EXPRESSION_FUNCTIONS = {
+    'equals': lambda value, other: str(value == other).lower(),
+    'equalsIgnoreCase': lambda value, other: str((value or '').lower() == (other or '').lower()).lower(),
+    'and': lambda value, other: str(value == 'true' and other == 'true').lower(),
+    'or': lambda value, other: str(value == 'true' or other == 'true').lower(),
+    'not': lambda value: str(value != 'true').lower(),
+    'isEmpty': lambda value: str(value is None or value.strip() == '').lower(),
+    'isNull': lambda value: str(value is None).lower(),
+    'notNull': lambda value: str(value is not None).lower(),
+    'ifElse': lambda value, if_true, if_false: if_true if value == 'true' else if_false,
+    'contains': lambda value, other: str(other in (value or '')).lower(),
+    'startsWith': lambda value, other: str((value or '').startswith(other)).lower(),
+    'endsWith': lambda value, other: str((value or '').endswith(other)).lower(),
+    'toUpper': lambda value: (value or '').upper(),
+    'toLower': lambda value: (value or '').lower(),
+    'trim': lambda value: (value or '').strip(),
+    'length': lambda value: str(len(value or '')),
+    'escapeJson': lambda value: json.dumps(value or '')[1:-1],
+    'urlEncode': lambda value: quote_plus(value or ''),
+}
+
+
+class _Expression:
+    def __init__(self, text, attributes):
+        self.text = text
+        self.attributes = attributes
+        self.pos = 0
+
+    def _expect(self, token):
+        if not self.text.startswith(token, self.pos):
+            raise FakeNifiError(400, 'Invalid expression, expected {} at {}: {}'.format(token, self.pos, self.text))
+        self.pos += len(token)
+
+    def template(self):
+        parts = []
+        while self.pos < len(self.text):
+            if self.text.startswith('$${', self.pos):
+                parts.append('${')
+                self.pos += 3
+            elif self.text.startswith('${', self.pos):
+                parts.append(self.expression() or '')
+            else:
+                parts.append(self.text[self.pos])
+                self.pos += 1
+        return ''.join(parts)
+
+    def expression(self):
+        self._expect('${')
+        if self.text.startswith('${', self.pos):
+            value = self.expression()
+        else:
+            end = self.pos
+            while end < len(self.text) and self.text[end] not in ':}':
+                end += 1
+            value = self.attributes.get(self.text[self.pos:end].strip())
+            self.pos = end
+        while self.text.startswith(':', self.pos):
+            self.pos += 1
+            match = re.compile(r'\w+').match(self.text, self.pos)
+            if not match or match.group(0) not in EXPRESSION_FUNCTIONS:
+                raise FakeNifiError(400, 'Unsupported expression function at {}: {}'.format(self.pos, self.text))
+            self.pos = match.end()
+            value = EXPRESSION_FUNCTIONS[match.group(0)](value, *self.arguments())
+        self._expect('}')
+        return value
+
+    def arguments(self):
+        self._expect('(')
+        arguments = []
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in ' ,':
+                self.pos += 1
+            if self.text.startswith(')', self.pos):
+                self.pos += 1
+                return arguments
+            if self.pos >= len(self.text):
+                raise FakeNifiError(400, 'Unterminated function arguments: ' + self.text)
+            char = self.text[self.pos]
+            if char in '\'"':
+                arguments.append(self._string_literal(char))
+            elif self.text.startswith('${', self.pos):
+                arguments.append(self.expression())
+            else:
+                match = re.compile(r'-?\d+(\.\d+)?').match(self.text, self.pos)
+                if not match:
+                    raise FakeNifiError(400, 'Invalid function argument at {}: {}'.format(self.pos, self.text))
+                arguments.append(match.group(0))
+                self.pos = match.end()
+
+    def _string_literal(self, quote):
+        self.pos += 1
+        literal = []
+        while self.pos < len(self.text) and self.text[self.pos] != quote:
+            if self.text[self.pos] == '\\' and self.pos + 1 < len(self.text):
+                self.pos += 1
+            literal.append(self.text[self.pos])
+            self.pos += 1
+        self._expect(quote)
+        return ''.join(literal)
+
+
+# Bytes of a NiFi data size property, eg: '1 MB'
+def data_size(value):
+    match = DATA_SIZE_PATTERN.fullmatch(value)
+    if not match:
+        raise FakeNifiError(400, 'Invalid data size: ' + value)
+    return int(float(match.group(1)) * DATA_UNITS[(match.group(2) or 'B').upper()])
+
+
+def evaluate_expression(text, attributes):
+    if text is None or '${' not in text:
+        return text
+    return _Expression(text, attributes).template()
+
+
+# --------------------------------- Canvas --------------------------------- #
+# Identity flow stored in the fake Registry for every flow to test, spec keys are local to the spec
+def identity_flow_spec(flow_name):
+    return {'name': flow_name, 'parameter_context': flow_name + ' parameters', 'processors': [],
+            'controller_services': [], 'process_groups': [],
+            'input_ports': [{'key': 'input', 'name': 'input'}], 'output_ports': [{'key': 'output', 'name': 'output'}],
+            'connections': [{'source': 'input', 'destination': 'output', 'relationships': []}]}
+
+
+class FakeNifi:
+    def __init__(self, latency_rules=(), default_latency=0.0, transition_secs=0.0, test_api_bind='127.0.0.1'):
+        # (METHOD path pattern, secs) - first matching rule wins, eg: ('GET /processors/*', 0.01)
+        self.latency_rules = list(latency_rules)
+        self.default_latency = default_latency
+        # secs it takes a processor to start / stop or a controller service to be enabled / disabled
+        self.transition_secs = transition_secs
+        self.test_api_bind = test_api_bind
+        self.calls = collections.Counter()
+        self._lock = threading.RLock()
+        self._components = {}
+        self._registry_clients = {}
+        self._parameter_contexts = {}
+        self._buckets = {}
+        self._flows = {}
+        self._snippets = {}
+        self._templates = {}
+        self._requests = {}
+        self._listeners = {}
+        self.root_id = self._add(PROCESS_GROUP, None, name='NiFi Flow', comments='', vci=None, parameter_context=None)
+
+    # ----- registry seeding ----- #
+    def add_bucket(self, bucket_name):
+        with self._lock:
+            for bucket_id, bucket in self._buckets.items():
+                if bucket['name'] == bucket_name:
+                    return bucket_id
+            bucket_id = _new_id()
+            self._buckets[bucket_id] = {'identifier': bucket_id, 'name': bucket_name,
+                                        'createdTimestamp': int(time.time() * 1000)}
+            return bucket_id
+
+    # Stores versions 1..version_count of a flow, a spec per version or the identity flow
+    def add_flow(self, bucket_name, flow_name, version_count, spec_factory=identity_flow_spec):
+        bucket_id = self.add_bucket(bucket_name)
+        with self._lock:
+            flow_id = _new_id()
+            self._flows[flow_id] = {'identifier': flow_id, 'name': flow_name, 'bucket_id': bucket_id,
+                                    'versions': {version: spec_factory(flow_name)
+                                                 for version in range(1, version_count + 1)}}
+            return flow_id
+
+    # Seeds the bucket and flows to test from test.properties
+    def seed_from_properties(self, properties_file=TEST_PROPERTIES):
+        props = Properties()
+        with open(properties_file, 'rb') as prop_file:
+            props.load(prop_file)
+        bucket_name = props.get('test_bucket_name').data
+        for flow_name, version in json.loads(props.get('flow_version_mapping').data).items():
+            self.add_flow(bucket_name, flow_name, int(version))
+
+    # ----- components ----- #
+    def _add(self, kind, parent_id, **fields):
+        component_id = _new_id()
+        self._components[component_id] = {'id': component_id, 'kind': kind, 'parent': parent_id, 'version': 0,
+                                           **fields}
+        return component_id
+
+    def _get(self, component_id, kind=None):
+        if component_id == 'root':
+            component_id = self.root_id
+        component = self._components.get(component_id)
+        if component is None or (kind is not None and component['kind'] != kind):
+            raise FakeNifiError(404, 'Unable to find component with id \'{}\'.'.format(component_id))
+        return component
+
+    def _children(self, pg_id, kind=None):
+        return [component for component in self._components.values()
+                if component['parent'] == pg_id and (kind is None or component['kind'] == kind)]
+
+    def _descendant_group_ids(self, pg_id):
+        group_ids = [pg_id]
+        for group_id in group_ids:
+            group_ids += [child['id'] for child in self._children(group_id, PROCESS_GROUP)]
+        return group_ids
+
+    def _in_groups(self, group_ids, kind):
+        group_ids = set(group_ids)
+        return [component for component in self._components.values()
+                if component['kind'] == kind and component['parent'] in group_ids]
+
+    @staticmethod
+    def _check_revision(component, version):
+        if version is not None and int(version) != component['version']:
+            raise FakeNifiError(409, '{} is not the most up-to-date revision. This component appears to have been '
+                                     'modified'.format(component['version']))
+
+    def _bump(self, component):
+        component['version'] += 1
+
+    def _state(self, component):
+        if time.time() < component.get('state_at', 0):
+            return component['previous_state']
+        return component['state']
+
+    def _set_state(self, component, state):
+        if component['state'] == state:
+            return
+        component['previous_state'] = self._state(component)
+        component['state'] = state
+        # ports change state immediately
+        transition_secs = self.transition_secs if component['kind'] in (PROCESSOR, CONTROLLER_SERVICE) else 0
+        component['state_at'] = time.time() + transition_secs
+        self._bump(component)
+        if component['kind'] == PROCESSOR and component['type'] == HANDLE_HTTP_REQUEST:
+            if state != RUNNING:
+                self._stop_listener(component['id'])
+            elif transition_secs:
+                threading.Timer(transition_secs, self._start_listener_when_running, (component['id'],)).start()
+            else:
+                self._start_listener(component)
+
+    def _relationships(self, processor):
+        static, standard = PROCESSOR_TYPES.get(processor['type'], (['success'], set()))
+        if processor['type'] == ROUTE_ON_ATTRIBUTE:
+            return static + [name for name in processor['properties'] if name not in standard]
+        return static
+
+    # ----- entities ----- #
+    @staticmethod
+    def _revision(component):
+        return {'version': component['version']}
+
+    def _pg_entity(self, pg):
+        processors = self._in_groups(self._descendant_group_ids(pg['id']), PROCESSOR)
+        running = sum(1 for processor in processors if self._state(processor) == RUNNING)
+        context = self._parameter_contexts.get(pg['parameter_context'])
+        vci = None
+        if pg['vci'] is not None:
+            vci = {**pg['vci'], 'groupId': pg['id']}
+        return {'id': pg['id'], 'revision': self._revision(pg), 'runningCount': running,
+                'stoppedCount': len(processors) - running,
+                'component': {'id': pg['id'], 'name': pg['name'], 'parentGroupId': pg['parent'],
+                              'comments': pg['comments'], 'versionControlInformation': vci,
+                              'parameterContext': {'id': context['id'], 'component': {
+                                  'id': context['id'], 'name': context['name']}} if context else None,
+                              'runningCount': running, 'stoppedCount': len(processors) - running},
+                'status': self._pg_status(pg)}
+
+    def _pg_status(self, pg):
+        group_ids = self._descendant_group_ids(pg['id'])
+        active_threads = sum(1 for processor in self._in_groups(group_ids, PROCESSOR)
+                             if processor['state'] == STOPPED and self._state(processor) == RUNNING)
+        return {'id': pg['id'], 'name': pg['name'],
+                'aggregateSnapshot': {'id': pg['id'], 'name': pg['name'], 'activeThreadCount': active_threads,
+                                      'flowFilesQueued': 0, 'queued': '0 (0 bytes)'}}
+
+    def _processor_entity(self, processor):
+        state = self._state(processor)
+        _, standard = PROCESSOR_TYPES.get(processor['type'], (['success'], set()))
+        descriptors = {name: {'name': name, 'displayName': name, 'sensitive': False, 'dynamic': name not in standard,
+                              'identifiesControllerService': name == 'HTTP Context Map' or None}
+                       for name in processor['properties']}
+        return {'id': processor['id'], 'revision': self._revision(processor),
+                'component': {'id': processor['id'], 'name': processor['name'], 'type': processor['type'],
+                              'bundle': BUNDLE, 'parentGroupId': processor['parent'], 'state': state,
+                              'validationStatus': 'VALID', 'position': processor['position'],
+                              'relationships': [{'name': name, 'autoTerminate': name in processor['auto_terminated']}
+                                                for name in self._relationships(processor)],
+                              'config': {'properties': dict(processor['properties']), 'descriptors': descriptors,
+                                         'autoTerminatedRelationships': sorted(processor['auto_terminated'])}},
+                'status': {'id': processor['id'], 'name': processor['name'], 'groupId': processor['parent'],
+                           'runStatus': state.capitalize(),
+                           'aggregateSnapshot': {'id': processor['id'], 'name': processor['name'],
+                                                 'activeThreadCount': 1 if state != processor['state'] else 0}}}
+
+    def _connectable(self, component):
+        return {'id': component['id'], 'groupId': component['parent'], 'name': component['name'],
+                'type': CONNECTABLE_TYPES[component['kind']], 'running': self._state(component) == RUNNING}
+
+    def _connection_entity(self, connection):
+        source = self._components[connection['source']]
+        destination = self._components[connection['destination']]
+        return {'id': connection['id'], 'revision': self._revision(connection), 'sourceId': source['id'],
+                'sourceGroupId': source['parent'], 'sourceType': CONNECTABLE_TYPES[source['kind']],
+                'destinationId': destination['id'], 'destinationGroupId': destination['parent'],
+                'destinationType': CONNECTABLE_TYPES[destination['kind']],
+                'component': {'id': connection['id'], 'parentGroupId': connection['parent'],
+                              'name': connection['name'], 'source': self._connectable(source),
+                              'destination': self._connectable(destination),
+                              'selectedRelationships': connection['relationships']},
+                'status': {'id': connection['id'], 'groupId': connection['parent'],
+                           'aggregateSnapshot': {'id': connection['id'], 'flowFilesQueued': 0}}}
+
+    def _port_entity(self, port):
+        return {'id': port['id'], 'revision': self._revision(port), 'portType': PORT_TYPES[port['kind']],
+                'component': {'id': port['id'], 'name': port['name'], 'parentGroupId': port['parent'],
+                              'state': self._state(port), 'type': PORT_TYPES[port['kind']],
+                              'position': port['position']},
+                'status': {'id': port['id'], 'name': port['name'], 'groupId': port['parent'],
+                           'runStatus': self._state(port).capitalize()}}
+
+    def _controller_entity(self, controller):
+        referencing = [component for component in self._components.values()
+                       if component['kind'] in (PROCESSOR, CONTROLLER_SERVICE) and
+                       controller['id'] in component.get('properties', {}).values()]
+        return {'id': controller['id'], 'revision': self._revision(controller), 'parentGroupId': controller['parent'],
+                'component': {'id': controller['id'], 'name': controller['name'], 'type': controller['type'],
+                              'bundle': BUNDLE, 'parentGroupId': controller['parent'],
+                              'state': self._state(controller), 'validationStatus': 'VALID',
+                              'properties': dict(controller['properties']), 'descriptors': {},
+                              'referencingComponents': [
+                                  {'id': component['id'], 'component': {
+                                      'id': component['id'], 'name': component['name'],
+                                      'referenceType': 'Processor' if component['kind'] == PROCESSOR
+                                      else 'ControllerService'}} for component in referencing]}}
+
+    def _parameter_context_entity(self, context):
+        bound = [pg for pg in self._components.values()
+                 if pg['kind'] == PROCESS_GROUP and pg['parameter_context'] == context['id']]
+        return {'id': context['id'], 'revision': {'version': context['version']},
+                'component': {'id': context['id'], 'name': context['name'], 'parameters': [],
+                              'boundProcessGroups': [{'id': pg['id'], 'component': {'id': pg['id'], 'name': pg['name']}}
+                                                     for pg in bound]}}
+
+    @staticmethod
+    def _registry_client_entity(client):
+        return {'id': client['id'], 'revision': {'version': client['version']},
+                'component': {'id': client['id'], 'name': client['name'], 'description': client['description'],
+                              'uri': client['url'], 'type': client['type'], 'properties': {'url': client['url']}}}
+
+    def _flow_entity(self, pg_id):
+        return {'processGroups': [self._pg_entity(pg) for pg in self._children(pg_id, PROCESS_GROUP)],
+                'processors': [self._processor_entity(processor) for processor in self._children(pg_id, PROCESSOR)],
+                'connections': [self._connection_entity(connection)
+                                for connection in self._children(pg_id, CONNECTION)],
+                'inputPorts': [self._port_entity(port) for port in self._children(pg_id, INPUT_PORT)],
+                'outputPorts': [self._port_entity(port) for port in self._children(pg_id, OUTPUT_PORT)]}
+
+    # ----- flow specs (registry versions and templates) ----- #
+    def _instantiate(self, spec, parent_id, position, vci=None):
+        pg_id = self._add(PROCESS_GROUP, parent_id, name=spec['name'], comments='', position=position, vci=vci,
+                          parameter_context=self._parameter_context_named(spec.get('parameter_context')))
+        self._instantiate_contents(spec, pg_id)
+        return pg_id
+
+    def _instantiate_contents(self, spec, pg_id):
+        ids = {}
+        for item in spec['controller_services']:
+            ids[item['key']] = self._add(CONTROLLER_SERVICE, pg_id, name=item['name'], type=item['type'],
+                                         properties=dict(item['properties']), state=DISABLED)
+        for item in spec['processors']:
+            ids[item['key']] = self._add(PROCESSOR, pg_id, name=item['name'], type=item['type'], state=STOPPED,
+                                         properties={key: ids.get(value, value)
+                                                     for key, value in item['properties'].items()},
+                                         auto_terminated=set(item['auto_terminated']), position=item['position'])
+        for kind in (INPUT_PORT, OUTPUT_PORT):
+            for item in spec[kind + 's']:
+                ids[item['key']] = self._add(kind, pg_id, name=item['name'], state=STOPPED,
+                                             position=item.get('position', {'x': 0.0, 'y': 0.0}))
+        for item in spec['process_groups']:
+            ids[item['key']] = self._instantiate(item, pg_id, item.get('position'))
+        for item in spec['connections']:
+            self._add(CONNECTION, pg_id, name='', source=ids[item['source']], destination=ids[item['destination']],
+                      relationships=list(item['relationships']))
+
+    def _export(self, pg_id):
+        pg = self._get(pg_id, PROCESS_GROUP)
+        context = self._parameter_contexts.get(pg['parameter_context'])
+        return {'key': pg['id'], 'name': pg['name'], 'position': pg.get('position'),
+                'parameter_context': context['name'] if context else None,
+                'controller_services': [{'key': cs['id'], 'name': cs['name'], 'type': cs['type'],
+                                         'properties': dict(cs['properties'])}
+                                        for cs in self._children(pg_id, CONTROLLER_SERVICE)],
+                'processors': [{'key': processor['id'], 'name': processor['name'], 'type': processor['type'],
+                                'properties': dict(processor['properties']),
+                                'auto_terminated': sorted(processor['auto_terminated']),
+                                'position': processor['position']} for processor in self._children(pg_id, PROCESSOR)],
+                'input_ports': [{'key': port['id'], 'name': port['name']}
+                                for port in self._children(pg_id, INPUT_PORT)],
+                'output_ports': [{'key': port['id'], 'name': port['name']}
+                                 for port in self._children(pg_id, OUTPUT_PORT)],
+                'process_groups': [self._export(child['id']) for child in self._children(pg_id, PROCESS_GROUP)],
+                'connections': [{'source': connection['source'], 'destination': connection['destination'],
+                                 'relationships': list(connection['relationships'])}
+                                for connection in self._children(pg_id, CONNECTION)]}
+
+    def _parameter_context_named(self, name):
+        if not name:
+            return None
+        for context in self._parameter_contexts.values():
+            if context['name'] == name:
+                return context['id']
+        context_id = _new_id()
+        self._parameter_contexts[context_id] = {'id': context_id, 'name': name, 'version': 0}
+        return context_id
+
+    def _flow_spec(self, flow_id, version):
+        flow = self._flows.get(flow_id)
+        if flow is None or int(version) not in flow['versions']:
+            raise FakeNifiError(404, 'Unable to find flow {} version {}'.format(flow_id, version))
+        return flow['versions'][int(version)]
+
+    def _remove_subtree(self, pg_id):
+        for group_id in self._descendant_group_ids(pg_id):
+            for component in self._children(group_id):
+                if component['kind'] == PROCESSOR:
+                    self._stop_listener(component['id'])
+                if component['kind'] != PROCESS_GROUP:
+                    del self._components[component['id']]
+            if group_id != pg_id:
+                del self._components[group_id]
+
+    # ----- checks NiFi does before deleting ----- #
+    def _verify_can_delete_group(self, pg_id):
+        group_ids = self._descendant_group_ids(pg_id)
+        for component in self._in_groups(group_ids, PROCESSOR) + self._in_groups(group_ids, INPUT_PORT) + \
+                self._in_groups(group_ids, OUTPUT_PORT):
+            if self._state(component) == RUNNING:
+                raise FakeNifiError(409, '{} is running'.format(component['name']))
+        for controller in self._in_groups(group_ids, CONTROLLER_SERVICE):
+            if self._state(controller) != DISABLED:
+                raise FakeNifiError(409, 'Controller Service {} is enabled'.format(controller['name']))
+        # connections of the group to components outside of it
+        inside = {component['id'] for component in self._components.values() if component['parent'] in group_ids}
+        for connection in self._components.values():
+            if connection['kind'] == CONNECTION and connection['parent'] not in group_ids and \
+                    (connection['source'] in inside or connection['destination'] in inside):
+                raise FakeNifiError(409, 'Process Group {} has incoming or outgoing connections'.format(pg_id))
+
+    def _verify_not_connected(self, component):
+        for connection in self._components.values():
+            if connection['kind'] == CONNECTION and component['id'] in (connection['source'],
+                                                                       connection['destination']):
+                raise FakeNifiError(409, '{} has incoming or outgoing connections'.format(component['name']))
+
+    # ----- test api listeners ----- #
+    def _start_listener(self, processor):
+        self._stop_listener(processor['id'])
+        port = int(processor['properties'].get('Listening Port') or 0)
+        try:
+            server = _Server((self.test_api_bind, port), _TestApiHandler)
+        except OSError as e:
+            print('Fake NiFi: unable to listen on port', port, e)
+            return
+        server.fake = self
+        server.processor_id = processor['id']
+        self._listeners[processor['id']] = server
+        threading.Thread(target=server.serve_forever, args=(LISTENER_POLL_SECS,), daemon=True,
+                         name='test-api-' + str(port)).start()
+
+    def _start_listener_when_running(self, processor_id):
+        with self._lock:
+            processor = self._components.get(processor_id)
+            if processor is not None and self._state(processor) == RUNNING and processor_id not in self._listeners:
+                self._start_listener(processor)
+
+    def _stop_listener(self, processor_id):
+        server = self._listeners.pop(processor_id, None)
+        # synchronous, so that the port is free when the next test case starts a HandleHttpRequest on it
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    # Walks a FlowFile received by a HandleHttpRequest processor through the canvas, returns the HTTP response.
+    # Processors that are still starting delay the response, as the FlowFile would wait in their queue
+    def run_flowfile(self, processor_id, method, path, query, content):
+        with self._lock:
+            status, headers, body, ready_at = self._walk(processor_id, method, path, query, content)
+        if ready_at > time.time():
+            time.sleep(ready_at - time.time())
+        return status, headers, body
+
+    def _walk(self, processor_id, method, path, query, content):
+        ready_at = 0
+        current = self._components.get(processor_id)
+        if current is None:
+            return 503, {}, b'HandleHttpRequest processor was removed', ready_at
+        allowed_path = current['properties'].get('Allowed Paths')
+        if allowed_path and not re.fullmatch(allowed_path, path):
+            return 404, {}, b'', ready_at
+        attributes = {'http.method': method, 'http.request.uri': path}
+        parameters = dict(parse_qsl(query, keep_blank_values=True))
+        attributes.update({'http.query.param.' + key: value for key, value in parameters.items()})
+        for name in (current['properties'].get('parameters-to-attributes') or '').split(','):
+            if name.strip() in parameters:
+                attributes[name.strip()] = parameters[name.strip()]
+        relationship = 'success'
+        for _ in range(MAX_FLOW_STEPS):
+            outgoing = [connection for connection in self._components.values()
+                        if connection['kind'] == CONNECTION and connection['source'] == current['id'] and
+                        (current['kind'] != PROCESSOR or relationship in connection['relationships'])]
+            if not outgoing:
+                return 500, {}, 'FlowFile routed to {} of {} was dropped'.format(
+                    relationship, current['name']).encode(), ready_at
+            current = self._components[outgoing[0]['destination']]
+            if current['state'] != RUNNING:
+                return 503, {}, '{} is not running'.format(current['name']).encode(), ready_at
+            ready_at = max(ready_at, current.get('state_at', 0))
+            if current['kind'] != PROCESSOR:
+                continue
+            if current['type'] == HANDLE_HTTP_RESPONSE:
+                _, standard = PROCESSOR_TYPES[HANDLE_HTTP_RESPONSE]
+                headers = {name: evaluate_expression(value, attributes)
+                           for name, value in current['properties'].items()
+                           if name not in standard and value is not None}
+                return int(current['properties'].get('HTTP Status Code') or 200), headers, content, ready_at
+            relationship, content = self._process(current, attributes, content)
+        return 500, {}, b'FlowFile did not reach HandleHttpResponse', ready_at
+
+    def _process(self, processor, attributes, content):
+        properties = processor['properties']
+        _, standard = PROCESSOR_TYPES.get(processor['type'], (['success'], set()))
+        dynamic = {name: value for name, value in properties.items() if name not in standard and value is not None}
+        if processor['type'] == UPDATE_ATTRIBUTE:
+            attributes.update({name: evaluate_expression(value, attributes) for name, value in dynamic.items()})
+        elif processor['type'] == REPLACE_TEXT:
+            replacement = evaluate_expression(properties.get('Replacement Value') or '', attributes)
+            content = replacement.encode('utf-8')
+        elif processor['type'] == EXTRACT_TEXT:
+            # Content beyond the buffer is not evaluated and captures are cut to the maximum length, like NiFi does
+            if len(content) > data_size(properties.get('Maximum Buffer Size') or EXTRACT_TEXT_MAX_BUFFER_SIZE):
+                return 'unmatched', content
+            max_capture_length = int(properties.get('Maximum Capture Group Length') or
+                                     EXTRACT_TEXT_MAX_CAPTURE_GROUP_LENGTH)
+            text = content.decode('utf-8', 'replace')
+            matched = False
+            for name, pattern in dynamic.items():
+                match = re.search(pattern, text)
+                if match:
+                    matched = True
+                    capture = match.group(1) if match.groups() else match.group(0)
+                    attributes[name] = capture[:max_capture_length]
+            return 'matched' if matched else 'unmatched', content
+        elif processor['type'] == ROUTE_ON_ATTRIBUTE:
+            route = next((name for name, value in dynamic.items()
+                          if evaluate_expression(value, attributes) == 'true'), 'unmatched')
+            attributes['RouteOnAttribute.Route'] = route
+            return route, content
+        return self._relationships(processor)[0], content
+
+    def shutdown(self):
+        with self._lock:
+            for processor_id in list(self._listeners):
+                self._stop_listener(processor_id)
+
+    # ----- REST dispatch ----- #
+    def handle(self, method, api, path, query, body):
+        for route_method, route_api, pattern, template, handler in ROUTES:
+            if route_method != method or route_api != api:
+                continue
+            match = pattern.fullmatch(path)
+            if match:
+                self.calls[method + ' ' + template] += 1
+                self._inject_latency(method + ' ' + template)
+                with self._lock:
+                    return handler(self, query, body, *match.groups())
+        raise FakeNifiError(404, 'Fake NiFi does not implement {} {}{}'.format(method, api, path))
+
+    def _inject_latency(self, operation):
+        secs = next((secs for pattern, secs in self.latency_rules if fnmatch.fnmatchcase(operation, pattern)),
+                    self.default_latency)
+        if secs:
+            time.sleep(secs)
+
+    def stats(self):
+        return {'calls': dict(self.calls.most_common()), 'total_calls': sum(self.calls.values()),
+                'components': len(self._components)}
+
+
+# --------------------------------- NiFi endpoints --------------------------------- #
+def _query_flag(query, name, default=False):
+    values = query.get(name)
+    return values[0].lower() == 'true' if values else default
+
+
+def _query_version(query):
+    values = query.get('version')
+    return values[0] if values else None
+
+
+def _body_version(body):
+    revision = (body or {}).get('revision') or (body or {}).get('processGroupRevision') or {}
+    return revision.get('version')
+
+
+def _position(component):
+    position = (component or {}).get('position') or {}
+    return {'x': float(position.get('x', 0)), 'y': float(position.get('y', 0))}
+
+
+def _access_token(fake, query, body):
+    return 201, 'fake-nifi-token-' + _new_id()
+
+
+def _system_diagnostics(fake, query, body):
+    return 200, {'systemDiagnostics': {'aggregateSnapshot': {'versionInfo': {'niFiVersion': NIFI_VERSION}}}}
+
+
+def _about(fake, query, body):
+    return 200, {'about': {'title': 'NiFi', 'version': NIFI_VERSION}}
+
+
+def _pg_status(fake, query, body, pg_id):
+    return 200, {'processGroupStatus': fake._pg_status(fake._get(pg_id, PROCESS_GROUP))}
+
+
+def _get_flow(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    return 200, {'processGroupFlow': {'id': pg['id'], 'parentGroupId': pg['parent'],
+                                      'flow': fake._flow_entity(pg['id'])}}
+
+
+def _schedule_components(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    state = body['state']
+    if body.get('components'):
+        components = []
+        for component_id, revision in body['components'].items():
+            component = fake._get(component_id)
+            fake._check_revision(component, (revision or {}).get('version'))
+            components.append(component)
+    else:
+        group_ids = fake._descendant_group_ids(pg['id'])
+        components = [component for component in fake._components.values()
+                      if component['parent'] in group_ids and component['kind'] in (PROCESSOR, INPUT_PORT, OUTPUT_PORT)]
+    for component in components:
+        fake._set_state(component, state)
+    return 200, {'id': pg['id'], 'state': state}
+
+
+def _get_process_group(fake, query, body, pg_id):
+    return 200, fake._pg_entity(fake._get(pg_id, PROCESS_GROUP))
+
+
+def _get_process_groups(fake, query, body, pg_id):
+    return 200, {'processGroups': [fake._pg_entity(pg) for pg in fake._children(fake._get(pg_id)['id'],
+                                                                                  PROCESS_GROUP)]}
+
+
+def _create_process_group(fake, query, body, parent_id):
+    parent = fake._get(parent_id, PROCESS_GROUP)
+    component = body.get('component') or {}
+    vci = component.get('versionControlInformation')
+    if vci:
+        spec = fake._flow_spec(vci['flowId'], vci['version'])
+        client = fake._registry_clients.get(vci['registryId'])
+        if client is None:
+            raise FakeNifiError(404, 'Unable to find registry client ' + str(vci['registryId']))
+        flow = fake._flows[vci['flowId']]
+        pg_id = fake._instantiate(spec, parent['id'], _position(component), vci={
+            'registryId': client['id'], 'registryName': client['name'], 'bucketId': vci['bucketId'],
+            'bucketName': fake._buckets[flow['bucket_id']]['name'], 'flowId': vci['flowId'],
+            'flowName': flow['name'], 'version': int(vci['version']), 'state': 'UP_TO_DATE'})
+    else:
+        pg_id = fake._add(PROCESS_GROUP, parent['id'], name=component.get('name') or 'New Process Group',
+                          comments=component.get('comments') or '', position=_position(component), vci=None,
+                          parameter_context=None)
+    return 201, fake._pg_entity(fake._components[pg_id])
+
+
+def _update_process_group(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    fake._check_revision(pg, _body_version(body))
+    component = body.get('component') or {}
+    for key, field in (('name', 'name'), ('comments', 'comments')):
+        if key in component:
+            pg[field] = component[key]
+    if 'parameterContext' in component:
+        pg['parameter_context'] = (component['parameterContext'] or {}).get('id')
+    fake._bump(pg)
+    return 200, fake._pg_entity(pg)
+
+
+def _remove_process_group(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    fake._check_revision(pg, _query_version(query))
+    fake._verify_can_delete_group(pg['id'])
+    entity = fake._pg_entity(pg)
+    fake._remove_subtree(pg['id'])
+    del fake._components[pg['id']]
+    return 200, entity
+
+
+def _get_processors(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    group_ids = fake._descendant_group_ids(pg['id']) if _query_flag(query, 'includeDescendantGroups') else [pg['id']]
+    return 200, {'processors': [fake._processor_entity(processor)
+                                for processor in fake._in_groups(group_ids, PROCESSOR)]}
+
+
+def _create_processor(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    component = body.get('component') or {}
+    config = component.get('config') or {}
+    processor_id = fake._add(PROCESSOR, pg['id'], name=component.get('name') or component['type'].split('.')[-1],
+                             type=component['type'], state=STOPPED,
+                             properties={key: value for key, value in (config.get('properties') or {}).items()
+                                         if value is not None},
+                             auto_terminated=set(config.get('autoTerminatedRelationships') or []),
+                             position=_position(component))
+    return 201, fake._processor_entity(fake._components[processor_id])
+
+
+def _get_processor(fake, query, body, processor_id):
+    return 200, fake._processor_entity(fake._get(processor_id, PROCESSOR))
+
+
+def _update_processor(fake, query, body, processor_id):
+    processor = fake._get(processor_id, PROCESSOR)
+    fake._check_revision(processor, _body_version(body))
+    component = body.get('component') or {}
+    config = component.get('config') or {}
+    if fake._state(processor) == RUNNING and (config or 'name' in component):
+        raise FakeNifiError(409, '{} is not in a valid state to be updated'.format(processor['name']))
+    if 'name' in component:
+        processor['name'] = component['name']
+    for key, value in (config.get('properties') or {}).items():
+        if value is None:
+            processor['properties'].pop(key, None)
+        else:
+            processor['properties'][key] = value
+    if config.get('autoTerminatedRelationships') is not None:
+        processor['auto_terminated'] = set(config['autoTerminatedRelationships'])
+    fake._bump(processor)
+    if component.get('state') in (RUNNING, STOPPED):
+        fake._set_state(processor, component['state'])
+    return 200, fake._processor_entity(processor)
+
+
+def _processor_run_status(fake, query, body, processor_id):
+    processor = fake._get(processor_id, PROCESSOR)
+    fake._check_revision(processor, _body_version(body))
+    fake._set_state(processor, body['state'])
+    return 200, fake._processor_entity(processor)
+
+
+def _delete_processor(fake, query, body, processor_id):
+    processor = fake._get(processor_id, PROCESSOR)
+    fake._check_revision(processor, _query_version(query))
+    if fake._state(processor) == RUNNING:
+        raise FakeNifiError(409, '{} is running'.format(processor['name']))
+    fake._verify_not_connected(processor)
+    entity = fake._processor_entity(processor)
+    del fake._components[processor['id']]
+    return 200, entity
+
+
+def _get_connections(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    return 200, {'connections': [fake._connection_entity(connection)
+                                 for connection in fake._children(pg['id'], CONNECTION)]}
+
+
+def _create_connection(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    component = body.get('component') or {}
+    source = fake._get(component['source']['id'])
+    destination = fake._get(component['destination']['id'])
+    relationships = component.get('selectedRelationships') or []
+    if source['kind'] == PROCESSOR:
+        unknown = [name for name in relationships if name not in fake._relationships(source)]
+        if unknown or not relationships:
+            raise FakeNifiError(400, 'Invalid relationships {} of {}'.format(relationships, source['name']))
+    connection_id = fake._add(CONNECTION, pg['id'], name=component.get('name') or '', source=source['id'],
+                              destination=destination['id'], relationships=list(relationships))
+    return 201, fake._connection_entity(fake._components[connection_id])
+
+
+def _delete_connection(fake, query, body, connection_id):
+    connection = fake._get(connection_id, CONNECTION)
+    fake._check_revision(connection, _query_version(query))
+    source = fake._components[connection['source']]
+    if fake._state(source) == RUNNING:
+        raise FakeNifiError(409, 'Source of connection {} is running'.format(connection_id))
+    entity = fake._connection_entity(connection)
+    del fake._components[connection['id']]
+    return 200, entity
+
+
+def _drop_request_entity(request_id):
+    return {'dropRequest': {'id': request_id, 'finished': True, 'percentCompleted': 100, 'droppedCount': 0,
+                            'current': '0 / 0 bytes', 'state': 'Completed successfully'}}
+
+
+def _create_empty_all(fake, query, body, pg_id):
+    fake._get(pg_id, PROCESS_GROUP)
+    return 202, _drop_request_entity(_new_id())
+
+
+def _drop_request(fake, query, body, owner_id, request_id):
+    return 200, _drop_request_entity(request_id)
+
+
+def _create_drop_request(fake, query, body, connection_id):
+    fake._get(connection_id, CONNECTION)
+    return 202, _drop_request_entity(_new_id())
+
+
+def _get_controller_services(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    group_ids = fake._descendant_group_ids(pg['id']) if _query_flag(query, 'includeDescendantGroups') else [pg['id']]
+    if _query_flag(query, 'includeAncestorGroups', True):
+        ancestor = pg['parent']
+        while ancestor is not None:
+            group_ids.append(ancestor)
+            ancestor = fake._components[ancestor]['parent']
+    return 200, {'controllerServices': [fake._controller_entity(controller)
+                                        for controller in fake._in_groups(group_ids, CONTROLLER_SERVICE)]}
+
+
+def _controller_services_of_controller(fake, query, body):
+    return 200, {'controllerServices': []}
+
+
+def _create_controller_service(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    component = body.get('component') or {}
+    controller_id = fake._add(CONTROLLER_SERVICE, pg['id'], name=component.get('name') or
+                              component['type'].split('.')[-1], type=component['type'],
+                              properties=dict(component.get('properties') or {}), state=DISABLED)
+    return 201, fake._controller_entity(fake._components[controller_id])
+
+
+def _get_controller_service(fake, query, body, controller_id):
+    return 200, fake._controller_entity(fake._get(controller_id, CONTROLLER_SERVICE))
+
+
+def _update_controller_service(fake, query, body, controller_id):
+    controller = fake._get(controller_id, CONTROLLER_SERVICE)
+    fake._check_revision(controller, _body_version(body))
+    component = body.get('component') or {}
+    if 'name' in component:
+        controller['name'] = component['name']
+    controller['properties'].update(component.get('properties') or {})
+    fake._bump(controller)
+    return 200, fake._controller_entity(controller)
+
+
+def _controller_service_run_status(fake, query, body, controller_id):
+    controller = fake._get(controller_id, CONTROLLER_SERVICE)
+    fake._check_revision(controller, _body_version(body))
+    if body['state'] == DISABLED:
+        running = [component['name'] for component in fake._components.values()
+                   if component['kind'] == PROCESSOR and controller['id'] in component['properties'].values() and
+                   fake._state(component) == RUNNING]
+        if running:
+            raise FakeNifiError(409, 'Controller Service {} is referenced by running processors {}'.format(
+                controller['name'], running))
+    fake._set_state(controller, body['state'])
+    return 200, fake._controller_entity(controller)
+
+
+def _remove_controller_service(fake, query, body, controller_id):
+    controller = fake._get(controller_id, CONTROLLER_SERVICE)
+    fake._check_revision(controller, _query_version(query))
+    if fake._state(controller) != DISABLED:
+        raise FakeNifiError(409, 'Controller Service {} is enabled'.format(controller['name']))
+    entity = fake._controller_entity(controller)
+    del fake._components[controller['id']]
+    return 200, entity
+
+
+def _port_routes(kind):
+    def _list(fake, query, body, pg_id):
+        pg = fake._get(pg_id, PROCESS_GROUP)
+        return 200, {kind.split('_')[0] + 'Ports': [fake._port_entity(port) for port in fake._children(pg['id'], kind)]}
+
+    def _create(fake, query, body, pg_id):
+        pg = fake._get(pg_id, PROCESS_GROUP)
+        component = body.get('component') or {}
+        port_id = fake._add(kind, pg['id'], name=component.get('name') or kind, state=STOPPED,
+                            position=_position(component))
+        return 201, fake._port_entity(fake._components[port_id])
+
+    def _get(fake, query, body, port_id):
+        return 200, fake._port_entity(fake._get(port_id, kind))
+
+    def _remove(fake, query, body, port_id):
+        port = fake._get(port_id, kind)
+        fake._check_revision(port, _query_version(query))
+        if fake._state(port) == RUNNING:
+            raise FakeNifiError(409, 'Port {} is running'.format(port['name']))
+        fake._verify_not_connected(port)
+        entity = fake._port_entity(port)
+        del fake._components[port['id']]
+        return 200, entity
+
+    def _run_status(fake, query, body, port_id):
+        port = fake._get(port_id, kind)
+        fake._check_revision(port, _body_version(body))
+        fake._set_state(port, body['state'])
+        return 200, fake._port_entity(port)
+
+    return _list, _create, _get, _remove, _run_status
+
+
+def _type_entity(type_name):
+    return {'type': type_name, 'bundle': BUNDLE, 'description': type_name.split('.')[-1], 'tags': []}
+
+
+def _processor_types(fake, query, body):
+    return 200, {'processorTypes': [_type_entity(type_name) for type_name in PROCESSOR_TYPES]}
+
+
+def _controller_service_types(fake, query, body):
+    return 200, {'controllerServiceTypes': [_type_entity(type_name) for type_name in CONTROLLER_TYPES]}
+
+
+def _get_parameter_contexts(fake, query, body):
+    return 200, {'parameterContexts': [fake._parameter_context_entity(context)
+                                       for context in fake._parameter_contexts.values()]}
+
+
+def _get_parameter_context(fake, query, body, context_id):
+    context = fake._parameter_contexts.get(context_id)
+    if context is None:
+        raise FakeNifiError(404, 'Unable to find parameter context ' + context_id)
+    return 200, fake._parameter_context_entity(context)
+
+
+def _delete_parameter_context(fake, query, body, context_id):
+    status, entity = _get_parameter_context(fake, query, body, context_id)
+    if entity['component']['boundProcessGroups']:
+        raise FakeNifiError(409, 'Parameter Context {} is bound to process groups'.format(context_id))
+    del fake._parameter_contexts[context_id]
+    return 200, entity
+
+
+def _get_registry_clients(fake, query, body):
+    return 200, {'registries': [fake._registry_client_entity(client) for client in fake._registry_clients.values()]}
+
+
+def _create_registry_client(fake, query, body):
+    component = body.get('component') or {}
+    client_id = _new_id()
+    fake._registry_clients[client_id] = {
+        'id': client_id, 'version': 1, 'name': component.get('name'), 'description': component.get('description'),
+        'type': component.get('type'), 'url': component.get('uri') or (component.get('properties') or {}).get('url')}
+    return 201, fake._registry_client_entity(fake._registry_clients[client_id])
+
+
+def _get_registry_client(fake, query, body, client_id):
+    if client_id not in fake._registry_clients:
+        raise FakeNifiError(404, 'Unable to find registry client ' + client_id)
+    return 200, fake._registry_client_entity(fake._registry_clients[client_id])
+
+
+def _delete_registry_client(fake, query, body, client_id):
+    status, entity = _get_registry_client(fake, query, body, client_id)
+    if any(component['kind'] == PROCESS_GROUP and (component['vci'] or {}).get('registryId') == client_id
+           for component in fake._components.values()):
+        raise FakeNifiError(409, 'Registry client {} is used by versioned process groups'.format(client_id))
+    del fake._registry_clients[client_id]
+    return 200, entity
+
+
+def _snapshot_metadata(flow, version):
+    return {'bucketIdentifier': flow['bucket_id'], 'flowIdentifier': flow['identifier'], 'version': version,
+            'timestamp': int(time.time() * 1000), 'author': 'fake-nifi', 'comments': ''}
+
+
+def _nifi_flow_versions(fake, query, body, registry_id, bucket_id, flow_id):
+    flow = fake._flows.get(flow_id)
+    if flow is None or flow['bucket_id'] != bucket_id:
+        raise FakeNifiError(404, 'Unable to find flow ' + flow_id)
+    return 200, {'versionedFlowSnapshotMetadataSet': [{'versionedFlowSnapshotMetadata': _snapshot_metadata(flow, v)}
+                                                      for v in sorted(flow['versions'], reverse=True)]}
+
+
+def _version_information(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    if pg['vci'] is None:
+        raise FakeNifiError(404, 'Process group {} is not under version control'.format(pg_id))
+    return 200, {'processGroupRevision': fake._revision(pg),
+                 'versionControlInformation': {**pg['vci'], 'groupId': pg['id']}}
+
+
+def _version_request_entity(fake, request):
+    pg = fake._components.get(request['processGroupId'])
+    return {'processGroupRevision': fake._revision(pg) if pg else None, 'request': dict(request)}
+
+
+def _change_version(fake, pg_id, body, revert):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    if pg['vci'] is None:
+        raise FakeNifiError(409, 'Process group {} is not under version control'.format(pg_id))
+    fake._check_revision(pg, _body_version(body))
+    version = pg['vci']['version'] if revert else int(body['versionControlInformation']['version'])
+    spec = fake._flow_spec(pg['vci']['flowId'], version)
+    fake._verify_can_delete_group(pg['id'])
+    fake._remove_subtree(pg['id'])
+    fake._instantiate_contents(spec, pg['id'])
+    pg['parameter_context'] = fake._parameter_context_named(spec.get('parameter_context'))
+    pg['vci'] = {**pg['vci'], 'version': version, 'state': 'UP_TO_DATE'}
+    fake._bump(pg)
+    request_id = _new_id()
+    fake._requests[request_id] = {'requestId': request_id, 'processGroupId': pg['id'], 'complete': True,
+                                  'failureReason': None, 'percentCompleted': 100, 'state': 'Complete'}
+    return 200, _version_request_entity(fake, fake._requests[request_id])
+
+
+def _initiate_update(fake, query, body, pg_id):
+    return _change_version(fake, pg_id, body, False)
+
+
+def _initiate_revert(fake, query, body, pg_id):
+    return _change_version(fake, pg_id, body, True)
+
+
+def _get_version_request(fake, query, body, request_id):
+    if request_id not in fake._requests:
+        raise FakeNifiError(404, 'Unable to find request ' + request_id)
+    return 200, _version_request_entity(fake, fake._requests[request_id])
+
+
+def _delete_version_request(fake, query, body, request_id):
+    status, entity = _get_version_request(fake, query, body, request_id)
+    del fake._requests[request_id]
+    return status, entity
+
+
+def _create_snippet(fake, query, body):
+    snippet = dict(body.get('snippet') or {})
+    snippet['id'] = _new_id()
+    fake._snippets[snippet['id']] = snippet
+    return 201, {'snippet': snippet}
+
+
+def _create_template(fake, query, body, pg_id):
+    snippet = fake._snippets.pop(body.get('snippetId'), None)
+    if snippet is None:
+        raise FakeNifiError(404, 'Unable to find snippet ' + str(body.get('snippetId')))
+    template_id = _new_id()
+    fake._templates[template_id] = {'id': template_id, 'name': body.get('name'), 'description': body.get('description'),
+                                    'groupId': pg_id, 'specs': [fake._export(group_id)
+                                                                for group_id in snippet.get('processGroups') or {}]}
+    return 201, {'template': {key: value for key, value in fake._templates[template_id].items() if key != 'specs'}}
+
+
+def _instantiate_template(fake, query, body, pg_id):
+    pg = fake._get(pg_id, PROCESS_GROUP)
+    template = fake._templates.get(body.get('templateId'))
+    if template is None:
+        raise FakeNifiError(404, 'Unable to find template ' + str(body.get('templateId')))
+    origin = {'x': float(body.get('originX') or 0), 'y': float(body.get('originY') or 0)}
+    created = [fake._instantiate(copy.deepcopy(spec), pg['id'], origin) for spec in template['specs']]
+    return 201, {'flow': {'processGroups': [fake._pg_entity(fake._components[group_id]) for group_id in created]}}
+
+
+def _remove_template(fake, query, body, template_id):
+    template = fake._templates.pop(template_id, None)
+    if template is None:
+        raise FakeNifiError(404, 'Unable to find template ' + template_id)
+    return 200, {'template': {key: value for key, value in template.items() if key != 'specs'}}
+
+
+# --------------------------------- Registry endpoints --------------------------------- #
+def _registry_buckets(fake, query, body):
+    return 200, list(fake._buckets.values())
+
+
+def _registry_flows(fake, query, body, bucket_id):
+    return 200, [{'identifier': flow['identifier'], 'name': flow['name'], 'bucketIdentifier': flow['bucket_id'],
+                  'bucketName': fake._buckets[flow['bucket_id']]['name'], 'versionCount': len(flow['versions']),
+                  'type': 'Flow'} for flow in fake._flows.values() if flow['bucket_id'] == bucket_id]
+
+
+def _registry_flow_versions(fake, query, body, bucket_id, flow_id):
+    flow = fake._flows.get(flow_id)
+    if flow is None or flow['bucket_id'] != bucket_id:
+        raise FakeNifiError(404, 'Unable to find flow ' + flow_id)
+    return 200, [_snapshot_metadata(flow, version) for version in sorted(flow['versions'], reverse=True)]
+
+
+def _route(method, api, template, handler):
+    pattern = re.compile('([^/]+)'.join(re.escape(part) for part in re.split(r'\{[\w-]+\}', template)))
+    return method, api, pattern, template, handler
+
+
+_input_ports = _port_routes(INPUT_PORT)
+_output_ports = _port_routes(OUTPUT_PORT)
+ROUTES = [
+    _route('POST', NIFI_API, '/access/token', _access_token),
+    _route('GET', NIFI_API, '/system-diagnostics', _system_diagnostics),
+    _route('GET', NIFI_API, '/flow/about', _about),
+    _route('GET', NIFI_API, '/flow/process-groups/{id}/status', _pg_status),
+    _route('GET', NIFI_API, '/flow/process-groups/{id}/controller-services', _get_controller_services),
+    _route('GET', NIFI_API, '/flow/process-groups/{id}', _get_flow),
+    _route('PUT', NIFI_API, '/flow/process-groups/{id}', _schedule_components),
+    _route('GET', NIFI_API, '/flow/controller/controller-services', _controller_services_of_controller),
+    _route('GET', NIFI_API, '/flow/processor-types', _processor_types),
+    _route('GET', NIFI_API, '/flow/controller-service-types', _controller_service_types),
+    _route('GET', NIFI_API, '/flow/parameter-contexts', _get_parameter_contexts),
+    _route('GET', NIFI_API, '/flow/registries/{registry-id}/buckets/{bucket-id}/flows/{flow-id}/versions',
+           _nifi_flow_versions),
+    _route('GET', NIFI_API, '/process-groups/{id}', _get_process_group),
+    _route('PUT', NIFI_API, '/process-groups/{id}', _update_process_group),
+    _route('DELETE', NIFI_API, '/process-groups/{id}', _remove_process_group),
+    _route('GET', NIFI_API, '/process-groups/{id}/process-groups', _get_process_groups),
+    _route('POST', NIFI_API, '/process-groups/{id}/process-groups', _create_process_group),
+    _route('GET', NIFI_API, '/process-groups/{id}/processors', _get_processors),
+    _route('POST', NIFI_API, '/process-groups/{id}/processors', _create_processor),
+    _route('GET', NIFI_API, '/process-groups/{id}/connections', _get_connections),
+    _route('POST', NIFI_API, '/process-groups/{id}/connections', _create_connection),
+    _route('POST', NIFI_API, '/process-groups/{id}/controller-services', _create_controller_service),
+    _route('GET', NIFI_API, '/process-groups/{id}/input-ports', _input_ports[0]),
+    _route('POST', NIFI_API, '/process-groups/{id}/input-ports', _input_ports[1]),
+    _route('GET', NIFI_API, '/process-groups/{id}/output-ports', _output_ports[0]),
+    _route('POST', NIFI_API, '/process-groups/{id}/output-ports', _output_ports[1]),
+    _route('POST', NIFI_API, '/process-groups/{id}/empty-all-connections-requests', _create_empty_all),
+    _route('GET', NIFI_API, '/process-groups/{id}/empty-all-connections-requests/{drop-request-id}', _drop_request),
+    _route('DELETE', NIFI_API, '/process-groups/{id}/empty-all-connections-requests/{drop-request-id}',
+           _drop_request),
+    _route('POST', NIFI_API, '/process-groups/{id}/templates', _create_template),
+    _route('POST', NIFI_API, '/process-groups/{id}/template-instance', _instantiate_template),
+    _route('GET', NIFI_API, '/processors/{id}', _get_processor),
+    _route('PUT', NIFI_API, '/processors/{id}', _update_processor),
+    _route('DELETE', NIFI_API, '/processors/{id}', _delete_processor),
+    _route('PUT', NIFI_API, '/processors/{id}/run-status', _processor_run_status),
+    _route('DELETE', NIFI_API, '/connections/{id}', _delete_connection),
+    _route('POST', NIFI_API, '/flowfile-queues/{id}/drop-requests', _create_drop_request),
+    _route('GET', NIFI_API, '/flowfile-queues/{id}/drop-requests/{drop-request-id}', _drop_request),
+    _route('DELETE', NIFI_API, '/flowfile-queues/{id}/drop-requests/{drop-request-id}', _drop_request),
+    _route('GET', NIFI_API, '/controller-services/{id}', _get_controller_service),
+    _route('PUT', NIFI_API, '/controller-services/{id}', _update_controller_service),
+    _route('DELETE', NIFI_API, '/controller-services/{id}', _remove_controller_service),
+    _route('PUT', NIFI_API, '/controller-services/{id}/run-status', _controller_service_run_status),
+    _route('GET', NIFI_API, '/input-ports/{id}', _input_ports[2]),
+    _route('DELETE', NIFI_API, '/input-ports/{id}', _input_ports[3]),
+    _route('PUT', NIFI_API, '/input-ports/{id}/run-status', _input_ports[4]),
+    _route('GET', NIFI_API, '/output-ports/{id}', _output_ports[2]),
+    _route('DELETE', NIFI_API, '/output-ports/{id}', _output_ports[3]),
+    _route('PUT', NIFI_API, '/output-ports/{id}/run-status', _output_ports[4]),
+    _route('GET', NIFI_API, '/parameter-contexts/{id}', _get_parameter_context),
+    _route('DELETE', NIFI_API, '/parameter-contexts/{id}', _delete_parameter_context),
+    _route('GET', NIFI_API, '/controller/registry-clients', _get_registry_clients),
+    _route('POST', NIFI_API, '/controller/registry-clients', _create_registry_client),
+    _route('GET', NIFI_API, '/controller/registry-clients/{id}', _get_registry_client),
+    _route('DELETE', NIFI_API, '/controller/registry-clients/{id}', _delete_registry_client),
+    _route('GET', NIFI_API, '/versions/process-groups/{id}', _version_information),
+    _route('POST', NIFI_API, '/versions/update-requests/process-groups/{id}', _initiate_update),
+    _route('GET', NIFI_API, '/versions/update-requests/{id}', _get_version_request),
+    _route('DELETE', NIFI_API, '/versions/update-requests/{id}', _delete_version_request),
+    _route('POST', NIFI_API, '/versions/revert-requests/process-groups/{id}', _initiate_revert),
+    _route('GET', NIFI_API, '/versions/revert-requests/{id}', _get_version_request),
+    _route('DELETE', NIFI_API, '/versions/revert-requests/{id}', _delete_version_request),
+    _route('POST', NIFI_API, '/snippets', _create_snippet),
+    _route('DELETE', NIFI_API, '/templates/{id}', _remove_template),
+    _route('GET', REGISTRY_API, '/buckets', _registry_buckets),
+    _route('GET', REGISTRY_API, '/buckets/{bucketId}/flows', _registry_flows),
+    _route('GET', REGISTRY_API, '/buckets/{bucketId}/flows/{flowId}/versions', _registry_flow_versions),
+]
+
+
+# --------------------------------- HTTP servers --------------------------------- #
+def _read_body(handler):
+    if handler.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int(handler.rfile.readline().split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                handler.rfile.readline()
+                return b''.join(chunks)
+            chunks.append(handler.rfile.read(size))
+            handler.rfile.readline()
+    length = int(handler.headers.get('Content-Length') or 0)
+    return handler.rfile.read(length) if length else b''
+
+
+def _send(handler, status, body, content_type, headers=None):
+    handler.send_response(status)
+    handler.send_header('Content-Type', content_type)
+    handler.send_header('Content-Length', str(len(body)))
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, without this keep-alive responses wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def _dispatch(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        raw_body = _read_body(self)
+        if url.path == STATS_PATH:
+            _send(self, 200, json.dumps(fake.stats()).encode(), 'application/json')
+            return
+        api = next((api for api in (NIFI_API, REGISTRY_API) if url.path.startswith(api + '/')), None)
+        try:
+            if api is None:
+                raise FakeNifiError(404, 'Unknown api ' + url.path)
+            body = json.loads(raw_body) if raw_body and 'json' in self.headers.get('Content-Type', '') else None
+            status, payload = fake.handle(self.command, api, url.path[len(api):], parse_qs(url.query), body)
+        except FakeNifiError as e:
+            _send(self, e.status, str(e).encode(), 'text/plain')
+            return
+        if isinstance(payload, str):
+            _send(self, status, payload.encode(), 'text/plain')
+        else:
+            _send(self, status, json.dumps(payload).encode(), 'application/json')
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+# Content of the first part of a multipart request, as HandleHttpRequest turns every part into a FlowFile
+def _multipart_content(content_type, body):
+    message = email.parser.BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    for part in message.walk():
+        if not part.is_multipart():
+            return part.get_payload(decode=True) or b''
+    return b''
+
+
+class _TestApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        content = _read_body(self)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            content = _multipart_content(content_type, content)
+        try:
+            status, headers, body = self.server.fake.run_flowfile(self.server.processor_id, self.command, url.path,
+                                                                  url.query, content)
+        except (FakeNifiError, re.error) as e:
+            status, headers, body = 500, {}, str(e).encode()
+        _send(self, status, body, 'text/plain; charset=utf-8', headers)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+# Starts the fake NiFi / Registry api server in a background thread, returns the server, fake state on server.fake
+def start_fake_nifi(fake, bind='127.0.0.1', port=DEFAULT_PORT):
+    server = _Server((bind, port), _ApiHandler)
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, daemon=True, name='fake-nifi').start()
+    return server
+
+
+def stop_fake_nifi(server):
+    server.shutdown()
+    server.server_close()
+    server.fake.shutdown()
+
+
+# Parses latency rules of the form "METHOD /path/pattern=secs", eg: "GET /processors/*=0.02"
+def parse_latency_rule(rule):
+    pattern, _, secs = rule.rpartition('=')
+    if not pattern or not secs:
+        raise argparse.ArgumentTypeError('latency rule must be "METHOD /path/pattern=secs": ' + rule)
+    return pattern.strip(), float(secs)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Fake NiFi and NiFi Registry for offline runs of the framework')
+    arg_parser.add_argument('--bind', default='127.0.0.1', help='address to serve the NiFi and Registry api on')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port of the NiFi and Registry api')
+    arg_parser.add_argument('--test-api-bind', default='127.0.0.1',
+                            help='address HandleHttpRequest listeners are bound to')
+    arg_parser.add_argument('--properties', default=TEST_PROPERTIES,
+                            help='test.properties the bucket and flows of the Registry are seeded from')
+    arg_parser.add_argument('--latency', type=parse_latency_rule, action='append', default=[],
+                            help='latency of matching endpoints, "METHOD /path/pattern=secs", may be repeated')
+    arg_parser.add_argument('--default-latency', type=float, default=0.0,
+                            help='latency of endpoints no --latency rule matches, in secs')
+    arg_parser.add_argument('--transition-secs', type=float, default=0.0,
+                            help='secs processors and controller services take to change state')
+    args = arg_parser.parse_args()
+
+    fake = FakeNifi(args.latency, args.default_latency, args.transition_secs, args.test_api_bind)
+    fake.seed_from_properties(args.properties)
+    server = start_fake_nifi(fake, args.bind, args.port)
+    print('Fake NiFi and Registry listening on', 'http://' + args.bind + ':' + str(args.port), 'with flows',
+          [flow['name'] for flow in fake._flows.values()])
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_fake_nifi(server)
+        print(json.dumps(fake.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,37 +19,84 @@
 #   Get input data & expected output attributes and data and generate nifi expression for assertions
 #   Create / Update processors with above data and attributes and recreate connections
 #   Run API Tests against test endpoint exposed by HandleHttpResponse processor and do assertions
+#   With reconcile_harness=true the harness is reconciled in place - only changed processor properties are pushed,
+#   connections stay wired and stale FlowFiles are dropped instead of rebuilding the harness for every test case
+#   With batch_test_cases=true all test cases of a flow are sent concurrently through one harness, input attributes and
+#   content travel in the HTTP request tagged with a test.id correlation attribute and are asserted on the client side
+#   With stream_input=true the input file is streamed as the HTTP request body instead of being set as a ReplaceText
+#   property, so processor configuration stays the same size no matter how big the payload is
+#   With compare_content=client the output content is returned by HandleHttpResponse and compared with the expected
+#   output file on the client as a stream, a bounded diff around the first difference is printed on a mismatch.
+#   Batched runs always compare on the client, also for the test cases that run one at a time
 # Teardown Phase:
-#   Disable all controller services recursively enabled for target test process group that is deployed
-#   Disable controller services enabled for HandleHttpRequest and HandleHttpResponse processors
-#   Stop target test process group and HandleHttpRequest & HandleHttpResponse processors
-#   Delete test process group and HandleHttpRequest & HandleHttpResponse processors
-#   Delete all controller services enabled for test process group
-#   Delete parameter context
-
+#   Delete only the components recorded in the resource ledger of the flow - the test container process group with
+#   everything in it (controller services are disabled level by level first) and the parameter contexts created by
+#   deploying the flow. Components of other users of the NiFi instance are never touched
+#   With deferred_teardown=true teardown runs in the background while the next flow is set up
+# With warm_pool=true test container process groups are kept deployed across runs, tagged with flow id and version.
+# A flow whose version is unchanged skips deployment and controller service enablement, a changed version is updated
+# in place. Process groups beyond warm_pool_max_count are evicted at the end of the run, least recently used first
+# Flows are independent of each other, with --parallel-flows N (or parallel_flows property) up to N flows run
+# concurrently, each in its own test container process group with its own HandleHttpRequest listening port taken from
+# nifi_test_api_ports. Per flow reports are merged and printed at the end of the run.
+# Flows tested one at a time are pipelined with --pipeline-depth N (or pipeline_depth property) - up to N next flows
+# are set up in the background while the test cases of the current flow run, and the current flow is torn down in the
+# background while the next flow is tested.
+# With report_dir set the results are also written as JUnit XML and JSON reports, with history_db set the per phase
+# durations of the run are recorded in a SQLite database and phases that got slower than their rolling baseline are
+# printed as regressions.
+# Flows run longest first by expected cost taken from history_db, with --shard i/N only the i-th of N shards balanced
+# by expected cost is run, so that several CI workers or NiFi instances can each run a slice of the suite.
+# With incremental_db set, test cases that passed before and whose files, harness and flow version are unchanged are
+# skipped, --force runs them all.
+
+import argparse
+from collections import deque
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from random import randrange
+from urllib.parse import parse_qsl, unquote_plus
 
 import dateutil.relativedelta
-import requests
-from jsonpath_ng import parse
 from config import Config as Env
 from jproperties import Properties
 import itertools
-from utils import git_clone, read_file_content, file_name_with_path, FileContentType, TestContext, extract_flow_name, \
-    run_subprocess, csv_to_list
+from utils import git_clone, git_sync, read_file_content, file_name_with_path, FileContentType, extract_flow_name, \
+    csv_to_list, csv_to_port_list, FlowContext, PortPool, HarnessState, iter_file_chunks, \
+    pooled_http_session
 from flow_utils import create_enable_ctx_map_controller, create_processors, create_run_input_port, \
     create_run_output_port, generate_attrib_assert_nifi_expression, add_registry_client, \
-    get_cs_referencing_components, disable_controller_services, enable_controller_services, update_sensitive_properties
-from nipyapi import config, security, versioning, canvas, templates, nifi, parameters
+    get_controller_service_levels, enable_controller_services, schedule_controller, \
+    get_controller_in_pg, list_parameter_context_ids, get_bound_parameter_contexts, CONTEXT_MAP_NAME, \
+    update_sensitive_properties, schedule_processors, schedule_process_group, render_processors, reconcile_harness, \
+    create_batched_processors, generate_batched_report, CORRELATION_ATTRIBUTE, lookup_cache, prefetch_component_types, \
+    PROCESSORS_CONFIG_JSON, PROCESSORS_BATCHED_CONFIG_JSON, PROCESSORS_CLIENT_COMPARE_CONFIG_JSON, \
+    configure_rest_pools, concurrent_calls
+from harness_templates import load_harness_spec
+from content_compare import compare_content, BLOCK_SIZE
+from readiness import Readiness, ReadinessTimeoutError
+from testcase_loader import TestPaths, TestCaseError, load_test_cases, EXPECTED_OUTPUT_DB_JSONPATH
+from resource_ledger import ResourceLedger, PARAMETER_CONTEXT
+from tracing import span, phase, enable_tracing, export_traces, FLOW, TEST_CASE, HOOK, HTTP as HTTP_SPAN
+from report_writers import write_reports
+from history_store import record_history
+from scheduler import CostModel, Shard, order_flows, shard_flows
+from incremental import TestSelectionCache, harness_fingerprint, select_test_cases, record_selection
+from hooks import HookRunner, BEFORE, AFTER
+from db_utils.assertions import assert_tables
+from db_utils.fixtures import DatabasePools, load_databases, load_fixtures
+from warm_pool import WarmPool, evict_process_group, reset_process_group, update_flow_version, new_tag
+from nipyapi import config, security, versioning, canvas, templates
+from nipyapi.nifi.rest import ApiException
 
 TEST_PROPERTIES = '../config/test.properties'
+DATABASES_JSON = '../config/databases.json'
 TEST_CASE_PREFIX = 'tc'
 TEST_CASE_FILE_EXTENSION = '.json'
-HTTPS = 'https://'
+HTTPS_SCHEME = 'https'
 HTTP = 'http://'
 NIFI = 'nifi'
 REGISTRY = 'registry'
@@ -62,13 +109,19 @@ MAIN_FLOW = 'integration-platform'
 
 # --------------------------------- Functions --------------------------------- #
 # Configure Nifi, Nifi Registry and test data
-def configure():
+def configure(properties_file=TEST_PROPERTIES):
     global config, test_bucket_name, test_data_dir, input_attribs_jsonpath, expected_out_attribs_jsonpath, \
-        input_file_name_jsonpath, expected_out_file_name_jsonpath, skip_test_dirs, skip_tests, nifi_test_api, \
-        test_api_port, registry_base_url, repo_base_dir, flow_version_dictionary, sensitive_props, include_only
+        input_file_name_jsonpath, expected_out_file_name_jsonpath, expected_out_db_jsonpath, skip_test_dirs, \
+        skip_tests, test_api_ports, registry_base_url, repo_base_dir, flow_version_dictionary, sensitive_props, \
+        include_only, parallel_flows, \
+        pipeline_depth, max_in_flight_requests, test_request_timeout, trace_dir, report_dir, history_db, \
+        regression_threshold_pct, regression_window, regression_min_secs, incremental_db, hook_timeout_secs, \
+        readiness_deadline, is_reconcile_harness, is_batch_test_cases, batch_concurrency, is_skip_invalid_flows, \
+        is_stream_input, is_client_compare, is_warm_pool, warm_pool_max_count, \
+        is_deferred_teardown
 
     # Read env vars from env loaded by AppConfig
-    config.nifi_config.host = HTTPS + Env.NIFI_HOSTNAME + ':' + str(Env.NIFI_PORT) + '/nifi-api'
+    config.nifi_config.host = Env.NIFI_SCHEME + '://' + Env.NIFI_HOSTNAME + ':' + str(Env.NIFI_PORT) + '/nifi-api'
     config.nifi_config.verify_ssl = Env.VERIFY_SSL
     config.nifi_config.cert_file = Env.NIFI_CERT_FILE
     config.nifi_config.key_file = Env.NIFI_KEY_FILE
@@ -76,12 +129,12 @@ def configure():
     config.registry_config.key_file = Env.NIFI_KEY_FILE
     config.nifi_config.username = Env.NIFI_USERNAME
     config.nifi_config.password = Env.NIFI_PASSWORD
-    registry_base_url = HTTPS + Env.NIFI_REGISTRY_HOSTNAME + ':' + str(Env.NIFI_REGISTRY_PORT)
+    registry_base_url = Env.NIFI_SCHEME + '://' + Env.NIFI_REGISTRY_HOSTNAME + ':' + str(Env.NIFI_REGISTRY_PORT)
     config.registry_config.host = registry_base_url + '/nifi-registry-api'
 
     # Read flow unit test properties from a properties file
     props = Properties()
-    with open(TEST_PROPERTIES, 'rb') as prop_file:
+    with open(properties_file, 'rb') as prop_file:
         props.load(prop_file)
     test_bucket_name = props.get("test_bucket_name").data
     repo_base_dir = props.get("repo_base_dir").data
@@ -90,43 +143,142 @@ def configure():
     expected_out_attribs_jsonpath = props.get("expected_output_attribs_jsonpath").data
     input_file_name_jsonpath = props.get("input_file_name_jsonpath").data
     expected_out_file_name_jsonpath = props.get("expected_output_file_name_jsonpath").data
+    expected_out_db_jsonpath_tuple = props.get('expected_output_db_jsonpath')
+    expected_out_db_jsonpath = expected_out_db_jsonpath_tuple.data if expected_out_db_jsonpath_tuple is not None \
+        else EXPECTED_OUTPUT_DB_JSONPATH
     skip_test_dirs = csv_to_list(props.get("skip_test_dirs").data)
     skip_tests = csv_to_list(props.get("skip_tests").data)
-    test_api_port = props.get('nifi_test_api_port').data
-    nifi_test_api = HTTP + NIFI + ':' + test_api_port + '/test'
+    # Pool of HandleHttpRequest listening ports, one per concurrently running flow
+    test_api_ports_tuple = props.get('nifi_test_api_ports')
+    if test_api_ports_tuple is not None and test_api_ports_tuple.data:
+        test_api_ports = csv_to_port_list(test_api_ports_tuple.data)
+    else:
+        test_api_ports = [props.get('nifi_test_api_port').data]
+    parallel_flows_tuple = props.get('parallel_flows')
+    parallel_flows = int(parallel_flows_tuple.data) if parallel_flows_tuple is not None else 1
+    # NiFi REST calls in flight at the same time, also the size of the keep-alive connection pools
+    max_in_flight_tuple = props.get('max_in_flight_requests')
+    max_in_flight_requests = int(max_in_flight_tuple.data) if max_in_flight_tuple is not None else 8
+    # Secs to wait for the flow under test to answer a test request
+    test_request_timeout_tuple = props.get('test_request_timeout_secs')
+    test_request_timeout = float(test_request_timeout_tuple.data) if test_request_timeout_tuple is not None else 60
+    # Directory the Chrome trace, OTLP trace and API latency histogram of the run are written to, empty disables tracing
+    trace_dir_tuple = props.get('trace_dir')
+    trace_dir = trace_dir_tuple.data if trace_dir_tuple is not None else ''
+    if trace_dir:
+        enable_tracing()
+    # Directory the JUnit XML and JSON reports of the run are written to, empty disables them
+    report_dir_tuple = props.get('report_dir')
+    report_dir = report_dir_tuple.data if report_dir_tuple is not None else ''
+    # SQLite database the durations of every run are recorded in, empty disables the history and regression check
+    history_db_tuple = props.get('history_db')
+    history_db = history_db_tuple.data if history_db_tuple is not None else ''
+    regression_threshold_tuple = props.get('regression_threshold_pct')
+    regression_threshold_pct = float(regression_threshold_tuple.data) if regression_threshold_tuple is not None else 25
+    regression_window_tuple = props.get('regression_window')
+    regression_window = int(regression_window_tuple.data) if regression_window_tuple is not None else 10
+    regression_min_secs_tuple = props.get('regression_min_secs')
+    regression_min_secs = float(regression_min_secs_tuple.data) if regression_min_secs_tuple is not None else 0.5
+    # SQLite database of test case digests and outcomes, if set unchanged test cases that passed before are skipped
+    incremental_db_tuple = props.get('incremental_db')
+    incremental_db = incremental_db_tuple.data if incremental_db_tuple is not None else ''
+    # Default secs a subprocess hook may run before its process group is terminated
+    hook_timeout_tuple = props.get('hook_timeout_secs')
+    hook_timeout_secs = float(hook_timeout_tuple.data) if hook_timeout_tuple is not None else 300
+    # Number of flows set up ahead of the flow that is being tested, 0 disables pipelining
+    pipeline_depth_tuple = props.get('pipeline_depth')
+    pipeline_depth = int(pipeline_depth_tuple.data) if pipeline_depth_tuple is not None else 0
+    # Maximum secs to wait for the harness to be live before failing with a readiness timeout
+    readiness_deadline_tuple = props.get('readiness_deadline_secs')
+    readiness_deadline = float(readiness_deadline_tuple.data) if readiness_deadline_tuple is not None else 60
+    reconcile_harness_tuple = props.get('reconcile_harness')
+    is_reconcile_harness = reconcile_harness_tuple is not None and reconcile_harness_tuple.data.lower() == 'true'
+    batch_test_cases_tuple = props.get('batch_test_cases')
+    is_batch_test_cases = batch_test_cases_tuple is not None and batch_test_cases_tuple.data.lower() == 'true'
+    batch_concurrency_tuple = props.get('batch_concurrency')
+    batch_concurrency = int(batch_concurrency_tuple.data) if batch_concurrency_tuple is not None else 8
+    stream_input_tuple = props.get('stream_input')
+    is_stream_input = stream_input_tuple is not None and stream_input_tuple.data.lower() == 'true'
+    # nifi: output content is compared inside NiFi with ExtractText, client: compared on the client as a stream.
+    # The batched harness returns the output content as the response body, so batched runs compare on the client
+    compare_content_tuple = props.get('compare_content')
+    compare_content_mode = compare_content_tuple.data if compare_content_tuple is not None else 'nifi'
+    if compare_content_mode not in ('nifi', 'client'):
+        raise ValueError('compare_content must be nifi or client, got: ' + compare_content_mode)
+    if is_batch_test_cases and compare_content_mode != 'client':
+        print('batch_test_cases=true compares output content on the client, compare_content=nifi is not used')
+    is_client_compare = compare_content_mode == 'client' or is_batch_test_cases
+    deferred_teardown_tuple = props.get('deferred_teardown')
+    is_deferred_teardown = deferred_teardown_tuple is not None and deferred_teardown_tuple.data.lower() == 'true'
+    warm_pool_tuple = props.get('warm_pool')
+    is_warm_pool = warm_pool_tuple is not None and warm_pool_tuple.data.lower() == 'true'
+    warm_pool_max_count_tuple = props.get('warm_pool_max_count')
+    warm_pool_max_count = int(warm_pool_max_count_tuple.data) if warm_pool_max_count_tuple is not None else 10
+    # abort: any invalid test case aborts the run, skip_flow: flows with invalid test cases are not tested
+    on_invalid_test_case_tuple = props.get('on_invalid_test_case')
+    is_skip_invalid_flows = on_invalid_test_case_tuple is not None and on_invalid_test_case_tuple.data == 'skip_flow'
     flow_version_mapping = props.get('flow_version_mapping').data
     flow_version_dictionary = json.loads(flow_version_mapping)
     include_only = csv_to_list(props.get("include_only").data)
 
+    # Compile harness specs up front, a broken spec fails the run before anything is deployed
+    load_harness_spec(PROCESSORS_CONFIG_JSON)
+    load_harness_spec(PROCESSORS_BATCHED_CONFIG_JSON)
+    load_harness_spec(PROCESSORS_CLIENT_COMPARE_CONFIG_JSON)
+
     # Import input and expected output data from an external repo if needed
     git_url_tuple = props.get("external_repo_git_url")
     if git_url_tuple is not None:
         git_url = git_url_tuple.data
-        git_clone(git_url, repo_base_dir)
+        # clone (default): fresh clone on every run, mirror: repo_base_dir is kept and updated with an incremental fetch
+        repo_sync_tuple = props.get('repo_sync')
+        if repo_sync_tuple is not None and repo_sync_tuple.data == 'mirror':
+            repo_ref_tuple = props.get('repo_ref')
+            repo_ref = repo_ref_tuple.data if repo_ref_tuple is not None else ''
+            repo_depth_tuple = props.get('repo_depth')
+            repo_depth = int(repo_depth_tuple.data) if repo_depth_tuple is not None and repo_depth_tuple.data else 0
+            repo_sparse_tuple = props.get('repo_sparse')
+            is_repo_sparse = repo_sparse_tuple is not None and repo_sparse_tuple.data.lower() == 'true'
+            commit = git_sync(git_url, repo_base_dir, repo_ref, repo_depth,
+                              test_data_sparse_paths() if is_repo_sparse else None)
+            print('Test data repo at commit:', commit)
+        else:
+            git_clone(git_url, repo_base_dir)
 
-    # Set ssl context and do service login for Nifi
-    security.set_service_ssl_context(NIFI, config.nifi_config.cert_file, config.nifi_config.key_file)
-    is_login_success = security.service_login(NIFI, config.nifi_config.username, config.nifi_config.password, True)
-    print('is_login_success: ', is_login_success)
+    # Set ssl context and do service login for Nifi, plain http (eg: fake_nifi.py) has no login
+    if Env.NIFI_SCHEME == HTTPS_SCHEME:
+        security.set_service_ssl_context(NIFI, config.nifi_config.cert_file, config.nifi_config.key_file)
+        is_login_success = security.service_login(NIFI, config.nifi_config.username, config.nifi_config.password,
+                                                  True)
+        print('is_login_success: ', is_login_success)
 
-    # Set ssl context and do service login for Nifi Registry
-    security.set_service_ssl_context(REGISTRY, config.registry_config.cert_file, config.registry_config.key_file)
+        # Set ssl context and do service login for Nifi Registry
+        security.set_service_ssl_context(REGISTRY, config.registry_config.cert_file, config.registry_config.key_file)
 
     with open("../config/sensitive_props.json", 'r') as json_file:
         sensitive_props = json.load(json_file)
 
+    # Keep-alive connections for concurrent NiFi and Registry calls
+    configure_rest_pools(max_in_flight_requests)
+
+    # Component type catalogs don't change during a run
+    prefetch_component_types()
+
+
+# Directories of the external test data repo needed by the run - test_data_dir, or only the include_only dirs in it
+# when include_only names no single test files
+def test_data_sparse_paths():
+    data_dir = test_data_dir.strip('/')
+    if include_only and not any(name.endswith('.json') for name in include_only):
+        return [data_dir + '/' + dir_name for dir_name in include_only]
+    return [data_dir]
 
-def setup_flow(flow_name):
-    global test_cases, teardown_duration, total_duration, parent_pg, parent_pg_id, context_map, deployed_pg, \
-        ref_comp_list, input_port, output_port, setup_duration
 
+def setup_flow(flow_ctx):
+    flow_name = flow_ctx.flow_name
     print('===== SetUp Phase:', flow_name, "======")
     print(' ')
 
-    # Declare Unit Test Case Stats
-    test_cases = {}
-    teardown_duration = 0
-    total_duration = 0
     setup_start_time = time.time()
 
     # Get target test flow from test bucket to be deployed for testing
@@ -140,19 +292,34 @@ def setup_flow(flow_name):
 
     if not flow_unit_test_version:
         raise Exception("Unable to find flow ", flow_name, " with version:", flow_unit_test_version)
+    flow_ctx.flow_id = flow_id
+    flow_ctx.flow_version = flow_unit_test_version
+
+    # Reuse the test container process group kept in the warm pool by a previous run
+    warm_entry = warm_pool.claim(flow_unit_test_pg) if is_warm_flow(flow_name) else None
+    if warm_entry is not None and setup_warm_flow(flow_ctx, *warm_entry):
+        flow_ctx.setup_duration = round(time.time() - setup_start_time, 2)
+        return
 
     location = (randrange(0, 4000), randrange(0, 4000))
     parent_pg = canvas.create_process_group(root_pg, flow_unit_test_pg, location)
     parent_pg_id = parent_pg.id
+    flow_ctx.ledger.add_process_group(parent_pg)
+    flow_ctx.parent_pg = parent_pg
+    flow_ctx.parent_pg_id = parent_pg_id
 
     # Create and Enable Context Map controller service
     # print('Creating and Enabling StandardHttpContextMap controller service...')
-    context_map = create_enable_ctx_map_controller(parent_pg)
+    flow_ctx.context_map = create_enable_ctx_map_controller(parent_pg, flow_ctx.readiness, flow_ctx.ledger)
 
     # Get PG from registry and Deploy in Nifi
     print('Getting target unit test process group from Registry and Deploying...')
-    deployed_pg = versioning.deploy_flow_version(
-        parent_pg_id, (500, 1000), bucket_id, flow_id, registry_id, flow_unit_test_version)
+    existing_parameter_context_ids = list_parameter_context_ids()
+    with phase(flow_ctx.phases, 'deploy', FLOW):
+        deployed_pg = versioning.deploy_flow_version(
+            parent_pg_id, (500, 1000), bucket_id, flow_id, registry_id, flow_unit_test_version)
+    flow_ctx.ledger.add_process_group(deployed_pg, parent_pg_id)
+    record_created_parameter_contexts(flow_ctx, deployed_pg.id, existing_parameter_context_ids)
 
     # In case of integration platform, as main flow can't be deployed because of multiple dependencies - Kafka
     # Kerberos, STS etc. we are extracting the child flow(Routing), deploying and running test cases
@@ -165,41 +332,117 @@ def setup_flow(flow_name):
                 raise Exception("Unable to find process group:", TEST_PG)
             template = templates.create_template(routing_pg.id, "routing", "routing template")
             template_id = template.template.id
+            flow_ctx.ledger.add_template(template_id, 'routing')
             templates.deploy_template(parent_pg_id, template_id, 500, 1000)
             templates.delete_template(template_id)
+            flow_ctx.ledger.remove(template_id)
             canvas.delete_process_group(deployed_pg, True, True)
+            flow_ctx.ledger.remove(deployed_pg.id)
             deployed_pg = routing_pg
         except Exception as e:
             print("Error errors when searching underneath process group:", e)
 
+    # Deployment created components in Parent PG that are not in the lookup cache yet
+    lookup_cache.invalidate(pg_id=parent_pg_id)
+
+    flow_ctx.deployed_pg = deployed_pg
+    enable_deployed_flow(flow_ctx, True)
+
+    flow_ctx.setup_duration = round(time.time() - setup_start_time, 2)
+    # End Flow Setup
+
+
+# Enables controller services and gets the ports of the deployed flow, sensitive properties are only updated on a
+# flow that was deployed or changed
+def enable_deployed_flow(flow_ctx, is_deployed):
+    flow_name = flow_ctx.flow_name
+    deployed_pg = flow_ctx.deployed_pg
+
     # Get all controller services within Parent PG
-    controller_service_list = canvas.list_all_controllers(parent_pg_id, True)
+    controller_service_list = canvas.list_all_controllers(flow_ctx.parent_pg_id, True)
 
-    # Get referencing components i.e. controller services referred by other cs
-    ref_comp_list = []
-    get_cs_referencing_components(controller_service_list, ref_comp_list)
+    # Sort controller services into dependency levels i.e. controller services referred by other cs come first
+    cs_levels = get_controller_service_levels(controller_service_list)
 
-    # Enable all controller services in specific order of reference
-    print('Enabling all controller services of target test process group in specific order of reference...')
-    enable_controller_services(ref_comp_list)
+    # Enable all controller services level by level, services of the same level concurrently
+    print('Enabling all controller services of target test process group in order of dependency...')
+    with phase(flow_ctx.phases, 'enable controller services', FLOW, levels=len(cs_levels)):
+        enable_controller_services(cs_levels, flow_ctx.readiness)
 
     # Get the input ports in the deployed flow
     print('Creating & Running input port...')
-    input_port = create_run_input_port(deployed_pg, flow_name)
+    flow_ctx.input_port = create_run_input_port(deployed_pg, flow_name, flow_ctx.ledger)
 
     # Get the output ports in the deployed flow
     print('Creating & Running output port...')
-    output_port = create_run_output_port(deployed_pg, flow_name)
+    flow_ctx.output_port = create_run_output_port(deployed_pg, flow_name, flow_ctx.ledger)
 
-    print('Updating sensitive properties...')
-    update_sensitive_properties(deployed_pg.id, sensitive_props)
+    if is_deployed:
+        print('Updating sensitive properties...')
+        with phase(flow_ctx.phases, 'update sensitive properties', FLOW):
+            update_sensitive_properties(deployed_pg.id, sensitive_props)
+
+
+# Records the parameter contexts that deploying or updating a flow created, contexts that existed before are shared
+# with other flows or users and are never deleted by the run
+def record_created_parameter_contexts(flow_ctx, deployed_pg_id, existing_parameter_context_ids):
+    for context_id, context_name in get_bound_parameter_contexts(deployed_pg_id):
+        if context_id not in existing_parameter_context_ids:
+            flow_ctx.ledger.add_parameter_context(context_id, context_name)
 
-    setup_duration = round(time.time() - setup_start_time, 2)
-    # End Flow Setup
 
+# The main flow is replaced by its Routing child flow after deployment and is never kept in the warm pool
+def is_warm_flow(flow_name):
+    return is_warm_pool and flow_name != MAIN_FLOW
 
-def teardown_flow(flow_name):
-    global teardown_duration
+
+# Sets up a flow from a test container process group taken from the warm pool. The deployed flow is moved to the
+# tested version in place when the version changed. A process group that can't be reused is evicted and False is
+# returned, so that the flow is deployed from scratch
+def setup_warm_flow(flow_ctx, parent_pg, tag):
+    flow_name = flow_ctx.flow_name
+    readiness = flow_ctx.readiness
+    # Parameter contexts created when the flow was deployed by a previous run stay with the pooled process group
+    for context_id in tag.parameter_context_ids:
+        flow_ctx.ledger.add_parameter_context(context_id)
+    try:
+        deployed_pg = canvas.get_process_group(tag.deployed_pg_id, 'id')
+        if tag.flow_id != flow_ctx.flow_id:
+            raise ValueError('flow id changed in registry')
+        is_updated = tag.version != flow_ctx.flow_version
+        if is_updated:
+            print('Updating warm flow:', flow_name, 'from version', tag.version, 'to', flow_ctx.flow_version, '...')
+            existing_parameter_context_ids = list_parameter_context_ids()
+            deployed_pg = update_flow_version(deployed_pg, flow_ctx.flow_version, readiness)
+            record_created_parameter_contexts(flow_ctx, deployed_pg.id, existing_parameter_context_ids)
+            lookup_cache.invalidate(pg_id=parent_pg.id)
+
+        flow_ctx.parent_pg = parent_pg
+        flow_ctx.parent_pg_id = parent_pg.id
+        flow_ctx.deployed_pg = deployed_pg
+        context_map = get_controller_in_pg(parent_pg.id, CONTEXT_MAP_NAME)
+        if context_map is None:
+            raise ValueError('controller service ' + CONTEXT_MAP_NAME + ' not found')
+        flow_ctx.context_map = schedule_controller(context_map, True, readiness)
+        enable_deployed_flow(flow_ctx, is_updated)
+    except (ValueError, ReadinessTimeoutError, ApiException) as e:
+        # ApiException - the deployed flow, its context map or the process group itself was deleted out of band
+        print('Unable to reuse warm flow:', flow_name, e)
+        tag.parameter_context_ids = flow_ctx.ledger.ids(PARAMETER_CONTEXT)
+        flow_ctx.ledger = ResourceLedger()
+        try:
+            evict_process_group(parent_pg, tag, readiness)
+        except ApiException as evict_error:
+            if evict_error.status != 404:
+                raise
+            print('Warm flow process group is already gone:', flow_name)
+        return False
+    print('Reusing Unit Test Container process group from warm pool:', parent_pg.component.name)
+    return True
+
+
+def teardown_flow(flow_ctx):
+    flow_name = flow_ctx.flow_name
     teardown_start_time = time.time()
 
     # TODO: Review cleanup / teardown as many test cases use same flow and improve performance
@@ -207,175 +450,404 @@ def teardown_flow(flow_name):
     print(' ')
     print('===== TearDown Phase:', flow_name, "======")
 
-    # Disable all controller services
-    print('Disabling all controller services in specific order of reference...')
-    disable_controller_services(ref_comp_list[::-1])
-
-    # Delete Parent PG
-    print('Deleting Test Container process group...')
-    pg_entity = nifi.apis.process_groups_api.ProcessGroupsApi().get_process_group(id=parent_pg_id)
-    canvas.delete_process_group(pg_entity, True, True)
-
-    # Delete Parameter Context
-    print('Deleting parameter context...')
-    parameter_context_list = parameters.list_all_parameter_contexts()
-    for parameter_context in parameter_context_list:
-        parameters.delete_parameter_context(parameter_context, True)
-
-    teardown_duration = round(time.time() - teardown_start_time, 2)
+    # Keep the deployed flow with its controller services enabled, only the harness is removed
+    if is_warm_flow(flow_name) and flow_ctx.deployed_pg is not None:
+        print('Returning Test Container process group to warm pool...')
+        reset_process_group(flow_ctx.parent_pg_id, flow_ctx.readiness)
+        warm_pool.release(flow_ctx.parent_pg, new_tag(flow_ctx.flow_id, flow_ctx.flow_version, flow_ctx.deployed_pg.id,
+                                                      flow_ctx.ledger.ids(PARAMETER_CONTEXT)))
+        flow_ctx.teardown_duration = round(time.time() - teardown_start_time, 2)
+        return
+
+    # Delete Test Container PG (controller services are disabled in reverse order of dependency first) and the
+    # parameter contexts created by deploying the flow
+    print('Deleting components created for the flow...')
+    with phase(flow_ctx.phases, 'delete components', FLOW):
+        flow_ctx.ledger.teardown(flow_ctx.readiness)
+
+    flow_ctx.teardown_duration = round(time.time() - teardown_start_time, 2)
     # End TearDown
 
 
-def setup_test_case(tc_dir, test_context):
+def setup_test_case(flow_ctx, test_case):
     print('=== SetUp Test Case ===')
+    tc_dir = test_case.tc_dir
+    test_context = test_case.context
 
     # Reading input file content
     input_content_text = ''
-    input_file_name = parse(input_file_name_jsonpath).find(test_context.json_data)[0].value
-    if input_file_name != '' and not test_context.is_binary_file:
+    input_file_name = test_case.input_file_name
+    if input_file_name != '' and not test_context.is_binary_file and not is_stream_input:
         input_content_text = read_file_content(file_name_with_path(tc_dir, input_file_name))
 
     processors_to_skip = []
-    if input_file_name == '' or test_context.is_skip_replace_text_in:
+    if input_file_name == '' or test_context.is_skip_replace_text_in or is_stream_input:
         processors_to_skip.append('replace_text_in_processor')
 
-    # Reading output file content
+    # Reading output file content, with client side comparison it is streamed from the file after the request
     expected_out_content_text = ''
-    exp_out_file_name = parse(expected_out_file_name_jsonpath).find(test_context.json_data)[0].value
-    if exp_out_file_name != '':
+    exp_out_file_name = test_case.expected_out_file_name
+    if exp_out_file_name != '' and not is_client_compare:
         expected_out_content_text = read_file_content(file_name_with_path(tc_dir, exp_out_file_name))
 
-    # Reading input and output attributes json
-    input_attribs = parse(input_attribs_jsonpath)
-    expected_output_attribs = parse(expected_out_attribs_jsonpath)
-
     # Generating Nifi expression to compare expected and actual output attributes
-    expected_out_attribs_json = expected_output_attribs.find(test_context.json_data)[0].value
-    report = generate_attrib_assert_nifi_expression(expected_out_attribs_json)
+    report = generate_attrib_assert_nifi_expression(test_case.expected_out_attribs)
 
     # TODO: Review if components need to be deleted instead of stopping and updating to avoid stale data from previous
     #  tests breaking subsequent tests
 
-    # Create all the processors required for flow unit testing
-    print('Creating / Updating all the processors required for flow unit testing...')
-    dict_processors = create_processors(test_api_port, context_map, input_attribs.find(test_context.json_data)[0].value,
-                                        input_content_text, expected_out_content_text, report, parent_pg,
-                                        processors_to_skip, test_context)
-
     connection_list = ['http_req_processor', 'in_mapper_processor', 'replace_text_in_processor', 'input_port',
                        'output_port', 'extract_content_processor', 'check_expected_equals_content_processor', 'replace_text_out_processor',
                        'http_resp_processor']
-    all_processors_dict = {**dict_processors, **{'input_port': eval('input_port'), 'output_port': eval('output_port')}}
+    spec_file = PROCESSORS_CLIENT_COMPARE_CONFIG_JSON if is_client_compare else PROCESSORS_CONFIG_JSON
+
+    if is_reconcile_harness:
+        print('Reconciling the processors required for flow unit testing...')
+        processor_specs = render_processors(flow_ctx.test_api_port, flow_ctx.context_map, test_case.input_attribs,
+                                            input_content_text, expected_out_content_text, report, processors_to_skip,
+                                            spec_file)
+        dict_processors = reconcile_harness(flow_ctx.parent_pg, flow_ctx.deployed_pg.id, processor_specs,
+                                            {'input_port': flow_ctx.input_port, 'output_port': flow_ctx.output_port},
+                                            connection_list, flow_ctx.harness, flow_ctx.readiness)
+        return dict_processors.values()
+
+    # Create all the processors required for flow unit testing
+    print('Creating / Updating all the processors required for flow unit testing...')
+    dict_processors = create_processors(flow_ctx.test_api_port, flow_ctx.context_map, test_case.input_attribs,
+                                        input_content_text, expected_out_content_text, report, flow_ctx.parent_pg,
+                                        processors_to_skip, test_context, flow_ctx.readiness, spec_file)
+
+    all_processors_dict = {**dict_processors, **{'input_port': flow_ctx.input_port, 'output_port': flow_ctx.output_port}}
     connection_list = [value for value in connection_list if value in all_processors_dict.keys()]
 
     # Wire up processors
     print('Creating connections between flow unit test processors...')
-    for from_con, to_con in itertools.pairwise(connection_list):
-        if from_con != 'input_port':
-            canvas.create_connection(all_processors_dict[from_con], all_processors_dict[to_con])
+    concurrent_calls(lambda pair: canvas.create_connection(all_processors_dict[pair[0]], all_processors_dict[pair[1]]),
+                     [pair for pair in itertools.pairwise(connection_list) if pair[0] != 'input_port'])
 
     # Schedule processors
     print('Starting all the processors...')
-    for processor in dict_processors.values():
-        #print ("scheduling "+ processor.component.name)
-        canvas.schedule_processor(processor, True, True)
+    schedule_processors(flow_ctx.parent_pg_id, list(dict_processors.values()), True, flow_ctx.readiness)
 
     # Schedule deployed process group
     print('Starting the target unit test process group...')
-    canvas.schedule_process_group(deployed_pg.id, True)
+    schedule_process_group(flow_ctx.deployed_pg.id, True, flow_ctx.readiness)
 
     return dict_processors.values()
 
 
-def teardown_test_case(processor_list):
+def teardown_test_case(flow_ctx, processor_list):
+    # Reconciled harness stays running and wired, the next test case only changes what differs
+    if is_reconcile_harness:
+        return
+    stop_and_unwire_harness(flow_ctx, processor_list)
+
+
+def stop_and_unwire_harness(flow_ctx, processor_list):
     # Stop all processors
     print('Stopping all processors...')
-    for processor in processor_list:
-        canvas.schedule_processor(processor, False, True)
+    schedule_processors(flow_ctx.parent_pg_id, list(processor_list), False, flow_ctx.readiness)
     # Stop target unit test process group
     print('Stopping target unit test process group...')
-    canvas.schedule_process_group(deployed_pg.id, False)
+    schedule_process_group(flow_ctx.deployed_pg.id, False, flow_ctx.readiness)
     # Delete all connections
     print('Deleting connections between flow unit test processors...')
-    for processor in processor_list:
-        component_connections = canvas.get_component_connections(processor)
-        for connection in component_connections:
-            canvas.delete_connection(connection)
+    component_connections = {connection.id: connection for connections in
+                             concurrent_calls(canvas.get_component_connections, processor_list)
+                             for connection in connections}
+    concurrent_calls(canvas.delete_connection, component_connections.values())
 
 
 # Runs for each test case defined in test data. Basically it -
 # sets input & expected output files to flow file, compares expected flow file with actual output file
 # generates nifi expression that asserts input & expected output flow file attributes
-def run_test_case(tc_dir, tc_file):
-    global test_suite_result
+def run_test_case(flow_ctx, test_case):
     start_time = time.time()
-    # Strip off TEST_CASE_FILE_EXTENSION from the test case file name
-    tc_name = tc_file[0:-len(TEST_CASE_FILE_EXTENSION)]
+    tc_name = test_case.name
+    tc_dir = test_case.tc_dir
 
     print(' ')
     print('===== BEGIN :: Test Case:', tc_name, "======")
-    # Parse test case json file
-    with open(file_name_with_path(tc_dir, tc_file), 'r') as json_file:
-        json_data = json.load(json_file)
 
+    processor_list = []
+    phases = flow_ctx.test_phases[tc_name] = {}
     try:
         # Setup Test Case
-        test_context = TestContext(json_data)
-        processor_list = setup_test_case(tc_dir, test_context)
-        run_subprocess(test_context.subprocess.before_command)
-
-        # Wait for everything to be started and stable
-        time.sleep(3)
+        test_context = test_case.context
+        # Before hooks and database fixtures run while the harness is set up, an error of the setup comes first.
+        # After hooks of the previous test case of the flow may still be running, the before hooks wait for them in
+        # the background and only the result of the after hooks is collected before the request
+        fixtures_future = fixture_executor.submit(load_test_case_fixtures, phases, test_case) \
+            if test_case.fixtures else None
+        previous_after_hooks = flow_ctx.after_hooks[1] if flow_ctx.after_hooks is not None else None
+        before_hooks = hook_runner.start(BEFORE, test_context.subprocess.before, after=previous_after_hooks)
+        try:
+            with phase(phases, 'setup', TEST_CASE, test_case=tc_name):
+                processor_list = setup_test_case(flow_ctx, test_case)
+        finally:
+            fixtures_error = fixtures_future.exception() if fixtures_future is not None else None
+            finish_after_hooks(flow_ctx)
+            # secs the test case waits for before hooks after the setup
+            with phase(phases, 'before hook', HOOK):
+                flow_ctx.test_hooks[tc_name] = before_hooks.wait()
+        if fixtures_error is not None:
+            raise fixtures_error
+        before_hooks.check()
+
+        # Wait for HandleHttpRequest to accept requests
+        with phase(phases, 'wait for port', TEST_CASE):
+            flow_ctx.readiness.port_listening(Env.NIFI_TEST_API_HOSTNAME, flow_ctx.test_api_port)
 
         # Test against the defined endpoint - verify flow output
         print(' ')
         print('Running Test Case:', tc_name)
 
-        input_file_name = parse(input_file_name_jsonpath).find(json_data)[0].value
-        if input_file_name != '' and test_context.is_binary_file:
-            input_file_content = read_file_content(file_name_with_path(tc_dir, input_file_name), FileContentType.BINARY)
-            resp = requests.post(url=nifi_test_api, files={'filename': input_file_content})
-        else:
-            resp = requests.get(nifi_test_api)
-
-        resp_json = json.loads(resp.text)
-        flow_attributes_match = resp_json['flow_attributes_match']
-        flow_content_match = 'match' if test_context.is_skip_check_out_content else resp_json['flow_content_match']
-        if flow_attributes_match == 'true' and flow_content_match == 'match':
+        input_file_name = test_case.input_file_name
+        with phase(phases, 'request', TEST_CASE):
+            input_stream = stream_input_content(test_case)
+            if input_stream is not None:
+                resp = send_test_request('POST', flow_ctx, data=input_stream, stream=is_client_compare)
+            elif input_file_name != '' and test_context.is_binary_file:
+                input_file_content = read_file_content(file_name_with_path(tc_dir, input_file_name),
+                                                       FileContentType.BINARY)
+                resp = send_test_request('POST', flow_ctx, files={'filename': input_file_content},
+                                         stream=is_client_compare)
+            else:
+                resp = send_test_request('GET', flow_ctx, stream=is_client_compare)
+
+            if is_client_compare:
+                is_passed = check_client_side(test_case, resp)
+            else:
+                resp_json = json.loads(resp.text)
+                flow_attributes_match = resp_json['flow_attributes_match']
+                flow_content_match = 'match' if test_context.is_skip_check_out_content \
+                    else resp_json['flow_content_match']
+                is_passed = flow_attributes_match == 'true' and flow_content_match == 'match'
+                if not is_passed:
+                    print('Entire Response:' + json.dumps(resp.text))
+        failure_message = 'flow output does not match expected output'
+        if is_passed and test_case.db_assertions:
+            # Row counts and checksums are compared in the database, rows are only streamed on a mismatch
+            with phase(phases, 'db assertions', TEST_CASE, tables=len(test_case.db_assertions)):
+                db_mismatches = assert_tables(database_pools, tc_dir, test_case.db_assertions)
+            for db_mismatch in db_mismatches:
+                print('Database table does not match:', db_mismatch)
+            if db_mismatches:
+                is_passed = False
+                failure_message = 'database tables do not match: ' + '; '.join(map(str, db_mismatches))
+        if is_passed:
             print('Test Case:', tc_name, PASSED)
             test_result = PASSED
         else:
             print('Test Case:', tc_name, FAILED)
-            print('Entire Response:' + json.dumps(resp.text))
             test_result = FAILED
-            test_suite_result = 'FAILURE'
-        run_subprocess(test_context.subprocess.after_command)
+            flow_ctx.test_result = 'FAILURE'
+            flow_ctx.test_messages[tc_name] = failure_message
+        # After hooks run in the background while the harness is torn down and the next test case is set up
+        if test_context.subprocess.after:
+            flow_ctx.after_hooks = (tc_name, hook_runner.start(AFTER, test_context.subprocess.after))
     except Exception as err:
         print('Test Case:', tc_name, FAILED)
         print('failed with exception: ', err)
         test_result = FAILED
-        test_suite_result = 'FAILURE'
+        flow_ctx.test_result = 'FAILURE'
+        flow_ctx.test_messages[tc_name] = 'failed with exception: ' + str(err)
 
     print(' ')
     print('=== TearDown Test Case ===')
     # TearDown Test Case
-    teardown_test_case(processor_list)
+    with phase(phases, 'teardown', TEST_CASE, test_case=tc_name):
+        teardown_test_case(flow_ctx, processor_list)
 
-    test_cases[tc_name] = [test_result, round(time.time() - start_time, 2)]
+    flow_ctx.test_cases[tc_name] = [test_result, round(time.time() - start_time, 2)]
     print('===== END :: Test Case:', tc_name, "======")
 
 
-def generate_flow_unit_test_report(flow_name):
-    global total_duration
+# Waits for the after hooks of the last test case of the flow, a failed hook fails the test case
+def finish_after_hooks(flow_ctx):
+    if flow_ctx.after_hooks is None:
+        return
+    tc_name, after_hooks = flow_ctx.after_hooks
+    flow_ctx.after_hooks = None
+    results = after_hooks.wait()
+    flow_ctx.test_hooks.setdefault(tc_name, []).extend(results)
+    flow_ctx.test_phases[tc_name]['after hook'] = max(result.secs for result in results)
+    failed = [result for result in results if not result.is_ok]
+    if failed and flow_ctx.test_cases[tc_name][0] == PASSED:
+        print('Test Case:', tc_name, FAILED, '-', '; '.join(map(str, failed)))
+        flow_ctx.test_cases[tc_name][0] = FAILED
+        flow_ctx.test_result = 'FAILURE'
+        flow_ctx.test_messages[tc_name] = 'failed with exception: ' + '; '.join(map(str, failed))
+
+
+def load_test_case_fixtures(phases, test_case):
+    with phase(phases, 'fixtures', TEST_CASE, test_case=test_case.name, fixtures=len(test_case.fixtures)):
+        load_fixtures(database_pools, test_case.tc_dir, test_case.fixtures)
+
+
+# Sends a test request to the HandleHttpRequest endpoint of the flow over the pooled session
+def send_test_request(method, flow_ctx, **kwargs):
+    with span('test request', HTTP_SPAN, method=method, url=flow_ctx.nifi_test_api):
+        return test_api_session.request(method, flow_ctx.nifi_test_api, timeout=test_request_timeout, **kwargs)
+
+
+# Asserts the response of a test case in compare_content=client mode. Attribute assertions are still evaluated by NiFi
+# and returned as a response header, the output content is the response body and is compared with the expected output
+# file block by block while it is read from the connection
+def check_client_side(test_case, resp):
+    with resp:
+        attributes_match = resp.headers.get('X-Test-Attributes-Match') == 'true'
+        if not attributes_match:
+            print('Actual Attributes:', dict(parse_qsl(resp.headers.get('X-Test-Attributes', ''))))
+        content_match = check_output_content(test_case, resp)
+    return attributes_match and content_match
+
+
+# Compares the output content in the body of a streamed response with the expected output file, block by block while
+# it is read from the connection. Only a bounded diff around the first difference is printed on a mismatch
+def check_output_content(test_case, resp):
+    if test_case.expected_out_file_name == '' or test_case.context.is_skip_check_out_content:
+        return True
+    mode = FileContentType.BINARY if test_case.context.is_binary_file else FileContentType.TEXT
+    comparison = compare_content(resp.iter_content(BLOCK_SIZE),
+                                 file_name_with_path(test_case.tc_dir, test_case.expected_out_file_name), mode)
+    if not comparison.match:
+        print('Output content differs at byte', comparison.first_difference, '- actual size:',
+              comparison.actual_size, 'expected size:', comparison.expected_size)
+        print(comparison.diff)
+    return comparison.match
+
+
+# Streams the input file of a test case in stream_input mode, the chunks are sent as a chunked HTTP request body
+def stream_input_content(test_case):
+    test_context = test_case.context
+    if not is_stream_input or test_case.input_file_name == '' or \
+            (test_context.is_skip_replace_text_in and not test_context.is_binary_file):
+        return None
+    mode = FileContentType.BINARY if test_context.is_binary_file else FileContentType.TEXT
+    return iter_file_chunks(file_name_with_path(test_case.tc_dir, test_case.input_file_name), mode)
+
+
+# Runs test cases of a flow concurrently through one deployed harness. Input attributes travel as HTTP query parameters
+# and input content as the request body, each request is tagged with the test case name as correlation id. The output
+# content comes back as the response body and the correlation id and attributes as headers, expected values are
+# matched on the client side, so there is no reconfiguration between test cases.
+# Test cases with subprocess hooks, database fixtures or database assertions are returned to be run one at a time
+def run_test_cases_batched(flow_ctx, test_cases):
+    batched_tests = []
+    serial_tests = []
+    for test_case in test_cases:
+        subprocess_settings = test_case.context.subprocess
+        if subprocess_settings.before or subprocess_settings.after or test_case.fixtures or test_case.db_assertions:
+            serial_tests.append(test_case)
+        else:
+            batched_tests.append(test_case)
+    if not batched_tests:
+        return serial_tests
+
+    # HandleHttpRequest turns the listed query parameters into FlowFile attributes
+    param_attribs = {CORRELATION_ATTRIBUTE}
+    expected_attribs = set()
+    for test_case in batched_tests:
+        param_attribs.update(test_case.input_attribs)
+        expected_attribs.update(test_case.expected_out_attribs)
+
+    print(' ')
+    print('===== BEGIN :: Batched Test Cases:', len(batched_tests), "======")
+    print('Creating / Updating the batched flow unit testing harness...')
+    dict_processors = create_batched_processors(flow_ctx.test_api_port, flow_ctx.context_map,
+                                                ','.join(sorted(param_attribs)),
+                                                generate_batched_report(expected_attribs), flow_ctx.parent_pg,
+                                                flow_ctx.readiness)
+    try:
+        connection_list = ['http_req_processor', 'input_port', 'output_port', 'http_resp_processor']
+        all_processors_dict = {**dict_processors, 'input_port': flow_ctx.input_port,
+                               'output_port': flow_ctx.output_port}
+        concurrent_calls(lambda pair: canvas.create_connection(all_processors_dict[pair[0]],
+                                                               all_processors_dict[pair[1]]),
+                         [pair for pair in itertools.pairwise(connection_list) if pair[0] != 'input_port'])
+        schedule_processors(flow_ctx.parent_pg_id, list(dict_processors.values()), True, flow_ctx.readiness)
+        schedule_process_group(flow_ctx.deployed_pg.id, True, flow_ctx.readiness)
+        flow_ctx.readiness.port_listening(Env.NIFI_TEST_API_HOSTNAME, flow_ctx.test_api_port)
+
+        with ThreadPoolExecutor(max_workers=batch_concurrency) as test_executor:
+            results = list(test_executor.map(lambda test_case: send_batched_test_case(flow_ctx, test_case),
+                                             batched_tests))
+    finally:
+        stop_and_unwire_harness(flow_ctx, dict_processors.values())
+        # The harness is rebuilt / reconciled from scratch for the test cases that run one at a time
+        flow_ctx.harness = HarnessState()
+
+    for tc_name, test_result, duration in results:
+        flow_ctx.test_cases[tc_name] = [test_result, duration]
+    print('===== END :: Batched Test Cases:', len(batched_tests), "======")
+    return serial_tests
+
+
+# Sends a single test case through the batched harness and asserts the response by correlation id
+def send_batched_test_case(flow_ctx, test_case):
+    start_time = time.time()
+    tc_name = test_case.name
+    tc_dir = test_case.tc_dir
+    test_context = test_case.context
+    try:
+        input_file_name = test_case.input_file_name
+        input_content = stream_input_content(test_case)
+        if input_content is None:
+            input_content = b''
+            if input_file_name != '' and test_context.is_binary_file:
+                input_content = read_file_content(file_name_with_path(tc_dir, input_file_name),
+                                                  FileContentType.BINARY)
+            elif input_file_name != '' and not test_context.is_skip_replace_text_in:
+                input_content = read_file_content(file_name_with_path(tc_dir, input_file_name)).encode()
+
+        params = {**test_case.input_attribs, CORRELATION_ATTRIBUTE: tc_name}
+        with send_test_request('POST', flow_ctx, params=params, data=input_content, stream=True) as resp:
+            resp.raise_for_status()
+            mismatches = []
+            test_id = unquote_plus(resp.headers.get('X-Test-Id', ''))
+            if test_id != tc_name:
+                mismatches.append(CORRELATION_ATTRIBUTE + ' ' + test_id)
+            actual_attribs = dict(parse_qsl(resp.headers.get('X-Test-Attributes', ''), keep_blank_values=True))
+            for key, value in test_case.expected_out_attribs.items():
+                if actual_attribs.get(key, '') != value:
+                    mismatches.append(key)
+            if not check_output_content(test_case, resp):
+                mismatches.append('flow content')
+
+        if not mismatches:
+            print('Test Case:', tc_name, PASSED)
+            test_result = PASSED
+        else:
+            print('Test Case:', tc_name, FAILED, 'mismatches:', mismatches)
+            if mismatches != ['flow content']:
+                print('Actual Attributes:', actual_attribs)
+            test_result = FAILED
+            flow_ctx.test_result = 'FAILURE'
+            flow_ctx.test_messages[tc_name] = 'mismatches: ' + ', '.join(mismatches)
+    except Exception as err:
+        print('Test Case:', tc_name, FAILED)
+        print('failed with exception: ', err)
+        test_result = FAILED
+        flow_ctx.test_result = 'FAILURE'
+        flow_ctx.test_messages[tc_name] = 'failed with exception: ' + str(err)
+    duration = round(time.time() - start_time, 2)
+    flow_ctx.test_phases[tc_name] = {'request': duration}
+    return tc_name, test_result, duration
+
+
+def generate_flow_unit_test_report(flow_ctx):
+    flow_name = flow_ctx.flow_name
+    test_cases = flow_ctx.test_cases
 
     # TODO: Improve Unit Test report
     print(' ')
     print('===== BEGIN :: Unit Test Report:', flow_name, "======")
 
-    sd = dateutil.relativedelta.relativedelta(seconds=int(setup_duration))
+    sd = dateutil.relativedelta.relativedelta(seconds=int(flow_ctx.setup_duration))
     print("Flow Setup: %d hours, %d minutes and %d seconds" % (sd.hours, sd.minutes, sd.seconds))
 
-    total_duration += setup_duration
+    total_duration = flow_ctx.setup_duration
 
     print(' ')
 
@@ -387,10 +859,17 @@ def generate_flow_unit_test_report(flow_name):
         print(test_name, stats[0], 'took', stats[1], SECS)
 
     print(' ')
-    td = dateutil.relativedelta.relativedelta(seconds=int(teardown_duration))
+    if flow_ctx.readiness:
+        waits = [waited for _, waited in flow_ctx.readiness.waits]
+        print('Readiness Waits:', len(waits), 'total', flow_ctx.readiness.total_wait(), SECS, 'max',
+              max(waits, default=0), SECS)
+
+    print(' ')
+    td = dateutil.relativedelta.relativedelta(seconds=int(flow_ctx.teardown_duration))
     print("Flow TearDown: %d hours, %d minutes and %d seconds" % (td.hours, td.minutes, td.seconds))
 
-    total_duration += teardown_duration
+    total_duration += flow_ctx.teardown_duration
+    flow_ctx.total_duration = total_duration
     total_tc_count = len(test_cases)
     failed_tc_count = len(failed_tests)
 
@@ -403,19 +882,161 @@ def generate_flow_unit_test_report(flow_name):
     print('===== END :: Unit Test Report:', flow_name, "======")
 
 
+# Merges per flow reports into a summary of the whole run
+def generate_test_suite_report(flow_contexts, wall_clock_duration):
+    total_tc_count = sum(len(flow_ctx.test_cases) for flow_ctx in flow_contexts)
+    failed_tc_count = sum(1 for flow_ctx in flow_contexts for stats in flow_ctx.test_cases.values()
+                          if stats[0] == FAILED)
+    flows_duration = sum(flow_ctx.total_duration for flow_ctx in flow_contexts)
+
+    print(' ')
+    print('===== BEGIN :: Unit Test Suite Report ======')
+    print('Flows:', len(flow_contexts))
+    print('Tests', FAILED, ':', failed_tc_count)
+    print('Tests', PASSED, ':', total_tc_count - failed_tc_count)
+    print('Total Tests:', total_tc_count)
+    print('Sum of Flow Times:', round(flows_duration, 2), SECS)
+    print('Wall Clock Time:', round(wall_clock_duration, 2), SECS)
+    print('===== END :: Unit Test Suite Report ======')
+
+
+# Sets up, tests and tears down a single flow. The flow holds a HandleHttpRequest listening port from the pool for
+# its whole lifetime
+def run_flow(flow_name, test_cases):
+    flow_ctx = prepare_flow(flow_name)
+    try:
+        test_flow(flow_ctx, test_cases)
+    finally:
+        finish_flow(flow_ctx, is_deferred_teardown)
+    return flow_ctx
+
+
+# Takes a listening port from the pool and sets up a flow. A failed setup fails the flow, its test cases are not run
+# and what the setup created is still torn down
+def prepare_flow(flow_name):
+    test_api_port = test_api_port_pool.acquire()
+    flow_ctx = FlowContext(flow_name, test_api_port, HTTP + Env.NIFI_TEST_API_HOSTNAME + ':' + test_api_port + '/test')
+    flow_ctx.readiness = Readiness(readiness_deadline)
+    flow_ctx.ledger = ResourceLedger()
+    try:
+        with phase(flow_ctx.phases, 'setup', FLOW, flow=flow_name):
+            setup_flow(flow_ctx)
+    except Exception as err:
+        print('Setup of flow', flow_name, 'failed with exception:', err)
+        flow_ctx.setup_error = err
+        flow_ctx.test_messages[''] = 'setup failed with exception: ' + str(err)
+        flow_ctx.test_result = 'FAILURE'
+    return flow_ctx
+
+
+def test_flow(flow_ctx, test_cases):
+    if flow_ctx.setup_error is not None:
+        return
+    try:
+        if is_batch_test_cases:
+            with span('batched test cases', TEST_CASE, flow=flow_ctx.flow_name):
+                test_cases = run_test_cases_batched(flow_ctx, test_cases)
+        for test_case in test_cases:
+            with span('test case', TEST_CASE, flow=flow_ctx.flow_name, test_case=test_case.name):
+                run_test_case(flow_ctx, test_case)
+    except Exception as err:
+        print("exception: " + str(err))
+        flow_ctx.test_result = 'FAILURE'
+    finally:
+        finish_after_hooks(flow_ctx)
+
+
+# Tears a flow down, in the background when deferred
+def finish_flow(flow_ctx, is_deferred):
+    if is_deferred:
+        teardown_futures.append(teardown_executor.submit(teardown_flow_release_port, flow_ctx))
+    else:
+        teardown_flow_release_port(flow_ctx)
+
+
+# Runs flows one at a time with up to depth next flows set up in the background and the previous flow torn down in
+# the background, so that only the test phase of a flow is on the critical path
+def run_flows_pipelined(tests_by_flow, depth):
+    flow_queue = iter(tests_by_flow.items())
+    prepared = deque()
+    flow_contexts = []
+    # The first setups run together, one for the current flow and one for each of the depth flows after it
+    with ThreadPoolExecutor(max_workers=depth + 1) as setup_executor:
+        def prepare_next():
+            next_flow = next(flow_queue, None)
+            if next_flow is not None:
+                prepared.append((next_flow[1], setup_executor.submit(prepare_flow, next_flow[0])))
+
+        # The current flow and depth flows after it
+        for _ in range(depth + 1):
+            prepare_next()
+        while prepared:
+            test_cases, setup_future = prepared.popleft()
+            flow_ctx = setup_future.result()
+            prepare_next()
+            try:
+                test_flow(flow_ctx, test_cases)
+            finally:
+                finish_flow(flow_ctx, True)
+            flow_contexts.append(flow_ctx)
+    return flow_contexts
+
+
+# Tears a flow down, the listening port of the flow is only free again once its harness is deleted
+def teardown_flow_release_port(flow_ctx):
+    try:
+        with phase(flow_ctx.phases, 'teardown', FLOW, flow=flow_ctx.flow_name):
+            teardown_flow(flow_ctx)
+    finally:
+        test_api_port_pool.release(flow_ctx.test_api_port)
+
+
 # --------------------------------- Main ------------------------------------ #
+arg_parser = argparse.ArgumentParser(description='Nifi Flow Unit Testing')
+arg_parser.add_argument('--parallel-flows', type=int, default=None,
+                        help='number of flows to test concurrently, overrides parallel_flows property')
+arg_parser.add_argument('--pipeline-depth', type=int, default=None,
+                        help='number of flows to set up ahead of the flow being tested when flows are tested one at a '
+                             'time, overrides pipeline_depth property')
+arg_parser.add_argument('--shard', type=Shard.parse, default=None, metavar='i/N',
+                        help='run only the i-th of N shards of flows balanced by expected cost, eg: 2/4')
+arg_parser.add_argument('--force', action='store_true',
+                        help='run every test case even if it is unchanged and passed before (incremental_db)')
+arg_parser.add_argument('--properties', default=TEST_PROPERTIES,
+                        help='test properties file, default: ' + TEST_PROPERTIES)
+args = arg_parser.parse_args()
+
 # Configure Nifi, Nifi Registry and test data
-configure()
+configure(args.properties)
+if args.parallel_flows is not None:
+    parallel_flows = args.parallel_flows
+if args.pipeline_depth is not None:
+    pipeline_depth = args.pipeline_depth
+# A flow can't run without a listening port of its own
+parallel_flows = max(1, min(parallel_flows, len(test_api_ports)))
+# Every flow in the pipeline holds a listening port from its setup to its teardown, a flow set up ahead without a port
+# of its own would only wait for the teardown of the flow being tested
+if parallel_flows == 1 and pipeline_depth > len(test_api_ports) - 1:
+    print('Warning: pipeline depth', pipeline_depth, 'needs', pipeline_depth + 1, 'nifi_test_api_ports, found',
+          len(test_api_ports), '- using pipeline depth', len(test_api_ports) - 1)
+    pipeline_depth = len(test_api_ports) - 1
+# Pipelining is for flows tested one at a time, parallel flows already overlap their phases
+is_pipelined = parallel_flows == 1 and pipeline_depth > 0
+test_api_port_pool = PortPool(test_api_ports)
+# Test requests of all flows share keep-alive connections, batched test cases of a flow are sent concurrently
+test_api_session = pooled_http_session(max(parallel_flows, batch_concurrency))
+# Teardowns run in the background with deferred_teardown or pipelining, they are all waited for before reporting
+teardown_executor = ThreadPoolExecutor(max_workers=max(parallel_flows, pipeline_depth)) \
+    if is_deferred_teardown or is_pipelined else None
+teardown_futures = []
 
 print('========== BEGIN ================')
 print(' ')
 
-# Initialize overall test suite result
-test_suite_result = 'SUCCESS'
-
 # Adding Registry Client if not exists
 print('Adding Registry Client if not exists...')
-registry_id = add_registry_client(registry_base_url).id
+run_ledger = ResourceLedger()
+registry_id = add_registry_client(registry_base_url, run_ledger).id
 
 # Get target test bucket
 bucket_id = versioning.get_registry_bucket(test_bucket_name, 'name', False).identifier
@@ -426,6 +1047,11 @@ root_id = canvas.get_root_pg_id()
 # Get Root PG object
 root_pg = canvas.get_process_group(root_id, 'id')
 
+# Test container process groups kept deployed by previous runs
+warm_pool = WarmPool(root_id, warm_pool_max_count) if is_warm_pool else None
+if warm_pool is not None:
+    print('Warm pool holds', len(warm_pool), 'test container process groups')
+
 # Run all flow unit tests
 #  step / flow dir name in the test-data dir should match with flow name imported in registry
 #  eg: validate, http, routing, etc.,
@@ -446,26 +1072,117 @@ for afile in allFiles:
             testsByFlow.update({flow: []})
         testsByFlow[flow].append(afile)
 
-for flow_name in testsByFlow.keys():
-    filesToTest = testsByFlow.get(flow_name)
-
-    if len(filesToTest) != 0:
-        # Setup
-        setup_flow(flow_name)
-
-        try:
-            for file in filesToTest:
-                tc_dir = Path(os.path.abspath(file.parent)).as_posix()
-                run_test_case(tc_dir, file.name)
-        except Exception as err:
-            print("exception: " + str(err))
-        finally:
-            # TearDown
-            teardown_flow(flow_name)
-
-    # Generate Flow Unit Test Report
-    generate_flow_unit_test_report(flow_name)
-
+# Longest flows first by expected cost from the history database (or from test count and file sizes without history)
+costModel = CostModel.from_history(history_db)
+if args.shard is not None:
+    testsByFlow, shardCosts = shard_flows(testsByFlow, costModel, args.shard)
+    print('Running shard', str(args.shard.index) + '/' + str(args.shard.count), 'with', len(testsByFlow),
+          'flows, expected secs per shard:', [round(cost, 1) for cost in shardCosts])
+else:
+    testsByFlow, _ = order_flows(testsByFlow, costModel)
+
+suite_start_time = time.time()
+
+# Load and validate all test cases before any flow is deployed
+print('Loading test cases...')
+testPaths = TestPaths(input_attribs_jsonpath, expected_out_attribs_jsonpath, input_file_name_jsonpath,
+                      expected_out_file_name_jsonpath, expected_out_db_jsonpath)
+testCasesByFlow = {}
+skippedFlowContexts = []
+for flow_name, filesToTest in testsByFlow.items():
+    flowTestCases, loadErrors = load_test_cases(filesToTest, testPaths)
+    for invalid_file, load_error in loadErrors:
+        print('Invalid test case:', invalid_file, load_error)
+    if not loadErrors:
+        testCasesByFlow[flow_name] = flowTestCases
+    elif is_skip_invalid_flows:
+        print('Skipping flow:', flow_name, 'with', len(loadErrors), 'invalid test cases')
+        skippedFlow = FlowContext(flow_name, '', '', test_result='FAILURE')
+        skippedFlow.test_cases = {Path(invalid_file.name).stem: [FAILED, 0] for invalid_file, _ in loadErrors}
+        skippedFlow.test_messages = {Path(invalid_file.name).stem: 'invalid test case: ' + str(load_error)
+                                     for invalid_file, load_error in loadErrors}
+        skippedFlowContexts.append(skippedFlow)
+    else:
+        raise TestCaseError('Invalid test cases in flow ' + flow_name + ', aborting before deployment')
+
+# Skip unchanged test cases that passed against the same flow id and version
+selectionCache = None
+if incremental_db:
+    selectionCache = TestSelectionCache(incremental_db)
+    flowIds = {flow_name: flow.identifier if flow is not None else None for flow_name, flow in zip(
+        testCasesByFlow, concurrent_calls(lambda flow_name: versioning.get_flow_in_bucket(bucket_id, flow_name, 'name',
+                                                                                           False), testCasesByFlow))}
+    fingerprint = harness_fingerprint(
+        [PROCESSORS_CONFIG_JSON, PROCESSORS_BATCHED_CONFIG_JSON, PROCESSORS_CLIENT_COMPARE_CONFIG_JSON],
+        {'batch_test_cases': is_batch_test_cases, 'stream_input': is_stream_input, 'client_compare': is_client_compare,
+         'sensitive_props': sensitive_props})
+    selection = select_test_cases(testCasesByFlow, selectionCache, flowIds, flow_version_dictionary, fingerprint,
+                                  args.force)
+    print('Incremental run:', selection.skipped_count(), 'unchanged test cases that passed before are skipped,',
+          sum(len(flowTestCases) for flowTestCases in selection.to_run.values()), 'test cases of',
+          len(selection.to_run), 'flows run')
+    for flow_name, skippedTests in selection.skipped.items():
+        print('  skipped', flow_name + ':', len(skippedTests), 'test cases')
+    testCasesByFlow = selection.to_run
+
+# Pooled connections per database for fixtures and db assertions of the test cases, at most one fixture load per
+# running flow. A db assertion holds two connections when it streams both sides of a mismatch
+database_pools = fixture_executor = None
+if any(test_case.fixtures or test_case.db_assertions for flowTestCases in testCasesByFlow.values()
+       for test_case in flowTestCases):
+    database_pools = DatabasePools(load_databases(DATABASES_JSON), 2 * parallel_flows)
+    fixture_executor = ThreadPoolExecutor(max_workers=parallel_flows)
+
+# Subprocess hooks of the test cases run in the background, every hook of the running flows gets its own thread
+hook_runner = HookRunner(hook_timeout_secs)
+
+if is_pipelined:
+    print('Running', len(testCasesByFlow), 'flows with pipeline depth', pipeline_depth, '...')
+    flowContexts = run_flows_pipelined(testCasesByFlow, pipeline_depth) + skippedFlowContexts
+else:
+    print('Running', len(testCasesByFlow), 'flows with', parallel_flows, 'in parallel...')
+    with ThreadPoolExecutor(max_workers=parallel_flows) as flow_executor:
+        flow_futures = [flow_executor.submit(run_flow, flow_name, flowTestCases)
+                        for flow_name, flowTestCases in testCasesByFlow.items()]
+        flowContexts = [future.result() for future in flow_futures] + skippedFlowContexts
+
+for teardown_future in teardown_futures:
+    try:
+        teardown_future.result()
+    except Exception as err:
+        print('Deferred teardown failed:', err)
+if teardown_executor is not None:
+    teardown_executor.shutdown()
+if fixture_executor is not None:
+    fixture_executor.shutdown()
+    database_pools.close()
+hook_runner.shutdown()
+
+if warm_pool is not None:
+    warm_pool.evict(Readiness(readiness_deadline))
+else:
+    # Registry client is only deleted when the run created it and no pooled flow is under its version control
+    run_ledger.teardown(Readiness(readiness_deadline))
+
+# Generate Flow Unit Test Reports
+for flowContext in flowContexts:
+    generate_flow_unit_test_report(flowContext)
+suite_duration = time.time() - suite_start_time
+generate_test_suite_report(flowContexts, suite_duration)
+
+if report_dir:
+    write_reports(report_dir, flowContexts, suite_duration, selection.skipped if selectionCache is not None else None)
+if history_db:
+    record_history(history_db, flowContexts, suite_duration, regression_threshold_pct, regression_window,
+                   regression_min_secs)
+if selectionCache is not None:
+    record_selection(selectionCache, flowContexts, selection.digests)
+    selectionCache.close()
+
+if trace_dir:
+    export_traces(trace_dir)
+
+test_suite_result = 'SUCCESS' if all(flow_ctx.test_result == 'SUCCESS' for flow_ctx in flowContexts) else 'FAILURE'
 print(' ')
 print('Unit Test Suite Result:', test_suite_result)
 print(' ')
@@ -8,29 +8,188 @@
 
 # This flow utils script has all the helper / util functions specific to Nifi Flow
 
-import json
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from random import randrange
 
-from jsonpath_ng import parse
-from nipyapi import canvas, versioning, nifi
+from nipyapi import canvas, versioning, nifi, parameters, registry, config
+from nipyapi.nifi.rest import ApiException
+
+from harness_templates import load_harness_spec
 
 PROCESSORS_CONFIG_JSON = '../config/processors.json'
+PROCESSORS_BATCHED_CONFIG_JSON = '../config/processors_batched.json'
+PROCESSORS_CLIENT_COMPARE_CONFIG_JSON = '../config/processors_client_compare.json'
+CORRELATION_ATTRIBUTE = 'test.id'
+PROCESSOR_TYPE = 'processor_type'
+CONTROLLER_TYPE = 'controller_type'
+PROCESSOR = 'processor'
+CONTROLLER = 'controller'
+CONTEXT_MAP_NAME = 'testing map'
+# Maximum NiFi REST calls issued at the same time by concurrent_calls, across all flows
+MAX_IN_FLIGHT_REQUESTS = 8
+# Maximum controller services of one dependency level that are enabled / disabled at the same time
+CONTROLLER_SERVICE_CONCURRENCY = 8
+
+
+# Caches NiFi component type and component lookups across the run, keyed by (kind, identifier, PG id). Lookups by
+# name within a process group scan the whole group once and cache every name found, names that are not found are
+# answered from the same scan until the group is invalidated. Entries are updated / invalidated by our own create,
+# update and delete calls
+class LookupCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._scanned = set()
+
+    def get(self, kind, identifier, pg_id, loader):
+        key = (kind, identifier, pg_id)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+        value = loader()
+        if value is not None:
+            self.put(kind, identifier, pg_id, value)
+        return value
+
+    def put(self, kind, identifier, pg_id, value):
+        with self._lock:
+            self._entries[(kind, identifier, pg_id)] = value
+
+    # Gets component by name within a process group, scanning the group with list_all only on the first lookup
+    def get_in_pg(self, kind, identifier, pg_id, list_all, name_of):
+        with self._lock:
+            if (kind, identifier, pg_id) in self._entries:
+                return self._entries[(kind, identifier, pg_id)]
+            if (kind, pg_id) in self._scanned:
+                return None
+        by_name = {}
+        for component in list_all(pg_id) or []:
+            by_name.setdefault(name_of(component), []).append(component)
+        with self._lock:
+            for name, components in by_name.items():
+                self._entries[(kind, name, pg_id)] = components[0] if len(components) == 1 else components
+            self._scanned.add((kind, pg_id))
+            return self._entries.get((kind, identifier, pg_id))
+
+    # Drops matching entries, None matches anything
+    def invalidate(self, kind=None, identifier=None, pg_id=None):
+        with self._lock:
+            for key in [key for key in self._entries if (kind is None or key[0] == kind) and
+                        (identifier is None or key[1] == identifier) and (pg_id is None or key[2] == pg_id)]:
+                del self._entries[key]
+            self._scanned = {key for key in self._scanned
+                             if not ((kind is None or key[0] == kind) and (pg_id is None or key[1] == pg_id))}
+
+
+lookup_cache = LookupCache()
+rest_executor = None
+
+
+# Sizes the keep-alive connection pools of the NiFi and Registry clients for max_in_flight concurrent calls - nipyapi
+# pools keep 4 connections per host and close the connection of every call beyond that instead of reusing it. TLS
+# sessions are reused along with the pooled connections. Must be called after ssl context and login are set up
+def configure_rest_pools(max_in_flight=MAX_IN_FLIGHT_REQUESTS):
+    global rest_executor
+    for service_config, api_client_class, rest_client_class in (
+            (config.nifi_config, nifi.ApiClient, nifi.rest.RESTClientObject),
+            (config.registry_config, registry.ApiClient, registry.rest.RESTClientObject)):
+        if service_config.api_client is None:
+            service_config.api_client = api_client_class()
+        service_config.api_client.rest_client = rest_client_class(maxsize=max_in_flight)
+    rest_executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+
+# Calls fn for each item concurrently, with at most max_in_flight calls in flight across all flows, and returns the
+# results in order of items. Independent calls like creating the harness processors or connections are issued at once
+# instead of one round trip after another. fn must not call concurrent_calls itself
+def concurrent_calls(fn, items):
+    items = list(items)
+    if rest_executor is None or len(items) < 2:
+        return [fn(item) for item in items]
+    return list(rest_executor.map(fn, items))
+
+
+# Prefetches the processor and controller service type catalogs once, so that type lookups never scan the catalog
+def prefetch_component_types():
+    for processor_type in canvas.list_all_processor_types().processor_types:
+        lookup_cache.put(PROCESSOR_TYPE, processor_type.type, None, processor_type)
+    for controller_type in canvas.list_all_controller_types():
+        lookup_cache.put(CONTROLLER_TYPE, controller_type.type, None, controller_type)
+
+
+def get_processor_type(p_type):
+    return lookup_cache.get(PROCESSOR_TYPE, p_type, None, lambda: canvas.get_processor_type(p_type, 'name', False))
+
+
+def get_controller_type(cs_type):
+    return lookup_cache.get(CONTROLLER_TYPE, cs_type, None, lambda: canvas.get_controller_type(cs_type, 'name', False))
 
 
 # Create & Enable StandardHttpContextMap Controller Service to provide context that is shared by
 # HandleHttpRequest & HandleHttpResponse processors
-def create_enable_ctx_map_controller(parent_pg):
+def create_enable_ctx_map_controller(parent_pg, readiness, ledger):
     context_map_name = 'org.apache.nifi.http.StandardHttpContextMap'
-    context_map_service_type = canvas.get_controller_type(context_map_name)
-    ctx_map = canvas.create_controller(parent_pg, context_map_service_type, 'testing map')
-    canvas.schedule_controller(ctx_map, True, True)
-    return ctx_map
+    context_map_service_type = get_controller_type(context_map_name)
+    ctx_map = canvas.create_controller(parent_pg, context_map_service_type, CONTEXT_MAP_NAME)
+    ledger.add_controller_service(ctx_map, parent_pg.id)
+    lookup_cache.invalidate(CONTROLLER, pg_id=parent_pg.id)
+    return schedule_controller(ctx_map, True, readiness)
+
+
+# Enables / Disables controller service and waits for the target state with the readiness engine
+def schedule_controller(controller, scheduled, readiness):
+    target_state = 'ENABLED' if scheduled else 'DISABLED'
+    controller = canvas.get_controller(controller.id, 'id')
+    if controller.component.state == target_state:
+        return controller
+    nifi.ControllerServicesApi().update_run_status(
+        id=controller.id,
+        body=nifi.ControllerServiceRunStatusEntity(revision=controller.revision, state=target_state))
+    readiness.controller_state(controller, target_state)
+    return canvas.get_controller(controller.id, 'id')
+
+
+# Starts / Stops processors of a process group with a single scheduling request and waits until all of them are
+# running / stopped
+def schedule_processors(pg_id, processors, scheduled, readiness):
+    if not processors:
+        return
+    # Scheduling needs the latest revision of each processor
+    processors = concurrent_calls(lambda processor: canvas.get_processor(processor.id, 'id'), processors)
+    canvas.schedule_components(pg_id, scheduled, processors)
+    if scheduled:
+        readiness.processors_running(processors)
+    else:
+        readiness.processors_stopped(processors)
+
+
+# Starts / Stops all components of a process group and waits until they are running / stopped
+def schedule_process_group(pg_id, scheduled, readiness):
+    canvas.schedule_components(pg_id, scheduled)
+    if scheduled:
+        readiness.process_group_running(pg_id)
+    else:
+        readiness.process_group_stopped(pg_id)
+
+
+# Gets processor by name within a process group, so that concurrently tested flows never see each other's processors
+def get_processor_in_pg(pg_id, p_name):
+    return lookup_cache.get_in_pg(PROCESSOR, p_name, pg_id, canvas.list_all_processors,
+                                  lambda processor: processor.status.name)
+
+
+# Gets controller service(s) by name within a process group
+def get_controller_in_pg(pg_id, cs_name):
+    return lookup_cache.get_in_pg(CONTROLLER, cs_name, pg_id, lambda pg: canvas.list_all_controllers(pg, True),
+                                  lambda controller: controller.component.name)
 
 
 # Creates or Updates processor with spec defined in PROCESSORS_CONFIG_JSON
 def create_processor(parent_pg, p_name, p_type, p_location, p_config):
-    processor = canvas.get_processor(p_name, 'name', False)
-    processor_type = canvas.get_processor_type(p_type, 'name', False)
+    processor = get_processor_in_pg(parent_pg.id, p_name)
+    processor_type = get_processor_type(p_type)
 
     if not processor:
         processor = canvas.create_processor(parent_pg, processor_type, p_location, p_name, p_config)
@@ -42,53 +201,164 @@ def create_processor(parent_pg, p_name, p_type, p_location, p_config):
         else:
             processor = canvas.update_processor(processor, nifi.ProcessorConfigDTO(properties=p_config.get('properties')))
 
+    lookup_cache.put(PROCESSOR, p_name, parent_pg.id, processor)
     return processor
 
 
-# Creates or Updates processors defined in PROCESSORS_CONFIG_JSON
-# variables passed to the function are needed for eval() used for create_processor()
-def create_processors(test_api_port, ctx_map, in_attribs, in_content_txt, exp_out_content_txt, report_json,  # NOSONAR
-                      parent_pg, skip, test_context):
+# Renders processor templates compiled from spec_file into a list of (name, type, location, config)
+def render_processors(test_api_port, ctx_map, in_attribs, in_content_txt, exp_out_content_txt, report_json, skip,
+                      spec_file=PROCESSORS_CONFIG_JSON):
 
     if len(exp_out_content_txt) > 0:
-        in_attribs['test.expected'] = exp_out_content_txt
+        in_attribs = {**in_attribs, 'test.expected': exp_out_content_txt}
 
-    # Parse processors config json file
-    with open(PROCESSORS_CONFIG_JSON, 'r') as processors_json:
-        processors_json_data = json.load(processors_json)
+    slot_values = {'test_api_port': test_api_port, 'ctx_map': ctx_map, 'in_attribs': in_attribs,
+                   'in_content_txt': in_content_txt, 'report_json': report_json}
+    return [(template.name, template.type, template.location, template.render(slot_values))
+            for template in load_harness_spec(spec_file) if template.name not in skip]
 
-    dict_processors = {}
-    for processor in processors_json_data:
-        p_name = parse('$.name').find(processor)[0].value
-        p_type = parse('$.type').find(processor)[0].value
-        p_location = parse('$.location').find(processor)[0].value
-        p_config = parse('$.config').find(processor)[0].value
 
-        if p_name not in skip:
-            # eval does the variable substitutions in json strings with function parameter values
-            proc = create_processor(parent_pg, p_name, p_type, eval(p_location), eval(p_config))
-            dict_processors[p_name] = proc
+# Creates or Updates processors defined in PROCESSORS_BATCHED_CONFIG_JSON. The batched harness carries input attributes
+# and content in the HTTP request itself, so it is configured once for all test cases of a flow
+def create_batched_processors(test_api_port, ctx_map, param_attribs, report_json, parent_pg, readiness):
+    slot_values = {'test_api_port': test_api_port, 'ctx_map': ctx_map, 'param_attribs': param_attribs,
+                   'report_json': report_json}
+    dict_processors = create_processors_concurrently(parent_pg, [
+        (template.name, template.type, template.location, template.render(slot_values))
+        for template in load_harness_spec(PROCESSORS_BATCHED_CONFIG_JSON)])
 
+    readiness.processors_validated(dict_processors.values())
     return dict_processors
 
 
+# Creates or Updates processors of (name, type, location, config) specs concurrently
+def create_processors_concurrently(parent_pg, processor_specs):
+    if processor_specs:
+        # Scan the process group once before the concurrent lookups
+        get_processor_in_pg(parent_pg.id, processor_specs[0][0])
+    processors = concurrent_calls(lambda spec: create_processor(parent_pg, *spec), processor_specs)
+    return {spec[0]: processor for spec, processor in zip(processor_specs, processors)}
+
+
+# Creates or Updates processors defined in spec_file and waits until NiFi has validated them
+def create_processors(test_api_port, ctx_map, in_attribs, in_content_txt, exp_out_content_txt, report_json,  # NOSONAR
+                      parent_pg, skip, test_context, readiness, spec_file=PROCESSORS_CONFIG_JSON):
+    dict_processors = create_processors_concurrently(parent_pg, render_processors(
+        test_api_port, ctx_map, in_attribs, in_content_txt, exp_out_content_txt, report_json, skip, spec_file))
+
+    readiness.processors_validated(dict_processors.values())
+    return dict_processors
+
+
+# Reconciles the harness deployed in parent_pg with the processor specs and connection chain of the next test case.
+# Only processors whose properties changed are stopped and updated - properties that are no longer wanted are removed
+# by setting them to None, which also clears stale UpdateAttribute attributes without recreating the processor.
+# Connections that are still wanted stay wired, their stale FlowFiles are dropped with a bulk drop request. The deployed
+# process group keeps running unless a connection to one of its ports has to be deleted.
+def reconcile_harness(parent_pg, deployed_pg_id, processor_specs, ports, chain, harness, readiness):
+    desired = {p_name: (p_type, p_location, p_config) for p_name, p_type, p_location, p_config in processor_specs}
+    chain = [name for name in chain if name in desired or name in ports]
+    desired_connections = [(from_con, to_con) for from_con, to_con in itertools.pairwise(chain)
+                           if from_con != 'input_port']
+
+    # Property changes of the processors that are already deployed
+    updates = {}
+    for p_name, (p_type, p_location, p_config) in desired.items():
+        if p_name not in harness.processors:
+            continue
+        properties = p_config.get('properties') or {}
+        applied = harness.properties[p_name]
+        update = {key: value for key, value in properties.items() if applied.get(key) != value}
+        update.update({key: None for key in applied if key not in properties})
+        if update:
+            updates[p_name] = update
+    stale_connections = [pair for pair in harness.connections if pair not in desired_connections]
+
+    # Stop what is updated, is no longer wanted or is an end of a connection that has to be deleted
+    to_stop = set(updates) | {name for name in harness.processors if name not in desired} | \
+        {name for pair in stale_connections for name in pair}
+    if harness.pg_running and any(name in ports for name in to_stop):
+        schedule_process_group(deployed_pg_id, False, readiness)
+        harness.pg_running = False
+    to_stop = [name for name in to_stop if name in harness.running]
+    schedule_processors(parent_pg.id, [harness.processors[name] for name in to_stop], False, readiness)
+    harness.running.difference_update(to_stop)
+
+    updated = concurrent_calls(lambda item: canvas.update_processor(
+        harness.processors[item[0]], nifi.ProcessorConfigDTO(properties=item[1])), updates.items())
+    for p_name, processor in zip(updates, updated):
+        harness.processors[p_name] = processor
+        lookup_cache.put(PROCESSOR, p_name, parent_pg.id, processor)
+        harness.properties[p_name] = dict(desired[p_name][2].get('properties') or {})
+    created = create_processors_concurrently(parent_pg, [(p_name, *spec) for p_name, spec in desired.items()
+                                                         if p_name not in harness.processors])
+    for p_name, processor in created.items():
+        harness.processors[p_name] = processor
+        harness.properties[p_name] = dict(desired[p_name][2].get('properties') or {})
+    changed = [harness.processors[name] for name in desired if name not in harness.running]
+    if changed:
+        readiness.processors_validated(changed)
+
+    # Rewire only the connections that differ
+    components = {**harness.processors, **ports}
+    concurrent_calls(lambda pair: canvas.delete_connection(harness.connections.pop(pair), True), stale_connections)
+    drop_all_flowfiles(parent_pg.id, readiness)
+    new_connections = [pair for pair in desired_connections if pair not in harness.connections]
+    harness.connections.update(zip(new_connections, concurrent_calls(
+        lambda pair: canvas.create_connection(components[pair[0]], components[pair[1]]), new_connections)))
+
+    schedule_processors(parent_pg.id, changed, True, readiness)
+    harness.running.update(name for name in desired)
+    if not harness.pg_running:
+        schedule_process_group(deployed_pg_id, True, readiness)
+        harness.pg_running = True
+    return {name: harness.processors[name] for name in desired}
+
+
+# Drops all queued FlowFiles of a process group and its descendants. NiFi 1.18+ empties every queue with a single
+# request, older versions get one drop request per non empty connection, all issued before waiting on any of them
+def drop_all_flowfiles(pg_id, readiness):
+    pg_api = nifi.ProcessGroupsApi()
+    try:
+        drop_request = pg_api.create_empty_all_connections_request(pg_id)
+        readiness.wait_until(lambda: pg_api.get_drop_all_flowfiles_request(
+            pg_id, drop_request.drop_request.id).drop_request.finished, 'queues to be emptied')
+        pg_api.remove_drop_request(pg_id, drop_request.drop_request.id)
+        return
+    except ApiException as e:
+        if e.status not in (404, 405):
+            raise
+
+    queues_api = nifi.FlowfileQueuesApi()
+    drop_requests = [(connection.id, queues_api.create_drop_request(connection.id))
+                     for connection in canvas.list_all_connections(pg_id, True)
+                     if connection.status.aggregate_snapshot.flow_files_queued]
+    readiness.wait_until(lambda: all(queues_api.get_drop_request(con_id, drop_request.drop_request.id)
+                                     .drop_request.finished for con_id, drop_request in drop_requests),
+                         'queues to be emptied')
+    for con_id, drop_request in drop_requests:
+        queues_api.remove_drop_request(con_id, drop_request.drop_request.id)
+
+
 # Creates input port that connects test processors to deployed target test process group
-def create_run_input_port(process_group, flow_name):
+def create_run_input_port(process_group, flow_name, ledger):
     input_port_list = canvas.list_all_input_ports(process_group.id)
     if len(input_port_list) == 0:
-        canvas.create_port(process_group.id, 'INPUT_PORT', 'input-port-to-' + flow_name,
-                           'RUNNING', (randrange(0, 4000), randrange(0, 4000)))
+        port = canvas.create_port(process_group.id, 'INPUT_PORT', 'input-port-to-' + flow_name,
+                                  'RUNNING', (randrange(0, 4000), randrange(0, 4000)))
+        ledger.add_port(port, process_group.id)
         input_port_list = canvas.list_all_input_ports(process_group.id)
     in_port = input_port_list.pop()
     return in_port
 
 
 # Creates output port that connects deployed target test process group to test processors
-def create_run_output_port(process_group, flow_name):
+def create_run_output_port(process_group, flow_name, ledger):
     output_port_list = canvas.list_all_output_ports(process_group.id)
     if len(output_port_list) == 0:
-        canvas.create_port(process_group.id, 'OUTPUT_PORT', 'output-port-from-' + flow_name,
-                           'RUNNING', (randrange(0, 4000), randrange(0, 4000)))
+        port = canvas.create_port(process_group.id, 'OUTPUT_PORT', 'output-port-from-' + flow_name,
+                                  'RUNNING', (randrange(0, 4000), randrange(0, 4000)))
+        ledger.add_port(port, process_group.id)
         output_port_list = canvas.list_all_output_ports(process_group.id)
     out_port = output_port_list.pop()
     return out_port
@@ -96,7 +366,8 @@ def create_run_output_port(process_group, flow_name):
 
 # Generates Nifi expression that asserts expected output and actual attributes on flow file
 def generate_attrib_assert_nifi_expression(expected_out_attribs_json):
-    global all_attribs_match_expr, flow_file_attributes
+    all_attribs_match_expr = 'true'
+    flow_file_attributes = {}
     if len(expected_out_attribs_json) > 0:
         all_attribs_match_expr = '${'
         flow_file_attributes = {}
@@ -119,62 +390,113 @@ def generate_attrib_assert_nifi_expression(expected_out_attribs_json):
     return report
 
 
+# Generates the report returned by the batched harness - the actual values of all attributes that any test case of
+# the flow expects, sent as a response header next to the correlation id. The output content is the response body and
+# all assertions are done on the client side
+def generate_batched_report(expected_attrib_names):
+    return {'flow_file_attributes': {key: '${' + key + '}' for key in sorted(expected_attrib_names)}}
+
+
 # Adds Registry Client if not exists
-def add_registry_client(registry_base_url):
+def add_registry_client(registry_base_url, ledger):
     registry_list = versioning.list_registry_clients().registries
     if len(registry_list) == 0:
-        versioning.create_registry_client('NifiRegistry', registry_base_url, 'Nifi Registry')
+        ledger.add_registry_client(versioning.create_registry_client('NifiRegistry', registry_base_url,
+                                                                     'Nifi Registry'))
         registry_list = versioning.list_registry_clients().registries
     return registry_list.pop()
 
 
-# This recursive function gets controller services referred by others
-def get_referred_controller_services(cs_dto, ref_cs_list):
-    for rec_cs in cs_dto:
-        if rec_cs.component.reference_type != "ControllerService":
-            return
-        if rec_cs.component.name in ref_cs_list:
-            ref_cs_list.remove(rec_cs.component.name)
-            ref_cs_list.append(rec_cs.component.name)
-        else:
-            ref_cs_list.append(rec_cs.component.name)
-        if hasattr(rec_cs, 'referencing_components') and len(rec_cs.referencing_components) > 0:
-            get_referred_controller_services(rec_cs.component, ref_cs_list)
-
-
-# Gets controller services referencing other components
-def get_cs_referencing_components(controller_services, ref_component_list):
-    for controller_service in controller_services:
-        if controller_service.component.name not in ref_component_list:
-            ref_component_list.append(controller_service.component.name)
-        if len(controller_service.component.referencing_components) > 0:
-            get_referred_controller_services(controller_service.component.referencing_components, ref_component_list)
-
-
-# Enables Controller Services
-def enable_controller_services(ref_component_list):
-    for ref_comp in ref_component_list:
-        cs_entity = canvas.get_controller(ref_comp, 'name', True)
-        if isinstance(cs_entity, list):
-            for inner_ref_comp in cs_entity:
-                print("Enabling controller service:", inner_ref_comp.component.name)
-                canvas.schedule_controller(inner_ref_comp, True, True)
-        else:
-            print("Enabling controller service:", ref_comp)
-            canvas.schedule_controller(cs_entity, True, True)
-
-
-# Disables Controller Services
-def disable_controller_services(ref_component_list):
-    for ref_comp in ref_component_list:
-        del_cs_entity = canvas.get_controller(ref_comp, 'name', True)
-        if isinstance(del_cs_entity, list):
-            for inner_ref_comp in del_cs_entity:
-                print("Disabling controller service:", inner_ref_comp.component.name)
-                canvas.schedule_controller(inner_ref_comp, False, True)
-        else:
-            print("Disabling controller service:", ref_comp)
-            canvas.schedule_controller(del_cs_entity, False, True)
+# Builds the dependency graph of controller services from a single list_all_controllers response and sorts it into
+# topological levels - services of a level only depend on services of earlier levels. A service depends on the
+# services its properties point to and is referenced by the services that depend on it. Services caught in a
+# reference cycle can't be ordered and are put in a last level
+def get_controller_service_levels(controller_services):
+    by_id = {controller_service.id: controller_service for controller_service in controller_services}
+    dependencies = {cs_id: set() for cs_id in by_id}
+    for cs_id, controller_service in by_id.items():
+        component = controller_service.component
+        descriptors = component.descriptors or {}
+        for prop_name, value in (component.properties or {}).items():
+            descriptor = descriptors.get(prop_name)
+            if descriptor is not None and descriptor.identifies_controller_service and value in by_id:
+                dependencies[cs_id].add(value)
+        for referencing in component.referencing_components or []:
+            if referencing.component.reference_type == 'ControllerService' and referencing.id in by_id:
+                dependencies[referencing.id].add(cs_id)
+
+    dependents = {cs_id: [] for cs_id in by_id}
+    for cs_id, depends_on in dependencies.items():
+        depends_on.discard(cs_id)
+        for dependency in depends_on:
+            dependents[dependency].append(cs_id)
+
+    pending = {cs_id: len(depends_on) for cs_id, depends_on in dependencies.items()}
+    level = [cs_id for cs_id, count in pending.items() if count == 0]
+    levels = []
+    while level:
+        levels.append([by_id[cs_id] for cs_id in level])
+        next_level = []
+        for cs_id in level:
+            del pending[cs_id]
+            for dependent in dependents[cs_id]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    next_level.append(dependent)
+        level = next_level
+    if pending:
+        levels.append([by_id[cs_id] for cs_id in pending])
+    return levels
+
+
+# Enables / Disables the services of a level concurrently, a level only starts when the previous one is done
+def _schedule_controller_levels(levels, scheduled, readiness):
+    action = 'Enabling' if scheduled else 'Disabling'
+    with ThreadPoolExecutor(max_workers=CONTROLLER_SERVICE_CONCURRENCY) as executor:
+        for level in levels:
+            for controller_service in level:
+                print(action, 'controller service:', controller_service.component.name)
+            # list() re-raises the first failure before the next level is touched
+            list(executor.map(lambda controller_service: schedule_controller(controller_service, scheduled, readiness),
+                              level))
+
+
+# Enables Controller Services level by level, dependencies first
+def enable_controller_services(cs_levels, readiness):
+    _schedule_controller_levels(cs_levels, True, readiness)
+
+
+# Disables Controller Services level by level, dependents first
+def disable_controller_services(cs_levels, readiness):
+    _schedule_controller_levels(cs_levels[::-1], False, readiness)
+
+
+# Gets ids of all parameter contexts on the instance
+def list_parameter_context_ids():
+    return {parameter_context.id for parameter_context in parameters.list_all_parameter_contexts()}
+
+
+# Gets (id, name) of the parameter contexts bound to a process group and its descendants
+def get_bound_parameter_contexts(pg_id):
+    bound = {}
+    for pg in canvas.list_all_process_groups(pg_id):
+        parameter_context = pg.component.parameter_context
+        if parameter_context is not None:
+            bound[parameter_context.id] = parameter_context.component.name if parameter_context.component else ''
+    return list(bound.items())
+
+
+# Deletes a process group without the force mode of nipyapi, which deletes every controller service with a blocking
+# call of its own. The group is stopped first, NiFi refuses to disable controller services that running processors
+# reference. Controller services are then disabled level by level and queues are emptied with a single request, NiFi
+# then deletes the stopped group with everything in it
+def delete_process_group(pg_id, readiness):
+    schedule_process_group(pg_id, False, readiness)
+    disable_controller_services(get_controller_service_levels(canvas.list_all_controllers(pg_id, True)), readiness)
+    drop_all_flowfiles(pg_id, readiness)
+    pg_api = nifi.ProcessGroupsApi()
+    pg_api.remove_process_group(pg_id, version=pg_api.get_process_group(pg_id).revision.version)
+    lookup_cache.invalidate(pg_id=pg_id)
 
 
 def update_sensitive_properties(pg_id, update_data):
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This harness templates script compiles the harness processors spec (processors.json) once into typed processor
+# templates. A config in the spec is a json string with bare substitution slots, eg:
+#   "{\"properties\":{\"HTTP Context Map\":ctx_map.id,\"Listening Port\":test_api_port}}"
+# Slots are replaced by placeholders when compiling and by plain values when rendering the config of a test case,
+# so there is no json parsing, jsonpath compilation or eval() per test case. Spec errors are raised when compiling,
+# before any call is made to NiFi.
+
+import ast
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+# slot token in the spec -> (slot name, function that turns the slot value into the config value)
+SLOT_TOKENS = {
+    'ctx_map.id': ('ctx_map', lambda ctx_map: ctx_map.id),
+    'test_api_port': ('test_api_port', lambda value: value),
+    'in_attribs': ('in_attribs', lambda value: value),
+    'in_content_txt': ('in_content_txt', lambda value: value),
+    'param_attribs': ('param_attribs', lambda value: value),
+    'json.dumps(report_json)': ('report_json', json.dumps),
+    'attribs_match_expr': ('report_json', lambda report: report['flow_attributes_match']),
+    'attribs_query': ('report_json', lambda report: '&'.join(
+        key + '=${' + key + ':urlEncode()}' for key in report['flow_file_attributes'])),
+}
+JSON_LITERALS = ('true', 'false', 'null')
+SLOT_MARKER = '$slot'
+TOKEN_PATTERN = re.compile(r'[A-Za-z_][\w.]*(\([\w.]*\))?')
+REQUIRED_KEYS = ('name', 'type', 'location', 'config')
+
+
+class HarnessSpecError(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class Slot:
+    token: str
+
+    def render(self, values):
+        slot_name, to_config_value = SLOT_TOKENS[self.token]
+        if slot_name not in values:
+            raise HarnessSpecError('No value given for slot ' + slot_name)
+        return to_config_value(values[slot_name])
+
+
+@dataclass(slots=True)
+class ProcessorTemplate:
+    name: str
+    type: str
+    location: tuple
+    config: dict
+    slots: frozenset
+
+    # Renders the processor config of a test case, values are keyed by slot name
+    def render(self, values):
+        return _render(self.config, values)
+
+
+def _render(template, values):
+    if isinstance(template, Slot):
+        return template.render(values)
+    if isinstance(template, dict):
+        return {key: _render(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [_render(value, values) for value in template]
+    return template
+
+
+# Replaces bare slot tokens outside json string literals with {"$slot": token} placeholders
+def _mark_slots(p_name, config):
+    marked = []
+    pos = 0
+    while pos < len(config):
+        char = config[pos]
+        if char == '"':
+            end = pos + 1
+            while end < len(config) and config[end] != '"':
+                end += 2 if config[end] == '\\' else 1
+            marked.append(config[pos:end + 1])
+            pos = end + 1
+            continue
+        match = TOKEN_PATTERN.match(config, pos)
+        if match:
+            token = match.group(0)
+            if token in JSON_LITERALS:
+                marked.append(token)
+            elif token in SLOT_TOKENS:
+                marked.append(json.dumps({SLOT_MARKER: token}))
+            else:
+                raise HarnessSpecError('Unknown substitution slot "{}" in config of processor {}'.format(token, p_name))
+            pos = match.end()
+            continue
+        marked.append(char)
+        pos += 1
+    return ''.join(marked)
+
+
+def _to_template(value, slots):
+    if isinstance(value, dict):
+        if list(value) == [SLOT_MARKER]:
+            slots.add(SLOT_TOKENS[value[SLOT_MARKER]][0])
+            return Slot(value[SLOT_MARKER])
+        return {key: _to_template(item, slots) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_template(item, slots) for item in value]
+    return value
+
+
+def _compile_processor(processor):
+    missing = [key for key in REQUIRED_KEYS if key not in processor]
+    if missing:
+        raise HarnessSpecError('Processor spec {} is missing {}'.format(processor.get('name'), missing))
+    p_name = processor['name']
+
+    try:
+        location = ast.literal_eval(processor['location'])
+    except (ValueError, SyntaxError) as e:
+        raise HarnessSpecError('Invalid location of processor {}: {}'.format(p_name, e)) from e
+    if not (isinstance(location, tuple) and len(location) == 2 and
+            all(isinstance(coordinate, (int, float)) for coordinate in location)):
+        raise HarnessSpecError('Location of processor {} must be an (x, y) tuple'.format(p_name))
+
+    try:
+        config = json.loads(_mark_slots(p_name, processor['config']))
+    except json.JSONDecodeError as e:
+        raise HarnessSpecError('Invalid config of processor {}: {}'.format(p_name, e)) from e
+    if not isinstance(config, dict):
+        raise HarnessSpecError('Config of processor {} must be a json object'.format(p_name))
+
+    slots = set()
+    template = _to_template(config, slots)
+    return ProcessorTemplate(p_name, processor['type'], location, template, frozenset(slots))
+
+
+# Loads, validates and compiles a harness spec file once, later calls return the compiled templates
+@lru_cache(maxsize=None)
+def load_harness_spec(file_name):
+    with open(file_name, 'r') as spec_file:
+        try:
+            spec = json.load(spec_file)
+        except json.JSONDecodeError as e:
+            raise HarnessSpecError('Invalid harness spec {}: {}'.format(file_name, e)) from e
+    if not isinstance(spec, list):
+        raise HarnessSpecError('Harness spec {} must be a list of processors'.format(file_name))
+
+    templates = tuple(_compile_processor(processor) for processor in spec)
+    names = [template.name for template in templates]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise HarnessSpecError('Duplicate processor names {} in {}'.format(sorted(duplicates), file_name))
+    return templates
@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This history store script keeps the outcome and durations of every test run in a local SQLite database - per run,
+# per flow and per test case, broken down by phase (deploy, enable controller services, request, hooks, teardown..).
+# The regression check compares the phases of the latest run with their rolling baseline, the median of the previous
+# runs, and flags the ones that got slower by more than a threshold.
+
+import sqlite3
+import statistics
+import time
+from dataclasses import dataclass
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    wall_clock_secs REAL NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flow_runs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    flow TEXT NOT NULL,
+    flow_version INTEGER,
+    result TEXT NOT NULL,
+    setup_secs REAL NOT NULL,
+    teardown_secs REAL NOT NULL,
+    total_secs REAL NOT NULL,
+    PRIMARY KEY (run_id, flow)
+);
+CREATE TABLE IF NOT EXISTS test_runs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    flow TEXT NOT NULL,
+    test_case TEXT NOT NULL,
+    result TEXT NOT NULL,
+    secs REAL NOT NULL,
+    message TEXT,
+    PRIMARY KEY (run_id, flow, test_case)
+);
+-- test_case is empty for phases of flow setup and teardown
+CREATE TABLE IF NOT EXISTS phase_runs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    flow TEXT NOT NULL,
+    test_case TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    secs REAL NOT NULL,
+    PRIMARY KEY (run_id, flow, test_case, phase)
+);
+CREATE INDEX IF NOT EXISTS phase_runs_key ON phase_runs (flow, test_case, phase, run_id);
+'''
+
+# Durations of the same phase in the previous runs, newest first
+BASELINE_QUERY = '''
+SELECT flow, test_case, phase, secs FROM (
+    SELECT flow, test_case, phase, secs,
+           ROW_NUMBER() OVER (PARTITION BY flow, test_case, phase ORDER BY run_id DESC) AS age
+    FROM phase_runs WHERE run_id < ?)
+WHERE age <= ?
+'''
+
+# Setup plus teardown secs of every flow and secs of every test case in their last runs, newest first
+FLOW_OVERHEAD_QUERY = '''
+SELECT flow, secs FROM (
+    SELECT flow, setup_secs + teardown_secs AS secs, ROW_NUMBER() OVER (PARTITION BY flow ORDER BY run_id DESC) AS age
+    FROM flow_runs)
+WHERE age <= ?
+'''
+TEST_DURATION_QUERY = '''
+SELECT flow, test_case, secs FROM (
+    SELECT flow, test_case, secs,
+           ROW_NUMBER() OVER (PARTITION BY flow, test_case ORDER BY run_id DESC) AS age
+    FROM test_runs)
+WHERE age <= ?
+'''
+
+
+@dataclass(slots=True)
+class Regression:
+    flow: str
+    test_case: str
+    phase: str
+    secs: float
+    baseline_secs: float
+
+    def increase_pct(self):
+        return round((self.secs - self.baseline_secs) / self.baseline_secs * 100, 1) if self.baseline_secs else 0
+
+
+class HistoryStore:
+    def __init__(self, db_file_name):
+        self._connection = sqlite3.connect(db_file_name)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    # Records a test run, returns its run id
+    def record_run(self, flow_contexts, started_at, wall_clock_duration):
+        result = 'SUCCESS' if all(flow_ctx.test_result == 'SUCCESS' for flow_ctx in flow_contexts) else 'FAILURE'
+        with self._connection:
+            run_id = self._connection.execute(
+                'INSERT INTO runs (started_at, wall_clock_secs, result) VALUES (?, ?, ?)',
+                (started_at, wall_clock_duration, result)).lastrowid
+            self._connection.executemany(
+                'INSERT INTO flow_runs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, flow_ctx.flow_name, flow_ctx.flow_version, flow_ctx.test_result, flow_ctx.setup_duration,
+                  flow_ctx.teardown_duration, flow_ctx.total_duration) for flow_ctx in flow_contexts])
+            self._connection.executemany(
+                'INSERT INTO test_runs VALUES (?, ?, ?, ?, ?, ?)',
+                [(run_id, flow_ctx.flow_name, tc_name, tc_result, tc_duration, flow_ctx.test_messages.get(tc_name))
+                 for flow_ctx in flow_contexts for tc_name, (tc_result, tc_duration) in flow_ctx.test_cases.items()])
+            self._connection.executemany(
+                'INSERT INTO phase_runs VALUES (?, ?, ?, ?, ?)',
+                [(run_id, flow_ctx.flow_name, '', phase, secs)
+                 for flow_ctx in flow_contexts for phase, secs in flow_ctx.phases.items()] +
+                [(run_id, flow_ctx.flow_name, tc_name, phase, secs)
+                 for flow_ctx in flow_contexts for tc_name, phases in flow_ctx.test_phases.items()
+                 for phase, secs in phases.items()])
+        return run_id
+
+    # Median setup plus teardown secs per flow over its last window runs
+    def flow_overheads(self, window):
+        return _medians(self._connection.execute(FLOW_OVERHEAD_QUERY, (window,)))
+
+    # Median secs per (flow, test case) over their last window runs
+    def test_durations(self, window):
+        return _medians(((flow, test_case), secs) for flow, test_case, secs in
+                        self._connection.execute(TEST_DURATION_QUERY, (window,)))
+
+    # Phases of the run that are slower than threshold_pct over the median of the previous window runs (and by more
+    # than min_secs, so that noise on short phases is not flagged). Phases with no history are not flagged
+    def regressions(self, run_id, threshold_pct, window, min_secs):
+        history = {}
+        for flow, test_case, phase, secs in self._connection.execute(BASELINE_QUERY, (run_id, window)):
+            history.setdefault((flow, test_case, phase), []).append(secs)
+        found = []
+        for flow, test_case, phase, secs in self._connection.execute(
+                'SELECT flow, test_case, phase, secs FROM phase_runs WHERE run_id = ?', (run_id,)):
+            previous = history.get((flow, test_case, phase))
+            if not previous:
+                continue
+            baseline_secs = statistics.median(previous)
+            if secs > baseline_secs * (1 + threshold_pct / 100) and secs - baseline_secs > min_secs:
+                found.append(Regression(flow, test_case, phase, secs, baseline_secs))
+        return sorted(found, key=lambda regression: regression.secs - regression.baseline_secs, reverse=True)
+
+
+def _medians(rows):
+    values = {}
+    for key, secs in rows:
+        values.setdefault(key, []).append(secs)
+    return {key: statistics.median(secs) for key, secs in values.items()}
+
+
+# Records the run in the history database and prints the phases that regressed against their rolling baseline
+def record_history(db_file_name, flow_contexts, wall_clock_duration, threshold_pct, window, min_secs):
+    store = HistoryStore(db_file_name)
+    try:
+        run_id = store.record_run(flow_contexts, time.time() - wall_clock_duration, wall_clock_duration)
+        regressions = store.regressions(run_id, threshold_pct, window, min_secs)
+    finally:
+        store.close()
+
+    print(' ')
+    print('===== Duration Regressions (over', threshold_pct, '% of the median of the last', window, 'runs) =====')
+    for regression in regressions:
+        print('{} {} {}: {} {} (baseline {} {}, +{}%)'.format(
+            regression.flow, regression.test_case or '[flow]', regression.phase, regression.secs, 'secs',
+            round(regression.baseline_secs, 3), 'secs', regression.increase_pct()))
+    if not regressions:
+        print('None')
+    return regressions
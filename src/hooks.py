@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This hooks script runs the subprocess hooks of test cases ('settings' -> 'subprocess' -> 'before' / 'after') in the
+# background. A hook is a shell command, or an object with a command and its own timeout_secs, and 'before' / 'after'
+# can be a list of hooks that are run concurrently. Every hook runs in its own process group (session), a hook that
+# runs longer than its timeout is terminated together with the processes it started. Exit code, duration and the tail
+# of stdout / stderr of every hook are kept for the reports.
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, wait
+from dataclasses import dataclass
+
+from tracing import span, HOOK
+
+BEFORE = 'before'
+AFTER = 'after'
+DEFAULT_TIMEOUT_SECS = 300
+# secs a hook gets to exit after SIGTERM before it is killed
+TERMINATE_GRACE_SECS = 2
+# characters of stdout / stderr kept per hook
+MAX_OUTPUT_CHARS = 16 * 1024
+
+
+class HookError(ValueError):
+    pass
+
+
+# this object keeps a subprocess hook of a test case, timeout_secs None is the default timeout of the run
+@dataclass(frozen=True, slots=True)
+class Hook:
+    command: str
+    timeout_secs: float = None
+
+
+# this object keeps the outcome of a hook that ran
+@dataclass(slots=True)
+class HookResult:
+    stage: str
+    command: str
+    exit_code: int
+    secs: float
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+
+    @property
+    def is_ok(self):
+        return self.exit_code == 0 and not self.timed_out
+
+    def __str__(self):
+        if self.timed_out:
+            return self.stage + ' hook timed out after ' + str(self.secs) + ' secs: ' + self.command
+        return self.stage + ' hook exited with ' + str(self.exit_code) + ': ' + self.command + \
+            (' - ' + self.stderr.strip().splitlines()[-1] if self.stderr.strip() else '')
+
+    def to_dict(self):
+        return {'stage': self.stage, 'command': self.command, 'exit_code': self.exit_code, 'secs': self.secs,
+                'timed_out': self.timed_out, 'stdout': self.stdout, 'stderr': self.stderr}
+
+
+def _parse_hook(json_hook):
+    if isinstance(json_hook, str):
+        return Hook(json_hook) if json_hook.strip() else None
+    if isinstance(json_hook, dict) and isinstance(json_hook.get('command'), str):
+        timeout_secs = json_hook.get('timeout_secs')
+        try:
+            return Hook(json_hook['command'], float(timeout_secs) if timeout_secs is not None else None)
+        except (TypeError, ValueError) as e:
+            raise HookError('timeout_secs of hook ' + json_hook['command'] + ' must be a number') from e
+    raise HookError('hook must be a command or an object with a command, got: ' + str(json_hook))
+
+
+# Hooks of a 'before' / 'after' setting - a command, an object with a command or a list of them, empty commands are
+# left out
+def parse_hooks(json_hooks):
+    if not json_hooks:
+        return ()
+    json_hooks = json_hooks if isinstance(json_hooks, list) else [json_hooks]
+    return tuple(hook for hook in map(_parse_hook, json_hooks) if hook is not None)
+
+
+def _tail(text):
+    return text[-MAX_OUTPUT_CHARS:] if text else ''
+
+
+# Terminates the process group of a hook, killing it when it doesn't exit in time
+def _terminate(process):
+    if os.name != 'posix':
+        process.kill()
+        return
+    for sig, grace_secs in ((signal.SIGTERM, TERMINATE_GRACE_SECS), (signal.SIGKILL, None)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        if grace_secs is None:
+            return
+        try:
+            process.wait(grace_secs)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+
+
+def run_hook(hook, stage, default_timeout_secs=DEFAULT_TIMEOUT_SECS):
+    timeout_secs = hook.timeout_secs if hook.timeout_secs is not None else default_timeout_secs
+    start_time = time.time()
+    with span(stage + ' hook', HOOK, command=hook.command):
+        process = subprocess.Popen(hook.command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   errors='replace', start_new_session=True)
+        timed_out = False
+        try:
+            stdout, stderr = process.communicate(timeout=timeout_secs)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            _terminate(process)
+            try:
+                stdout, stderr = process.communicate(timeout=TERMINATE_GRACE_SECS)
+            except subprocess.TimeoutExpired:
+                # a process that left the process group still holds the pipes
+                stdout, stderr = '', ''
+                process.wait()
+    return HookResult(stage, hook.command, process.returncode, round(time.time() - start_time, 3), _tail(stdout),
+                      _tail(stderr), timed_out)
+
+
+# The hooks of a stage of a test case started together
+class HookBatch:
+    def __init__(self, stage, futures):
+        self.stage = stage
+        self.futures = futures
+
+    # Waits for all hooks, returns their results in the order they are declared
+    def wait(self):
+        return [future.result() for future in self.futures]
+
+    # Waits for all hooks and raises a HookError naming the hooks that failed
+    def check(self):
+        failed = [result for result in self.wait() if not result.is_ok]
+        if failed:
+            raise HookError('; '.join(map(str, failed)))
+
+
+# Runs every hook on a thread of its own, so that hooks never queue behind each other however many a test case has.
+# Hooks started after a batch wait for all hooks of that batch to finish before their command is run
+class HookRunner:
+    def __init__(self, default_timeout_secs=DEFAULT_TIMEOUT_SECS):
+        self.default_timeout_secs = default_timeout_secs
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _run(self, future, hook, stage, after):
+        if after is not None:
+            wait(after.futures)
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(run_hook(hook, stage, self.default_timeout_secs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def start(self, stage, hooks, after=None):
+        futures = []
+        for hook in hooks:
+            future = Future()
+            thread = threading.Thread(target=self._run, args=(future, hook, stage, after),
+                                      name='hook-' + stage, daemon=True)
+            with self._lock:
+                self._threads = [running for running in self._threads if running.is_alive()]
+                self._threads.append(thread)
+            thread.start()
+            futures.append(future)
+        return HookBatch(stage, futures)
+
+    # Waits for the hooks that are still running
+    def shutdown(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This incremental script selects the test cases a run has to execute. The digest of every test case - its json file,
+# the input, expected output and fixture files it references and the harness it runs in (processor specs and harness
+# modes) - is stored in a SQLite database with the registry flow id and version it ran against and its outcome. The
+# next run skips the test cases that passed with the same digest, flow id and version, and runs the ones that are new,
+# changed, failed before or whose flow version changed in flow_version_mapping. Flows without a version in
+# flow_version_mapping run the latest version, which can change without the mapping changing, so their test cases
+# always run. Flows without any test case to run are not deployed at all.
+
+import hashlib
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+
+from utils import file_name_with_path
+
+PASSED = 'PASSED'
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS test_selection (
+    flow TEXT NOT NULL,
+    test_case TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    flow_id TEXT,
+    flow_version TEXT,
+    result TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (flow, test_case)
+);
+'''
+
+
+@dataclass(slots=True)
+class Selection:
+    to_run: dict
+    skipped: dict
+    digests: dict
+
+    def skipped_count(self):
+        return sum(len(tc_names) for tc_names in self.skipped.values())
+
+
+def _update_with_file(digest, file_name):
+    with open(file_name, 'rb') as digest_file:
+        while chunk := digest_file.read(CHUNK_SIZE):
+            digest.update(chunk)
+
+
+# Digest of what a test case runs in besides its own files - harness spec files and the harness modes of the run
+def harness_fingerprint(spec_files, modes):
+    digest = hashlib.sha256()
+    for spec_file in spec_files:
+        digest.update(spec_file.encode('utf-8') + b'\0')
+        if os.path.isfile(spec_file):
+            _update_with_file(digest, spec_file)
+    digest.update(repr(sorted(modes.items())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Digest of a test case json file and the input, expected output, fixture and expected db rows files it references
+def test_case_digest(test_case, fingerprint):
+    digest = hashlib.sha256(fingerprint.encode('utf-8'))
+    for file_name in (test_case.file_name, test_case.input_file_name, test_case.expected_out_file_name,
+                      *(fixture.file_name for fixture in test_case.fixtures),
+                      *(db_assertion.file_name for db_assertion in test_case.db_assertions)):
+        # length prefixed, so that content can't shift from one file to the next
+        digest.update(str(len(file_name)).encode('utf-8') + b':' + file_name.encode('utf-8'))
+        if file_name:
+            path = file_name_with_path(test_case.tc_dir, file_name)
+            digest.update(str(os.path.getsize(path)).encode('utf-8') + b':')
+            _update_with_file(digest, path)
+    return digest.hexdigest()
+
+
+class TestSelectionCache:
+    def __init__(self, db_file_name):
+        self._connection = sqlite3.connect(db_file_name)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    # (flow, test case) -> (digest, flow id, flow version, result)
+    def entries(self):
+        return {(flow, test_case): (digest, flow_id, flow_version, result) for
+                flow, test_case, digest, flow_id, flow_version, result in self._connection.execute(
+                    'SELECT flow, test_case, digest, flow_id, flow_version, result FROM test_selection')}
+
+    # Records the outcome of the test cases that ran, rows of (flow, test case, digest, flow id, flow version, result)
+    def record(self, rows):
+        updated_at = time.time()
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO test_selection VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [row + (updated_at,) for row in rows])
+
+
+# Splits the test cases of every flow into the ones to run and the unchanged ones that passed before. With force
+# every test case runs, digests are still computed so that the outcome is recorded
+def select_test_cases(test_cases_by_flow, cache, flow_ids, flow_versions, fingerprint, force=False):
+    entries = {} if force else cache.entries()
+    selection = Selection({}, {}, {})
+    for flow_name, test_cases in test_cases_by_flow.items():
+        flow_version = flow_versions.get(flow_name)
+        flow_key = (flow_ids.get(flow_name), str(flow_version) if flow_version is not None else None)
+        for test_case in test_cases:
+            digest = test_case_digest(test_case, fingerprint)
+            selection.digests[(flow_name, test_case.name)] = digest
+            entry = entries.get((flow_name, test_case.name))
+            if entry is not None and None not in flow_key and entry == (digest, *flow_key, PASSED):
+                selection.skipped.setdefault(flow_name, []).append(test_case.name)
+            else:
+                selection.to_run.setdefault(flow_name, []).append(test_case)
+    return selection
+
+
+# Records the outcome of the test cases of the run, test cases of a flow whose setup failed are not recorded and run
+# again next time
+def record_selection(cache, flow_contexts, digests):
+    cache.record([(flow_ctx.flow_name, tc_name, digests[(flow_ctx.flow_name, tc_name)], flow_ctx.flow_id or None,
+                   str(flow_ctx.flow_version) if flow_ctx.flow_version is not None else None, tc_result)
+                  for flow_ctx in flow_contexts for tc_name, (tc_result, _) in flow_ctx.test_cases.items()
+                  if (flow_ctx.flow_name, tc_name) in digests])
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This readiness script waits for the flow unit test harness to be live instead of sleeping for a fixed time.
+# Conditions are polled with an adaptive backoff - first polls are quick so that a harness that is already up is
+# detected immediately, later polls back off so that a loaded node is not flooded with requests. Every wait is bounded
+# by a deadline and recorded with its duration.
+
+import socket
+import time
+
+from nipyapi import canvas, nifi
+
+from tracing import span, WAIT
+
+DEFAULT_DEADLINE_SECS = 60
+INITIAL_POLL_DELAY_SECS = 0.05
+MAX_POLL_DELAY_SECS = 1.0
+POLL_BACKOFF_FACTOR = 1.5
+SOCKET_CONNECT_TIMEOUT_SECS = 1
+
+
+class ReadinessTimeoutError(Exception):
+    pass
+
+
+class Readiness:
+    def __init__(self, deadline_secs=DEFAULT_DEADLINE_SECS):
+        self.deadline_secs = deadline_secs
+        # (description, seconds waited) of every wait, in order
+        self.waits = []
+
+    # Polls condition with adaptive backoff until it is true, raises ReadinessTimeoutError once the deadline passes
+    def wait_until(self, condition, description):
+        start_time = time.time()
+        delay = INITIAL_POLL_DELAY_SECS
+        with span('wait for ' + description, WAIT):
+            while not condition():
+                remaining = self.deadline_secs - (time.time() - start_time)
+                if remaining <= 0:
+                    raise ReadinessTimeoutError('Timed out after {} secs waiting for {}'.format(self.deadline_secs,
+                                                                                               description))
+                time.sleep(min(delay, remaining))
+                delay = min(delay * POLL_BACKOFF_FACTOR, MAX_POLL_DELAY_SECS)
+        waited = round(time.time() - start_time, 3)
+        self.waits.append((description, waited))
+        return waited
+
+    # Waits until NiFi has finished validating newly created or updated processors
+    def processors_validated(self, processors):
+        def _validated():
+            return all(canvas.get_processor(processor.id, 'id').component.validation_status != 'VALIDATING'
+                       for processor in processors)
+        return self.wait_until(_validated, 'processors to be validated')
+
+    # Waits until all processors are running
+    def processors_running(self, processors):
+        def _running():
+            return all(canvas.get_processor(processor.id, 'id').component.state == 'RUNNING'
+                       for processor in processors)
+        return self.wait_until(_running, 'processors to be running')
+
+    # Waits until all processors are stopped and have no active threads
+    def processors_stopped(self, processors):
+        def _stopped():
+            for processor in processors:
+                entity = canvas.get_processor(processor.id, 'id')
+                if entity.component.state == 'RUNNING' or entity.status.aggregate_snapshot.active_thread_count:
+                    return False
+            return True
+        return self.wait_until(_stopped, 'processors to be stopped')
+
+    # Waits until a controller service reaches the target state - ENABLED or DISABLED
+    def controller_state(self, controller, target_state):
+        def _in_state():
+            return canvas.get_controller(controller.id, 'id').component.state == target_state
+        return self.wait_until(_in_state, 'controller service ' + controller.component.name + ' to be ' +
+                               target_state.lower())
+
+    # Waits until every valid processor of a process group is running, invalid processors can never start
+    def process_group_running(self, pg_id):
+        def _running():
+            return not [processor for processor in canvas.list_all_processors(pg_id)
+                        if processor.component.state == 'STOPPED' and processor.component.validation_status == 'VALID']
+        return self.wait_until(_running, 'process group to be running')
+
+    # Waits until a process group has no active threads
+    def process_group_stopped(self, pg_id):
+        def _stopped():
+            pg_entity = nifi.ProcessGroupsApi().get_process_group(pg_id)
+            return pg_entity.status.aggregate_snapshot.active_thread_count == 0
+        return self.wait_until(_stopped, 'process group to be stopped')
+
+    # Waits until HandleHttpRequest accepts connections on its listening port
+    def port_listening(self, host, port):
+        def _listening():
+            try:
+                with socket.create_connection((host, int(port)), timeout=SOCKET_CONNECT_TIMEOUT_SECS):
+                    return True
+            except OSError:
+                return False
+        return self.wait_until(_listening, 'port ' + str(port) + ' to be listening')
+
+    def total_wait(self):
+        return round(sum(waited for _, waited in self.waits), 2)
@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This report writers script writes the results of a test run as a JUnit XML file, one testsuite per flow, for CI
+# systems to pick up, and as a JSON file that also holds the per phase durations of flow setup / teardown and of every
+# test case. Exit code, duration and output of the subprocess hooks of a test case are kept with it. Test cases that
+# incremental selection skipped are reported as skipped.
+
+import json
+import os
+import socket
+import time
+import xml.etree.ElementTree as ET
+
+PASSED = 'PASSED'
+FAILED = 'FAILED'
+SKIPPED_MESSAGE = 'unchanged and passed before (incremental selection)'
+
+
+def _secs(value):
+    return '{:.3f}'.format(value or 0)
+
+
+def _add_properties(element, phases, prefix):
+    if not phases:
+        return
+    properties = ET.SubElement(element, 'properties')
+    for phase_name, secs in phases.items():
+        ET.SubElement(properties, 'property', name=prefix + phase_name + '.secs', value=_secs(secs))
+
+
+# Output of the subprocess hooks of a test case as system-out / system-err of its JUnit testcase
+def _add_hook_output(element, hook_results):
+    for tag, stream in (('system-out', 'stdout'), ('system-err', 'stderr')):
+        text = ''.join('[{} hook: {}]\n{}'.format(result.stage, result.command, getattr(result, stream))
+                       for result in hook_results if getattr(result, stream))
+        if text:
+            ET.SubElement(element, tag).text = text
+
+
+def _add_skipped(test_suite, flow_name, tc_names):
+    for tc_name in tc_names:
+        test_case = ET.SubElement(test_suite, 'testcase', classname=flow_name, name=tc_name, time=_secs(0))
+        ET.SubElement(test_case, 'skipped', message=SKIPPED_MESSAGE)
+
+
+# Test cases skipped by incremental selection, flow name -> test case names, are reported as skipped testcases. A flow
+# whose test cases were all skipped gets a testsuite of its own
+def junit_xml(flow_contexts, wall_clock_duration, skipped=None):
+    skipped = skipped or {}
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    hostname = socket.gethostname()
+    skipped_count = sum(len(tc_names) for tc_names in skipped.values())
+    test_suites = ET.Element('testsuites', name='nifi flow unit tests', time=_secs(wall_clock_duration),
+                             tests=str(sum(len(flow_ctx.test_cases) for flow_ctx in flow_contexts) + skipped_count),
+                             failures=str(sum(1 for flow_ctx in flow_contexts for stats in flow_ctx.test_cases.values()
+                                              if stats[0] == FAILED)),
+                             errors=str(sum(1 for flow_ctx in flow_contexts if flow_ctx.setup_error is not None)),
+                             skipped=str(skipped_count))
+    for flow_ctx in flow_contexts:
+        failures = sum(1 for stats in flow_ctx.test_cases.values() if stats[0] == FAILED)
+        skipped_tc_names = skipped.get(flow_ctx.flow_name, ())
+        test_suite = ET.SubElement(test_suites, 'testsuite', name=flow_ctx.flow_name,
+                                   tests=str(len(flow_ctx.test_cases) + len(skipped_tc_names)), failures=str(failures),
+                                   errors='1' if flow_ctx.setup_error is not None else '0',
+                                   skipped=str(len(skipped_tc_names)), time=_secs(flow_ctx.total_duration),
+                                   timestamp=timestamp, hostname=hostname)
+        # flow setup / teardown phases are properties of the suite
+        _add_properties(test_suite, {'setup': flow_ctx.setup_duration, 'teardown': flow_ctx.teardown_duration,
+                                     **flow_ctx.phases}, 'flow.')
+        if flow_ctx.setup_error is not None:
+            setup_case = ET.SubElement(test_suite, 'testcase', classname=flow_ctx.flow_name, name='setup',
+                                       time=_secs(flow_ctx.setup_duration))
+            error = ET.SubElement(setup_case, 'error', message=flow_ctx.test_messages.get('', ''),
+                                  type=type(flow_ctx.setup_error).__name__)
+            error.text = str(flow_ctx.setup_error)
+        for tc_name, (tc_result, tc_duration) in flow_ctx.test_cases.items():
+            test_case = ET.SubElement(test_suite, 'testcase', classname=flow_ctx.flow_name, name=tc_name,
+                                      time=_secs(tc_duration))
+            _add_properties(test_case, flow_ctx.test_phases.get(tc_name), '')
+            if tc_result == FAILED:
+                message = flow_ctx.test_messages.get(tc_name, 'test case failed')
+                failure = ET.SubElement(test_case, 'failure', message=message, type=FAILED)
+                failure.text = message
+            _add_hook_output(test_case, flow_ctx.test_hooks.get(tc_name, ()))
+        _add_skipped(test_suite, flow_ctx.flow_name, skipped_tc_names)
+    tested_flow_names = {flow_ctx.flow_name for flow_ctx in flow_contexts}
+    for flow_name, skipped_tc_names in skipped.items():
+        if flow_name not in tested_flow_names:
+            test_suite = ET.SubElement(test_suites, 'testsuite', name=flow_name, tests=str(len(skipped_tc_names)),
+                                       failures='0', errors='0', skipped=str(len(skipped_tc_names)), time=_secs(0),
+                                       timestamp=timestamp, hostname=hostname)
+            _add_skipped(test_suite, flow_name, skipped_tc_names)
+    ET.indent(test_suites)
+    return ET.ElementTree(test_suites)
+
+
+def json_report(flow_contexts, wall_clock_duration, skipped=None):
+    flows = []
+    for flow_ctx in flow_contexts:
+        flows.append({
+            'flow': flow_ctx.flow_name,
+            'flow_version': flow_ctx.flow_version,
+            'result': flow_ctx.test_result,
+            'setup_error': str(flow_ctx.setup_error) if flow_ctx.setup_error is not None else None,
+            'setup_secs': round(flow_ctx.setup_duration, 3),
+            'teardown_secs': round(flow_ctx.teardown_duration, 3),
+            'total_secs': round(flow_ctx.total_duration, 3),
+            'phases': flow_ctx.phases,
+            'test_cases': [{'name': tc_name, 'result': tc_result, 'secs': tc_duration,
+                            'phases': flow_ctx.test_phases.get(tc_name, {}),
+                            'message': flow_ctx.test_messages.get(tc_name),
+                            'hooks': [result.to_dict() for result in flow_ctx.test_hooks.get(tc_name, ())]}
+                           for tc_name, (tc_result, tc_duration) in flow_ctx.test_cases.items()]})
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'wall_clock_secs': round(wall_clock_duration, 3),
+            'result': 'SUCCESS' if all(flow['result'] == 'SUCCESS' for flow in flows) else 'FAILURE',
+            'flows': flows, 'skipped_test_cases': skipped or {}}
+
+
+# Writes junit-<stamp>.xml and report-<stamp>.json to report_dir
+def write_reports(report_dir, flow_contexts, wall_clock_duration, skipped=None):
+    os.makedirs(report_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    junit_file_name = os.path.join(report_dir, 'junit-' + stamp + '.xml')
+    junit_xml(flow_contexts, wall_clock_duration, skipped).write(junit_file_name, encoding='utf-8',
+                                                                 xml_declaration=True)
+    json_file_name = os.path.join(report_dir, 'report-' + stamp + '.json')
+    with open(json_file_name, 'w') as json_file:
+        json.dump(json_report(flow_contexts, wall_clock_duration, skipped), json_file, indent=2, default=str)
+    print('Reports written to:', os.path.abspath(junit_file_name), os.path.abspath(json_file_name))
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This resource ledger script records every NiFi component a run creates - process groups, controller services, ports,
+# parameter contexts, templates and the registry client - so that teardown deletes only those and leaves components of
+# other users of a shared NiFi alone. Components inside a recorded process group are deleted with it. Teardown goes
+# through the kinds in dependency order, components of the same kind are deleted concurrently.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from nipyapi import canvas, parameters, templates, versioning, nifi
+
+from flow_utils import delete_process_group, schedule_controller, lookup_cache
+
+TEMPLATE = 'template'
+PROCESS_GROUP = 'process group'
+CONTROLLER_SERVICE = 'controller service'
+PORT = 'port'
+PARAMETER_CONTEXT = 'parameter context'
+REGISTRY_CLIENT = 'registry client'
+# Templates don't depend on anything, parameter contexts can only be deleted once no process group is bound to them
+# and the registry client once no process group is under its version control
+TEARDOWN_ORDER = (TEMPLATE, PROCESS_GROUP, CONTROLLER_SERVICE, PORT, PARAMETER_CONTEXT, REGISTRY_CLIENT)
+TEARDOWN_CONCURRENCY = 8
+
+
+@dataclass(slots=True)
+class Resource:
+    kind: str
+    id: str
+    name: str
+    # process group the resource was created in, None for resources outside of recorded process groups
+    parent_pg_id: str = None
+    entity: object = None
+
+
+class ResourceLedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resources = {}
+
+    def _record(self, kind, entity_id, name, parent_pg_id, entity=None):
+        with self._lock:
+            self._resources[entity_id] = Resource(kind, entity_id, name, parent_pg_id, entity)
+
+    def add_process_group(self, pg, parent_pg_id=None):
+        self._record(PROCESS_GROUP, pg.id, pg.component.name, parent_pg_id)
+
+    def add_controller_service(self, controller, parent_pg_id=None):
+        self._record(CONTROLLER_SERVICE, controller.id, controller.component.name, parent_pg_id)
+
+    def add_port(self, port, parent_pg_id=None):
+        self._record(PORT, port.id, port.component.name, parent_pg_id, port)
+
+    def add_parameter_context(self, context_id, name=''):
+        self._record(PARAMETER_CONTEXT, context_id, name, None)
+
+    def add_template(self, template_id, name=''):
+        self._record(TEMPLATE, template_id, name, None)
+
+    def add_registry_client(self, client):
+        self._record(REGISTRY_CLIENT, client.id, client.component.name, None)
+
+    # Forgets a resource that was deleted or handed over outside of the ledger
+    def remove(self, entity_id):
+        with self._lock:
+            self._resources.pop(entity_id, None)
+
+    def ids(self, kind):
+        with self._lock:
+            return [resource.id for resource in self._resources.values() if resource.kind == kind]
+
+    # Deletes all recorded resources, kind by kind. Resources inside a recorded process group are deleted with it
+    def teardown(self, readiness):
+        with self._lock:
+            resources = list(self._resources.values())
+            self._resources.clear()
+        recorded_pg_ids = {resource.id for resource in resources if resource.kind == PROCESS_GROUP}
+        top_level = [resource for resource in resources if resource.parent_pg_id not in recorded_pg_ids]
+
+        with ThreadPoolExecutor(max_workers=TEARDOWN_CONCURRENCY) as executor:
+            for kind in TEARDOWN_ORDER:
+                of_kind = [resource for resource in top_level if resource.kind == kind]
+                for resource in of_kind:
+                    print('Deleting', kind + ':', resource.name or resource.id)
+                # list() re-raises the first failure before the next kind is touched
+                list(executor.map(lambda resource: _delete(resource, readiness), of_kind))
+
+
+def _delete(resource, readiness):
+    if resource.kind == TEMPLATE:
+        templates.delete_template(resource.id)
+    elif resource.kind == PROCESS_GROUP:
+        delete_process_group(resource.id, readiness)
+    elif resource.kind == CONTROLLER_SERVICE:
+        controller = schedule_controller(canvas.get_controller(resource.id, 'id'), False, readiness)
+        canvas.delete_controller(controller, True)
+        lookup_cache.invalidate(pg_id=resource.parent_pg_id)
+    elif resource.kind == PORT:
+        if 'INPUT' in resource.entity.port_type:
+            port = nifi.InputPortsApi().get_input_port(resource.id)
+        else:
+            port = nifi.OutputPortsApi().get_output_port(resource.id)
+        canvas.delete_port(port)
+    elif resource.kind == PARAMETER_CONTEXT:
+        delete_parameter_context(resource.id)
+    elif resource.kind == REGISTRY_CLIENT:
+        versioning.delete_registry_client(versioning.get_registry_client(resource.id, 'id'))
+
+
+# Deletes a parameter context created by the run, unless a process group of another flow got bound to it meanwhile
+def delete_parameter_context(context_id):
+    context = parameters.get_parameter_context(context_id, 'id')
+    if context.component.bound_process_groups:
+        print('Keeping parameter context still in use:', context.component.name)
+        return
+    parameters.delete_parameter_context(context, True)
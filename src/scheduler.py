@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This scheduler script orders flows by their expected cost, longest first (LPT scheduling), so that long flows don't
+# start last and stretch the run when flows run in parallel. The same ordering splits the suite into N balanced shards
+# for several CI workers or NiFi instances - each flow goes to the shard with the least expected cost so far.
+# The cost of a flow is its median setup / teardown secs plus the median secs of its test cases taken from the
+# history database. Without history the cost is estimated from the number of test cases and the size of their files.
+# Shards are only the same on every worker when all workers see the same history (or none).
+
+import os
+import re
+from dataclasses import dataclass
+
+from history_store import HistoryStore
+
+# estimates used for flows and test cases without history
+DEFAULT_FLOW_OVERHEAD_SECS = 10.0
+DEFAULT_TEST_CASE_SECS = 2.0
+# secs per byte of test case files, input and expected output files are read, sent and compared
+DEFAULT_SECS_PER_BYTE = 1 / (10 * 1024 * 1024)
+HISTORY_WINDOW = 10
+SHARD_PATTERN = re.compile(r'^(\d+)/(\d+)$')
+
+
+class ShardError(ValueError):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class Shard:
+    index: int
+    count: int
+
+    # Parses i/N with 1 <= i <= N
+    @staticmethod
+    def parse(value):
+        match = SHARD_PATTERN.match(value or '')
+        if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+            raise ShardError('Shard must be i/N with 1 <= i <= N, got: ' + str(value))
+        return Shard(int(match.group(1)), int(match.group(2)))
+
+
+# Size of a test case json file and of the input / expected output files next to it, which begin with the test case
+# name (eg: validate_tc1.json, validate_tc1_input.txt, validate_tc1_output.txt)
+def _test_case_bytes(test_file):
+    prefix = test_file.stem + '_'
+    try:
+        return test_file.stat().st_size + sum(entry.stat().st_size for entry in os.scandir(test_file.parent)
+                                              if entry.is_file() and entry.name.startswith(prefix))
+    except OSError:
+        return 0
+
+
+class CostModel:
+    def __init__(self, flow_overheads=None, test_durations=None):
+        self.flow_overheads = flow_overheads or {}
+        self.test_durations = test_durations or {}
+
+    # Reads the medians of the last runs from the history database, a missing database means no history
+    @staticmethod
+    def from_history(db_file_name, window=HISTORY_WINDOW):
+        if not db_file_name or not os.path.exists(db_file_name):
+            return CostModel()
+        store = HistoryStore(db_file_name)
+        try:
+            return CostModel(store.flow_overheads(window), store.test_durations(window))
+        finally:
+            store.close()
+
+    def test_case_cost(self, flow_name, test_file):
+        known = self.test_durations.get((flow_name, test_file.stem))
+        if known is not None:
+            return known
+        return DEFAULT_TEST_CASE_SECS + _test_case_bytes(test_file) * DEFAULT_SECS_PER_BYTE
+
+    def flow_cost(self, flow_name, test_files):
+        return self.flow_overheads.get(flow_name, DEFAULT_FLOW_OVERHEAD_SECS) + \
+            sum(self.test_case_cost(flow_name, test_file) for test_file in test_files)
+
+
+# Flows by expected cost, longest first, flow name breaks ties so that the order is stable
+def order_flows(tests_by_flow, cost_model):
+    costs = {flow_name: cost_model.flow_cost(flow_name, test_files) for flow_name, test_files in tests_by_flow.items()}
+    return {flow_name: tests_by_flow[flow_name]
+            for flow_name in sorted(costs, key=lambda flow_name: (-costs[flow_name], flow_name))}, costs
+
+
+# Assigns flows longest first to the shard with the least expected cost so far, returns the flows of the given shard
+# in longest first order
+def shard_flows(tests_by_flow, cost_model, shard):
+    ordered, costs = order_flows(tests_by_flow, cost_model)
+    loads = [0.0] * shard.count
+    assigned = []
+    for flow_name in ordered:
+        target = min(range(shard.count), key=lambda index: (loads[index], index))
+        loads[target] += costs[flow_name]
+        if target == shard.index - 1:
+            assigned.append(flow_name)
+    return {flow_name: ordered[flow_name] for flow_name in assigned}, loads
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This test loader script loads all test cases up front, before any flow is deployed. The configured JSONPaths are
+# compiled once, test case json files and the input / output files they reference are loaded and validated in a thread
+# pool into compact TestCase records, so that a malformed test case is found before an expensive flow setup.
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from jsonpath_ng import parse
+
+from db_utils.assertions import parse_db_assertions
+from db_utils.fixtures import FixtureError, parse_fixtures
+from hooks import HookError
+from utils import TestContext, file_name_with_path
+
+TEST_CASE_FILE_EXTENSION = '.json'
+EXPECTED_OUTPUT_DB_JSONPATH = '$.expected_output.db'
+DEFAULT_LOADER_WORKERS = 8
+
+
+class TestCaseError(Exception):
+    pass
+
+
+# JSONPaths of the test case json, compiled once for the whole run
+@dataclass(slots=True)
+class TestPaths:
+    input_attribs: object
+    expected_out_attribs: object
+    input_file_name: object
+    expected_out_file_name: object
+    expected_out_db: object
+
+    def __init__(self, input_attribs_jsonpath, expected_out_attribs_jsonpath, input_file_name_jsonpath,
+                 expected_out_file_name_jsonpath, expected_out_db_jsonpath=EXPECTED_OUTPUT_DB_JSONPATH):
+        self.input_attribs = parse(input_attribs_jsonpath)
+        self.expected_out_attribs = parse(expected_out_attribs_jsonpath)
+        self.input_file_name = parse(input_file_name_jsonpath)
+        self.expected_out_file_name = parse(expected_out_file_name_jsonpath)
+        self.expected_out_db = parse(expected_out_db_jsonpath)
+
+
+# this object keeps a loaded and validated test case
+@dataclass(slots=True)
+class TestCase:
+    name: str
+    tc_dir: str
+    file_name: str
+    context: TestContext
+    input_attribs: dict
+    expected_out_attribs: dict
+    input_file_name: str
+    expected_out_file_name: str
+    # database fixtures loaded before the test request
+    fixtures: tuple = ()
+    # expected state of database tables after the test request
+    db_assertions: tuple = ()
+
+    @property
+    def json_data(self):
+        return self.context.json_data
+
+
+def _find_value(path, json_data, description):
+    found = path.find(json_data)
+    if not found:
+        raise TestCaseError('missing ' + description + ' ' + str(path))
+    return found[0].value
+
+
+def _check_referenced_file(tc_dir, file_name, description):
+    if not isinstance(file_name, str):
+        raise TestCaseError(description + ' file name must be a string')
+    if file_name != '':
+        path = file_name_with_path(tc_dir, file_name)
+        if not os.path.isfile(path) or not os.access(path, os.R_OK):
+            raise TestCaseError(description + ' file ' + file_name + ' not found or not readable')
+
+
+# Loads and validates a single test case json file and the files it references
+def load_test_case(file, test_paths):
+    tc_dir = Path(os.path.abspath(file.parent)).as_posix()
+    with open(file_name_with_path(tc_dir, file.name), 'r') as json_file:
+        try:
+            json_data = json.load(json_file)
+        except json.JSONDecodeError as e:
+            raise TestCaseError('invalid json: ' + str(e)) from e
+
+    input_attribs = _find_value(test_paths.input_attribs, json_data, 'input attributes')
+    expected_out_attribs = _find_value(test_paths.expected_out_attribs, json_data, 'expected output attributes')
+    if not isinstance(input_attribs, dict) or not isinstance(expected_out_attribs, dict):
+        raise TestCaseError('input and expected output attributes must be json objects')
+    input_file_name = _find_value(test_paths.input_file_name, json_data, 'input file name')
+    expected_out_file_name = _find_value(test_paths.expected_out_file_name, json_data, 'expected output file name')
+    _check_referenced_file(tc_dir, input_file_name, 'input')
+    _check_referenced_file(tc_dir, expected_out_file_name, 'expected output')
+    try:
+        fixtures = parse_fixtures(json_data)
+        db_assertions = parse_db_assertions(test_paths.expected_out_db, json_data)
+    except FixtureError as e:
+        raise TestCaseError('invalid fixtures or db assertions: ' + str(e)) from e
+    for fixture in fixtures:
+        _check_referenced_file(tc_dir, fixture.file_name, 'fixture')
+    for db_assertion in db_assertions:
+        _check_referenced_file(tc_dir, db_assertion.file_name, 'expected db rows')
+    try:
+        test_context = TestContext(json_data)
+    except HookError as e:
+        raise TestCaseError('invalid subprocess hooks: ' + str(e)) from e
+
+    return TestCase(file.name[0:-len(TEST_CASE_FILE_EXTENSION)], tc_dir, file.name, test_context,
+                    input_attribs, expected_out_attribs, input_file_name, expected_out_file_name, fixtures,
+                    db_assertions)
+
+
+# Loads test case files in a thread pool, returns loaded test cases in the order of files and (file, error) of the
+# test cases that are invalid
+def load_test_cases(files, test_paths, max_workers=DEFAULT_LOADER_WORKERS):
+    def _load(file):
+        try:
+            return load_test_case(file, test_paths), None
+        except (TestCaseError, OSError, UnicodeDecodeError, AttributeError) as e:
+            return None, (file, str(e))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as loader_executor:
+        results = list(loader_executor.map(_load, files))
+    test_cases = [test_case for test_case, _ in results if test_case is not None]
+    errors = [error for _, error in results if error is not None]
+    return test_cases, errors
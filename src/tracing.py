@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This tracing script records nested spans of a test run - flow setup and teardown, test case phases, readiness waits,
+# subprocess hooks, every nipyapi canvas / versioning / parameters / templates call and every NiFi and Registry REST
+# call underneath. Spans nest per thread. At the end of the run the spans are exported as a Chrome trace (open in
+# chrome://tracing or Perfetto), as an OTLP json file and as a latency histogram per REST operation.
+# Tracing is off unless trace_dir is set, a disabled tracer only costs an attribute check per span.
+
+import bisect
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from nipyapi import canvas, versioning, parameters, templates, nifi, registry
+
+# span categories
+FLOW = 'flow'
+TEST_CASE = 'test case'
+WAIT = 'wait'
+HOOK = 'hook'
+NIPYAPI = 'nipyapi'
+REST = 'rest'
+HTTP = 'http'
+# upper bounds (ms) of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+INSTRUMENTED_MODULES = (canvas, versioning, parameters, templates)
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    category: str
+    span_id: int
+    parent_id: int
+    thread_id: int
+    thread_name: str
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.trace_id = os.urandom(16).hex()
+        self._lock = threading.Lock()
+        self._spans = []
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, category, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        current_thread = threading.current_thread()
+        span = Span(name, category, next(self._ids), stack[-1].span_id if stack else 0, current_thread.ident,
+                    current_thread.name, time.time_ns(), attributes=attributes)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes['error'] = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            stack.pop()
+            with self._lock:
+                self._spans.append(span)
+
+    def spans(self):
+        with self._lock:
+            return sorted(self._spans, key=lambda span: span.start_ns)
+
+
+tracer = Tracer()
+
+
+def span(name, category, **attributes):
+    return tracer.span(name, category, **attributes)
+
+
+# Span that also adds its duration (secs) to the phases dict, phase durations are kept for the reports and the timing
+# history whether tracing is enabled or not
+@contextmanager
+def phase(phases, name, category, **attributes):
+    start_time = time.time()
+    try:
+        with tracer.span(name, category, **attributes):
+            yield
+    finally:
+        phases[name] = round(phases.get(name, 0) + time.time() - start_time, 3)
+
+
+def _traced_function(module_name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not tracer.enabled:
+            return function(*args, **kwargs)
+        with tracer.span(module_name + '.' + function.__name__, NIPYAPI):
+            return function(*args, **kwargs)
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def _traced_call_api(service, call_api):
+    @functools.wraps(call_api)
+    def wrapper(self, resource_path, method, *args, **kwargs):
+        if not tracer.enabled:
+            return call_api(self, resource_path, method, *args, **kwargs)
+        with tracer.span(method + ' ' + resource_path, REST, service=service):
+            return call_api(self, resource_path, method, *args, **kwargs)
+    wrapper.__traced__ = True
+    return wrapper
+
+
+# Enables tracing and wraps the nipyapi module functions and REST clients, calls made through the modules anywhere in
+# the harness are traced from then on
+def enable_tracing():
+    tracer.enabled = True
+    for module in INSTRUMENTED_MODULES:
+        module_name = module.__name__.rsplit('.', 1)[-1]
+        for name, function in list(vars(module).items()):
+            if inspect.isfunction(function) and function.__module__ == module.__name__ and \
+                    not getattr(function, '__traced__', False):
+                setattr(module, name, _traced_function(module_name, function))
+    for service, api_client_class in (('nifi', nifi.ApiClient), ('registry', registry.ApiClient)):
+        if not getattr(api_client_class.call_api, '__traced__', False):
+            api_client_class.call_api = _traced_call_api(service, api_client_class.call_api)
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# Latency histogram per REST operation (method and resource path), sorted by total time spent
+def api_latency_histogram(spans):
+    durations = {}
+    for rest_span in spans:
+        if rest_span.category == REST:
+            durations.setdefault(rest_span.name, []).append(rest_span.duration_ms())
+    histogram = []
+    for operation, values in durations.items():
+        values.sort()
+        buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for value in values:
+            buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, value)] += 1
+        histogram.append({'operation': operation, 'count': len(values), 'total_ms': round(sum(values), 3),
+                          'p50_ms': round(_percentile(values, 0.5), 3), 'p90_ms': round(_percentile(values, 0.9), 3),
+                          'p99_ms': round(_percentile(values, 0.99), 3), 'max_ms': round(values[-1], 3),
+                          'buckets_ms': dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf'], buckets))})
+    return sorted(histogram, key=lambda entry: entry['total_ms'], reverse=True)
+
+
+def chrome_trace(spans):
+    pid = os.getpid()
+    thread_ids = {}
+    events = []
+    for trace_span in spans:
+        if trace_span.thread_id not in thread_ids:
+            thread_ids[trace_span.thread_id] = len(thread_ids) + 1
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_ids[trace_span.thread_id],
+                           'args': {'name': trace_span.thread_name}})
+        events.append({'name': trace_span.name, 'cat': trace_span.category, 'ph': 'X', 'pid': pid,
+                       'tid': thread_ids[trace_span.thread_id], 'ts': trace_span.start_ns / 1000,
+                       'dur': (trace_span.end_ns - trace_span.start_ns) / 1000,
+                       'args': {key: str(value) for key, value in trace_span.attributes.items()}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def otlp_trace(spans, trace_id):
+    def _attribute(key, value):
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    otlp_spans = []
+    for trace_span in spans:
+        otlp_span = {'traceId': trace_id, 'spanId': '{:016x}'.format(trace_span.span_id), 'name': trace_span.name,
+                     'kind': 3 if trace_span.category == REST else 1,
+                     'startTimeUnixNano': str(trace_span.start_ns), 'endTimeUnixNano': str(trace_span.end_ns),
+                     'attributes': [_attribute('category', trace_span.category),
+                                    _attribute('thread.name', trace_span.thread_name)] +
+                                   [_attribute(key, value) for key, value in trace_span.attributes.items()]}
+        if trace_span.parent_id:
+            otlp_span['parentSpanId'] = '{:016x}'.format(trace_span.parent_id)
+        if 'error' in trace_span.attributes:
+            otlp_span['status'] = {'code': 2, 'message': trace_span.attributes['error']}
+        otlp_spans.append(otlp_span)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_attribute('service.name', 'nifi-flow-unit-test')]},
+        'scopeSpans': [{'scope': {'name': 'nifi-testing'}, 'spans': otlp_spans}]}]}
+
+
+# Writes the Chrome trace, the OTLP json file and the API latency histogram to trace_dir and prints the operations
+# that took most of the time
+def export_traces(trace_dir, top=15):
+    spans = tracer.spans()
+    if not spans:
+        return
+    Path(trace_dir).mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    histogram = api_latency_histogram(spans)
+    for file_name, content in (('trace-' + stamp + '.chrome.json', chrome_trace(spans)),
+                               ('trace-' + stamp + '.otlp.json', otlp_trace(spans, tracer.trace_id)),
+                               ('api-latency-' + stamp + '.json', histogram)):
+        with open(os.path.join(trace_dir, file_name), 'w') as trace_file:
+            json.dump(content, trace_file)
+
+    print(' ')
+    print('===== API Latency (top', top, 'by total time) =====')
+    print('{:<70} {:>6} {:>10} {:>8} {:>8} {:>8}'.format('operation', 'count', 'total_ms', 'p50_ms', 'p90_ms',
+                                                        'max_ms'))
+    for entry in histogram[:top]:
+        print('{:<70} {:>6} {:>10} {:>8} {:>8} {:>8}'.format(entry['operation'][:70], entry['count'],
+                                                            entry['total_ms'], entry['p50_ms'], entry['p90_ms'],
+                                                            entry['max_ms']))
+    print('Traces written to:', os.path.abspath(trace_dir))
@@ -7,20 +7,30 @@
 
 # This utils script has all the convenience helper / util functions
 
+import mmap
 import os
+import queue
+import re
 import shutil
-import subprocess
-import base64
-import hvac
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
 
-from git import Repo
+import requests
+from git import GitCommandError, Repo
 from jsonpath_ng import parse
+from requests.adapters import HTTPAdapter
+from hooks import parse_hooks
+from vault_transit import encrypt_values, decrypt_values
 
 WINDOWS_LINE_ENDING = '\r\n'
 UNIX_LINE_ENDING = '\n'
+STREAM_CHUNK_SIZE = 64 * 1024
+# files from this size on are memory mapped instead of read into a buffer when streamed
+STREAM_MMAP_THRESHOLD = 1024 * 1024
+# a pinned ref of the external test data repo matching this is taken as a commit
+COMMIT_SHA_PATTERN = re.compile(r'^[0-9a-f]{7,40}$')
 
 
 class FileContentType(Enum):
@@ -51,15 +61,88 @@ class TestContext:
         else:
             self.subprocess = self.Subprocess({})
 
-    # create subprocess inner class
+    # create subprocess inner class, before / after are hooks.Hook tuples (a command or a list of commands)
     class Subprocess(object):
-        before_command: str = ''
-        after_command: str = ''
+        before: tuple = ()
+        after: tuple = ()
 
         def __init__(self, json_settings):
             if json_settings:
-                self.before_command = get_value_or_default(json_settings, '$.before', '')
-                self.after_command = get_value_or_default(json_settings, '$.after', '')
+                self.before = parse_hooks(get_value_or_default(json_settings, '$.before', ''))
+                self.after = parse_hooks(get_value_or_default(json_settings, '$.after', ''))
+
+
+# this object keeps the harness components deployed around a flow under test between test cases, it is used when
+# the harness is reconciled in place instead of being rebuilt for every test case
+@dataclass
+class HarnessState:
+    processors: dict = field(default_factory=dict)
+    # properties last applied to each processor
+    properties: dict = field(default_factory=dict)
+    # (from, to) -> connection
+    connections: dict = field(default_factory=dict)
+    running: set = field(default_factory=set)
+    pg_running: bool = False
+
+
+# this object keeps the state of a flow under test - its test container process group, the deployed flow, the harness
+# components wired around it and the results of its test cases. Each flow gets its own instance so that flows can be
+# set up, tested and torn down concurrently without sharing any module globals
+@dataclass
+class FlowContext:
+    flow_name: str
+    test_api_port: str
+    nifi_test_api: str
+    flow_id: str = ''
+    flow_version: int = None
+    parent_pg: object = None
+    parent_pg_id: str = ''
+    context_map: object = None
+    deployed_pg: object = None
+    # components created for the flow, deleted on teardown
+    ledger: object = None
+    input_port: object = None
+    output_port: object = None
+    test_cases: dict = field(default_factory=dict)
+    readiness: object = None
+    harness: HarnessState = field(default_factory=HarnessState)
+    setup_duration: float = 0
+    teardown_duration: float = 0
+    total_duration: float = 0
+    test_result: str = 'SUCCESS'
+    # exception a failed setup raised, test cases of the flow are not run
+    setup_error: object = None
+    # secs spent in the phases of flow setup / teardown, of each test case and why a test case failed
+    phases: dict = field(default_factory=dict)
+    test_phases: dict = field(default_factory=dict)
+    test_messages: dict = field(default_factory=dict)
+    # results of the subprocess hooks of each test case and the after hooks of a test case still running
+    test_hooks: dict = field(default_factory=dict)
+    after_hooks: tuple = None
+
+
+# requests session that keeps up to pool_size connections per host alive, so that test requests reuse connections
+# instead of opening a new one per request
+def pooled_http_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Thread safe pool of HandleHttpRequest listening ports, a port is held by a flow from its setup until its teardown
+class PortPool:
+    def __init__(self, ports):
+        self._ports = queue.Queue()
+        for port in ports:
+            self._ports.put(port)
+
+    def acquire(self):
+        return self._ports.get()
+
+    def release(self, port):
+        self._ports.put(port)
 
 
 def git_clone(git_url, repo_dir):
@@ -68,6 +151,54 @@ def git_clone(git_url, repo_dir):
     Repo.clone_from(git_url, repo_dir)
 
 
+# Keeps a persistent local mirror of the external test data repo in repo_dir and brings it to ref (branch, tag or
+# commit, the default branch of the remote when empty) with an incremental fetch instead of a fresh clone. depth > 0
+# fetches shallow history. sparse_paths limits the checkout to these directories, a new mirror is then a partial clone
+# that only fetches the blobs of checked out files. Nothing is fetched when ref is the commit already checked out.
+# Returns the checked out commit
+def git_sync(git_url, repo_dir, ref='', depth=0, sparse_paths=None):
+    repo = _open_mirror(git_url, repo_dir, sparse_paths)
+    if sparse_paths:
+        repo.git.sparse_checkout('set', '--cone', *sparse_paths)
+    elif repo.git.config('--type=bool', '--default=false', '--get', 'core.sparseCheckout') == 'true':
+        repo.git.sparse_checkout('disable')
+    is_commit = COMMIT_SHA_PATTERN.match(ref) is not None
+    if is_commit and repo.head.is_valid() and repo.head.commit.hexsha.startswith(ref):
+        return repo.head.commit.hexsha
+
+    fetch_args = ['--prune', '--no-tags']
+    if depth > 0:
+        fetch_args.append('--depth=' + str(depth))
+    try:
+        repo.git.fetch(*fetch_args, 'origin', ref or 'HEAD')
+        target = 'FETCH_HEAD'
+    except GitCommandError:
+        if not is_commit:
+            raise
+        # Remotes that don't serve commits by (abbreviated) sha, fetch the branches and look the commit up locally
+        repo.git.fetch(*fetch_args, 'origin')
+        target = ref
+    repo.git.checkout('--force', '--detach', target)
+    return repo.head.commit.hexsha
+
+
+# Opens the mirror in repo_dir if it tracks git_url, otherwise replaces repo_dir with an empty repo tracking git_url
+def _open_mirror(git_url, repo_dir, sparse_paths):
+    if os.path.isdir(os.path.join(repo_dir, '.git')):
+        repo = Repo(repo_dir)
+        if 'origin' in repo.remotes and repo.remotes.origin.url == git_url:
+            return repo
+    if os.path.exists(repo_dir) and os.path.isdir(repo_dir):
+        shutil.rmtree(repo_dir)
+    repo = Repo.init(repo_dir)
+    repo.create_remote('origin', git_url)
+    if sparse_paths:
+        with repo.config_writer() as writer:
+            writer.set_value('remote "origin"', 'promisor', 'true')
+            writer.set_value('remote "origin"', 'partialclonefilter', 'blob:none')
+    return repo
+
+
 def read_file_content(file_name, mode=FileContentType.TEXT):
     # Type checking
     if not isinstance(mode, FileContentType):
@@ -83,8 +214,52 @@ def read_file_content(file_name, mode=FileContentType.TEXT):
     return content
 
 
+# JSONPath expressions are compiled once and reused
+@lru_cache(maxsize=None)
+def compiled_jsonpath(path):
+    return parse(path)
+
+
+# Yields file content in chunks of bytes without holding the whole file in memory, files of STREAM_MMAP_THRESHOLD and
+# more are memory mapped. In TEXT mode line endings are converted to Unix ones like reading in text mode does for
+# read_file_content, a '\r' at the end of a chunk is held back until the next chunk shows whether it is part of a '\r\n'
+def iter_file_chunks(file_name, mode=FileContentType.TEXT, chunk_size=STREAM_CHUNK_SIZE):
+    # Type checking
+    if not isinstance(mode, FileContentType):
+        raise TypeError('mode must be an instance of FileContentType Enum')
+
+    with open(file_name, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        if size >= STREAM_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                raw_chunks = (mapped[offset:offset + chunk_size] for offset in range(0, size, chunk_size))
+                yield from normalized_chunks(raw_chunks, mode)
+        else:
+            yield from normalized_chunks(iter(lambda: f.read(chunk_size), b''), mode)
+
+
+# Converts line endings of a stream of chunks to Unix ones in TEXT mode, BINARY chunks are passed through
+def normalized_chunks(raw_chunks, mode):
+    if mode == FileContentType.BINARY:
+        yield from raw_chunks
+        return
+    windows, unix, mac = WINDOWS_LINE_ENDING.encode(), UNIX_LINE_ENDING.encode(), b'\r'
+    pending = b''
+    for chunk in raw_chunks:
+        chunk = pending + chunk
+        pending = b''
+        if chunk.endswith(mac):
+            chunk, pending = chunk[:-1], mac
+        if chunk:
+            yield chunk.replace(windows, unix).replace(mac, unix)
+    if pending:
+        yield unix
+
+
 def get_value_or_default(json_data, path, default):
-    parsed = parse(path).find(json_data)
+    parsed = compiled_jsonpath(path).find(json_data)
     return parsed[0].value if parsed else default
 
 
@@ -104,44 +279,26 @@ def csv_to_list (csv_string):
     return list(filter(None, [x.strip() for x in csv_string.split(',')]))
 
 
-def run_subprocess(command):
-    """Run command  wait for command to complete or
-    timeout, then returns the and return a CompletedProcess instance.
-
-    It raises a CalledProcessError if the command returns a return code not zero or if stderr is not empty
-    """
-    if len(command) > 0:
-        completed_process = subprocess.run(command, shell=True, capture_output=True, text=True, check=True)
-        if completed_process.returncode != 0:
-            print("run script error: "+completed_process.stderr)
+# Expands a csv of ports and port ranges eg: '9091-9093,9095' into ['9091', '9092', '9093', '9095']
+def csv_to_port_list(csv_string):
+    ports = []
+    for item in csv_to_list(csv_string):
+        if '-' in item:
+            first, last = (int(x) for x in item.split('-', 1))
+            ports.extend(str(port) for port in range(first, last + 1))
+        else:
+            ports.append(item)
+    return ports
 
 
+# Encrypts one value with Vault transit, see vault_transit.encrypt_values to encrypt many values in one request
 def encrypt_data(vault_url, transit_path, key_name, token, plaintext):
-    client = hvac.Client(url=vault_url, token=token)
-
-    encrypt_data_response = client.secrets.transit.encrypt_data(
-        name=key_name,
-        plaintext=base64.b64encode(plaintext.encode()).decode(),
-        mount_point=transit_path,
-    )
-
-    ciphertext = encrypt_data_response['data']['ciphertext']
-    print('Encrypted ciphertext is: {cipher}'.format(cipher=ciphertext))
-    return ciphertext
+    return encrypt_values(vault_url, transit_path, key_name, token, [plaintext])[0]
 
 
+# Decrypts one value with Vault transit, cached plaintexts are returned without calling Vault
 def decrypt_data(vault_url, transit_path, key_name, token, ciphertext):
-    client = hvac.Client(url=vault_url, token=token)
-
-    decrypt_data_response = client.secrets.transit.decrypt_data(
-        name=key_name,
-        ciphertext=ciphertext,
-        mount_point=transit_path,
-    )
-    plaintext_encoded = decrypt_data_response['data']['plaintext']
-    plaintext = base64.b64decode(plaintext_encoded).decode()
-    print('Decrypted plaintext is: {text}'.format(text=plaintext))
-    return plaintext
+    return decrypt_values(vault_url, transit_path, key_name, token, [ciphertext])[0]
 
 
 # Testing
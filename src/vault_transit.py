@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This vault transit script encrypts and decrypts values with the transit secrets engine of Vault. One client is kept
+# per (url, token) with a keep-alive connection pool, so that seeding many secrets costs one TLS handshake. Values are
+# sent in batches (transit 'batch_input') - one request encrypts or decrypts many values. Decrypted plaintexts are
+# cached in memory for a limited time (TTL) in a size bounded LRU cache. Plaintexts are never printed or logged.
+
+import base64
+import threading
+import time
+from collections import OrderedDict
+
+import hvac
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 8
+# values sent per transit request, Vault limits the size of a request
+DEFAULT_BATCH_SIZE = 250
+DEFAULT_CACHE_TTL_SECS = 300
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class VaultTransitError(RuntimeError):
+    pass
+
+
+# Decrypted plaintexts by (url, transit path, key name, ciphertext), an entry expires ttl_secs after it was added and
+# the least recently used entries are dropped beyond max_entries
+class SecretCache:
+    def __init__(self, ttl_secs=DEFAULT_CACHE_TTL_SECS, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, plaintext):
+        if self.max_entries <= 0 or self.ttl_secs <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (plaintext, time.monotonic() + self.ttl_secs)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+secret_cache = SecretCache()
+
+
+# Pooled hvac client of (url, token), created on first use
+def transit_client(vault_url, token, pool_size=DEFAULT_POOL_SIZE):
+    key = (vault_url, token)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            client = hvac.Client(url=vault_url, token=token, session=session)
+            _clients[key] = client
+        return client
+
+
+# Closes the connection pools of all clients
+def close_transit_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.adapter.close()
+        _clients.clear()
+
+
+def _batches(values, batch_size):
+    for start in range(0, len(values), batch_size):
+        yield values[start:start + batch_size]
+
+
+# Batch results in request order, an item error fails the whole batch without echoing the values sent
+def _batch_results(response, field, count):
+    results = response['data']['batch_results']
+    if len(results) != count:
+        raise VaultTransitError('Vault transit returned {} results for {} values'.format(len(results), count))
+    errors = [str(index) + ': ' + result['error'] for index, result in enumerate(results) if result.get('error')]
+    if errors:
+        raise VaultTransitError('Vault transit failed for batch items ' + ', '.join(errors))
+    return [result.get(field, '') for result in results]
+
+
+# Encrypts plaintexts in batches, returns the ciphertexts in the same order. Ciphertexts are added to the cache so that
+# decrypting them again doesn't call Vault
+def encrypt_values(vault_url, transit_path, key_name, token, plaintexts, batch_size=DEFAULT_BATCH_SIZE):
+    client = transit_client(vault_url, token)
+    ciphertexts = []
+    for batch in _batches(list(plaintexts), batch_size):
+        response = client.secrets.transit.encrypt_data(
+            name=key_name,
+            batch_input=[{'plaintext': base64.b64encode(plaintext.encode()).decode()} for plaintext in batch],
+            mount_point=transit_path,
+        )
+        for plaintext, ciphertext in zip(batch, _batch_results(response, 'ciphertext', len(batch))):
+            secret_cache.put((vault_url, transit_path, key_name, ciphertext), plaintext)
+            ciphertexts.append(ciphertext)
+    return ciphertexts
+
+
+# Decrypts ciphertexts, returns the plaintexts in the same order. Cached plaintexts are used, the others are decrypted
+# in batches, duplicates are decrypted once
+def decrypt_values(vault_url, transit_path, key_name, token, ciphertexts, batch_size=DEFAULT_BATCH_SIZE):
+    ciphertexts = list(ciphertexts)
+    plaintexts = {}
+    for ciphertext in ciphertexts:
+        plaintext = secret_cache.get((vault_url, transit_path, key_name, ciphertext))
+        if plaintext is not None:
+            plaintexts[ciphertext] = plaintext
+    missing = list(dict.fromkeys(ciphertext for ciphertext in ciphertexts if ciphertext not in plaintexts))
+    if missing:
+        client = transit_client(vault_url, token)
+        for batch in _batches(missing, batch_size):
+            response = client.secrets.transit.decrypt_data(
+                name=key_name,
+                batch_input=[{'ciphertext': ciphertext} for ciphertext in batch],
+                mount_point=transit_path,
+            )
+            for ciphertext, encoded in zip(batch, _batch_results(response, 'plaintext', len(batch))):
+                plaintext = base64.b64decode(encoded).decode()
+                secret_cache.put((vault_url, transit_path, key_name, ciphertext), plaintext)
+                plaintexts[ciphertext] = plaintext
+    return [plaintexts[ciphertext] for ciphertext in ciphertexts]
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# This warm pool script keeps test container process groups deployed across runs. A process group returned to the pool
+# is reset - harness processors, connections and queued FlowFiles are removed and everything is stopped - while the
+# deployed flow and its enabled controller services stay as they are. The process group is tagged (in its comments)
+# with the flow id, the flow version, the deployed process group and the parameter contexts created for it, so that
+# the next run can reuse it when the version matches or move it to another version in place. Process groups beyond the
+# max count are evicted, least recently used first.
+
+import json
+import threading
+import time
+from dataclasses import dataclass, asdict, field
+
+from nipyapi import canvas, versioning, nifi
+
+from flow_utils import schedule_process_group, drop_all_flowfiles, lookup_cache
+from resource_ledger import ResourceLedger
+
+WARM_POOL_TAG = 'nifi-testing-warm-pool:'
+LOCALLY_MODIFIED_STATES = ('LOCALLY_MODIFIED', 'LOCALLY_MODIFIED_AND_STALE')
+
+
+@dataclass(slots=True)
+class WarmPoolTag:
+    flow_id: str
+    version: int
+    deployed_pg_id: str
+    last_used: float
+    parameter_context_ids: list = field(default_factory=list)
+
+    def to_comments(self):
+        return WARM_POOL_TAG + json.dumps(asdict(self))
+
+    # Parses the tag of a pooled process group, process groups that are not tagged are not part of the pool
+    @staticmethod
+    def from_comments(comments):
+        if not comments or not comments.startswith(WARM_POOL_TAG):
+            return None
+        try:
+            return WarmPoolTag(**json.loads(comments[len(WARM_POOL_TAG):]))
+        except (ValueError, TypeError):
+            return None
+
+
+class WarmPool:
+    def __init__(self, root_pg_id, max_count):
+        self.max_count = max_count
+        self._lock = threading.Lock()
+        # test container process group name -> (process group, tag)
+        self._entries = {}
+        for pg in nifi.ProcessGroupsApi().get_process_groups(root_pg_id).process_groups:
+            tag = WarmPoolTag.from_comments(pg.component.comments)
+            if tag is not None:
+                self._entries[pg.component.name] = (pg, tag)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Takes a pooled process group out of the pool, so that no other flow can use it until it is released
+    def claim(self, pg_name):
+        with self._lock:
+            return self._entries.pop(pg_name, None)
+
+    # Tags a reset process group and puts it back into the pool
+    def release(self, pg, tag):
+        pg = canvas.update_process_group(pg, {'comments': tag.to_comments()})
+        with self._lock:
+            self._entries[pg.component.name] = (pg, tag)
+
+    # Evicts least recently used process groups beyond the max count
+    def evict(self, readiness):
+        with self._lock:
+            by_last_used = sorted(self._entries.items(), key=lambda entry: entry[1][1].last_used, reverse=True)
+            evicted = by_last_used[self.max_count:]
+            for pg_name, _ in evicted:
+                del self._entries[pg_name]
+        for pg_name, (pg, tag) in evicted:
+            print('Evicting process group from warm pool:', pg_name)
+            evict_process_group(pg, tag, readiness)
+
+
+# Deletes a test container process group that left the pool together with the parameter contexts created for it
+def evict_process_group(pg, tag, readiness):
+    ledger = ResourceLedger()
+    ledger.add_process_group(pg)
+    for context_id in tag.parameter_context_ids:
+        ledger.add_parameter_context(context_id)
+    ledger.teardown(readiness)
+
+
+# Stops everything in a test container process group and removes the harness, so that the next run starts from the
+# deployed flow only. Controller services stay enabled
+def reset_process_group(pg_id, readiness):
+    schedule_process_group(pg_id, False, readiness)
+    drop_all_flowfiles(pg_id, readiness)
+    for connection in canvas.list_all_connections(pg_id, False):
+        canvas.delete_connection(connection, True)
+    for processor in canvas.list_all_processors(pg_id):
+        if processor.component.parent_group_id == pg_id:
+            canvas.delete_processor(processor, True, True)
+    lookup_cache.invalidate(pg_id=pg_id)
+
+
+# Moves a deployed flow to another version in place. Local modifications (sensitive properties, ports) are reverted
+# first as NiFi only changes the version of an unmodified flow
+def update_flow_version(deployed_pg, version, readiness):
+    vci = deployed_pg.component.version_control_information
+    if vci is not None and vci.state in LOCALLY_MODIFIED_STATES:
+        versions_api = nifi.VersionsApi()
+        revert_request = versioning.revert_flow_ver(deployed_pg).request
+        readiness.wait_until(lambda: versions_api.get_revert_request(revert_request.request_id).request.complete,
+                             'local modifications to be reverted')
+        revert_request = versions_api.delete_revert_request(revert_request.request_id).request
+        if revert_request.failure_reason is not None:
+            raise ValueError('Reverting local modifications failed: ' + revert_request.failure_reason)
+        deployed_pg = canvas.get_process_group(deployed_pg.id, 'id')
+    versioning.update_flow_ver(deployed_pg, version)
+    return canvas.get_process_group(deployed_pg.id, 'id')
+
+
+def new_tag(flow_id, version, deployed_pg_id, parameter_context_ids):
+    return WarmPoolTag(flow_id, version, deployed_pg_id, time.time(), parameter_context_ids)
@@ -0,0 +1,115 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+import mmap
+
+import pytest
+
+import content_compare
+import utils
+from content_compare import BLOCK_SIZE, DIFF_MAX_LINES, compare_content
+from utils import FileContentType, iter_file_chunks, normalized_chunks
+
+
+def _chunks(data, size):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+@pytest.fixture
+def expected_file(tmp_path):
+    def _write(data):
+        path = tmp_path / 'expected.txt'
+        path.write_bytes(data)
+        return str(path)
+    return _write
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7])
+def test_normalized_chunks_hold_back_cr_at_chunk_boundaries(chunk_size):
+    data = b'a\r\nb\rc\r\n\r\nd\r'
+    assert b''.join(normalized_chunks(_chunks(data, chunk_size), FileContentType.TEXT)) == b'a\nb\nc\n\nd\n'
+
+
+def test_normalized_chunks_pass_binary_through():
+    chunks = [b'a\r', b'\nb']
+    assert list(normalized_chunks(chunks, FileContentType.BINARY)) == chunks
+
+
+def test_iter_file_chunks_normalizes_text_across_chunks(expected_file):
+    file_name = expected_file(b'ab\r\ncd\r\n' * 3)
+    chunks = list(iter_file_chunks(file_name, FileContentType.TEXT, chunk_size=3))
+    assert b''.join(chunks) == b'ab\ncd\n' * 3
+    assert b''.join(iter_file_chunks(file_name, FileContentType.BINARY, chunk_size=3)) == b'ab\r\ncd\r\n' * 3
+
+
+def test_iter_file_chunks_of_empty_file(expected_file):
+    assert list(iter_file_chunks(expected_file(b''))) == []
+
+
+def test_iter_file_chunks_memory_maps_large_files(expected_file, monkeypatch):
+    file_name = expected_file(b'line\r\n' * 1000)
+    mapped = []
+    real_mmap = mmap.mmap
+
+    def _mmap(*args, **kwargs):
+        mapped.append(args)
+        return real_mmap(*args, **kwargs)
+    monkeypatch.setattr(utils.mmap, 'mmap', _mmap)
+
+    monkeypatch.setattr(utils, 'STREAM_MMAP_THRESHOLD', 6001)
+    small = b''.join(iter_file_chunks(file_name, chunk_size=64))
+    assert not mapped
+    monkeypatch.setattr(utils, 'STREAM_MMAP_THRESHOLD', 6000)
+    large = b''.join(iter_file_chunks(file_name, chunk_size=64))
+    assert len(mapped) == 1
+    assert small == large == b'line\n' * 1000
+
+
+def test_matching_content(expected_file):
+    data = bytes(range(256)) * (3 * BLOCK_SIZE // 256 + 7)
+    comparison = compare_content(iter(_chunks(data, 1000)), expected_file(data), FileContentType.BINARY)
+    assert comparison.match
+    assert comparison.actual_size == comparison.expected_size == len(data)
+
+
+def test_text_line_endings_of_actual_content_are_normalized(expected_file):
+    comparison = compare_content(iter([b'one\r', b'\ntwo\r\n']), expected_file(b'one\ntwo\n'))
+    assert comparison.match
+
+
+def test_binary_content_is_compared_as_is(expected_file):
+    comparison = compare_content(iter([b'one\r\n']), expected_file(b'one\n'), FileContentType.BINARY)
+    assert not comparison.match
+    assert comparison.first_difference == 3
+
+
+def test_first_difference_in_a_later_block(expected_file):
+    lines = [('line %06d\n' % number).encode() for number in range(20000)]
+    expected = b''.join(lines)
+    lines[15000] = b'changed line\n'
+    actual = b''.join(lines)
+    comparison = compare_content(iter(_chunks(actual, 4096)), expected_file(expected))
+    assert not comparison.match
+    assert comparison.first_difference == expected.index(b'line 015000')
+    assert '-line 015000\n' in comparison.diff
+    assert '+changed line\n' in comparison.diff
+
+
+def test_shorter_actual_content_differs_at_its_end(expected_file):
+    comparison = compare_content(iter([b'abc']), expected_file(b'abcdef'))
+    assert (comparison.match, comparison.first_difference, comparison.actual_size, comparison.expected_size) == \
+        (False, 3, 3, 6)
+
+
+def test_diff_is_bounded(expected_file, monkeypatch):
+    monkeypatch.setattr(content_compare, 'SPOOL_MAX_MEMORY', 1024)
+    expected = b''.join(b'%d\n' % number for number in range(5000))
+    actual = b''.join(b'x%d\n' % number for number in range(5000))
+    comparison = compare_content(iter(_chunks(actual, 999)), expected_file(expected))
+    diff_lines = comparison.diff.splitlines()
+    assert comparison.first_difference == 0
+    assert len(diff_lines) == DIFF_MAX_LINES + 1
+    assert diff_lines[-1] == '... diff truncated'
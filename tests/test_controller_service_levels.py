@@ -0,0 +1,54 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+from types import SimpleNamespace
+
+from flow_utils import get_controller_service_levels
+
+
+# Controller service entity as returned by list_all_controllers, properties point to the services they depend on
+def _service(cs_id, depends_on=(), referenced_by=()):
+    properties = {'service ' + str(index): dependency for index, dependency in enumerate(depends_on)}
+    descriptors = {name: SimpleNamespace(identifies_controller_service=True) for name in properties}
+    properties['plain'] = 'not-a-service'
+    descriptors['plain'] = SimpleNamespace(identifies_controller_service=False)
+    referencing = [SimpleNamespace(id=referencing_id, component=SimpleNamespace(reference_type='ControllerService'))
+                   for referencing_id in referenced_by]
+    return SimpleNamespace(id=cs_id, component=SimpleNamespace(properties=properties, descriptors=descriptors,
+                                                               referencing_components=referencing))
+
+
+def _ids(levels):
+    return [sorted(controller_service.id for controller_service in level) for level in levels]
+
+
+def test_independent_services_are_one_level():
+    assert _ids(get_controller_service_levels([_service('a'), _service('b')])) == [['a', 'b']]
+
+
+def test_services_are_levelled_by_dependencies():
+    services = [_service('reader', ['schema']), _service('writer', ['schema', 'ssl']), _service('schema', ['ssl']),
+                _service('ssl'), _service('pool')]
+    assert _ids(get_controller_service_levels(services)) == [['pool', 'ssl'], ['schema'], ['reader', 'writer']]
+
+
+def test_referencing_components_are_dependents():
+    services = [_service('ssl', referenced_by=['client', 'processor-outside']), _service('client')]
+    assert _ids(get_controller_service_levels(services)) == [['ssl'], ['client']]
+
+
+def test_references_to_unknown_services_and_self_are_ignored():
+    services = [_service('a', ['missing', 'a']), _service('b', ['a'])]
+    assert _ids(get_controller_service_levels(services)) == [['a'], ['b']]
+
+
+def test_services_in_a_cycle_are_put_last():
+    services = [_service('base'), _service('x', ['y', 'base']), _service('y', ['x']), _service('z', ['y'])]
+    assert _ids(get_controller_service_levels(services)) == [['base'], ['x', 'y', 'z']]
+
+
+def test_no_services():
+    assert get_controller_service_levels([]) == []
@@ -0,0 +1,50 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+import pytest
+from jsonpath_ng import parse
+
+from db_utils.assertions import DbMismatch, diff_rows, parse_db_assertions
+from db_utils.fixtures import FixtureError
+
+DB_PATH = parse('$.expected_output.db')
+
+
+def test_db_assertions():
+    assertion, = parse_db_assertions(DB_PATH, {'expected_output': {'db': [
+        {'database': 'pg', 'table': 'users', 'where': 'id < 3', 'file': 'users.csv'}]}})
+    assert (assertion.table, assertion.where, assertion.file_name) == ('users', 'id < 3', 'users.csv')
+    assert parse_db_assertions(DB_PATH, {'expected_output': {}}) == ()
+
+
+def test_db_assertion_of_empty_table_needs_columns():
+    with pytest.raises(FixtureError, match='needs a file, rows or columns'):
+        parse_db_assertions(DB_PATH, {'expected_output': {'db': [{'database': 'pg', 'table': 'users'}]}})
+    assertion, = parse_db_assertions(DB_PATH, {'expected_output': {'db': [
+        {'database': 'pg', 'table': 'users', 'columns': ['id']}]}})
+    assert assertion.rows == ()
+
+
+def _hashed(rows):
+    return iter(sorted((hash(row), row) for row in rows))
+
+
+def test_diff_rows_reports_missing_and_unexpected_rows():
+    expected = [(1, 'a'), (2, 'b'), (3, 'c'), (3, 'c')]
+    actual = [(1, 'a'), (3, 'c'), (4, 'd'), (5, 'e')]
+    mismatch = diff_rows(_hashed(expected), _hashed(actual), ('id', 'name'), DbMismatch('t', 4, 4), 10)
+    assert (mismatch.missing_count, mismatch.unexpected_count) == (2, 2)
+    assert sorted(mismatch.missing_rows, key=str) == [{'id': 2, 'name': 'b'}, {'id': 3, 'name': 'c'}]
+    assert sorted(mismatch.unexpected_rows, key=str) == [{'id': 4, 'name': 'd'}, {'id': 5, 'name': 'e'}]
+    assert str(mismatch).startswith('t: 4 rows expected, 4 found, 2 missing, 2 unexpected')
+
+
+def test_diff_rows_keeps_at_most_max_diff_rows():
+    mismatch = diff_rows(_hashed([(number,) for number in range(100)]), _hashed([]), ('id',),
+                         DbMismatch('t', 100, 0), 3)
+    assert mismatch.missing_count == 100
+    assert len(mismatch.missing_rows) == 3
+    assert mismatch.unexpected_rows == []
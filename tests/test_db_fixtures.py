@@ -0,0 +1,68 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+import json
+
+import pytest
+
+from db_utils.fixtures import Fixture, FixtureError, load_databases, open_csv, parse_fixtures
+
+
+def _fixtures(*json_fixtures):
+    return parse_fixtures({'settings': {'fixtures': list(json_fixtures)}})
+
+
+def test_fixture_rows_as_objects_take_columns_of_first_row():
+    fixture, = _fixtures({'database': 'pg', 'table': 'users', 'sql': 'CREATE TABLE users (id INT)',
+                          'rows': [{'id': 1, 'name': 'a'}, {'name': 'b', 'id': 2}, {'id': 3, 'meta': {'x': 1}}]})
+    assert fixture == Fixture('pg', 'users', True, ('CREATE TABLE users (id INT)',), '', ('id', 'name'),
+                              ((1, 'a'), (2, 'b'), (3, None)))
+
+
+def test_fixture_rows_as_arrays_need_columns():
+    fixture, = _fixtures({'database': 'pg', 'table': 't', 'truncate': 'false', 'columns': ['id', 'doc'],
+                          'rows': [[1, {'k': [1, 2]}]]})
+    assert not fixture.truncate
+    assert fixture.rows == ((1, json.dumps({'k': [1, 2]})),)
+    with pytest.raises(FixtureError, match='rows without columns'):
+        _fixtures({'database': 'pg', 'table': 't', 'rows': [[1]]})
+
+
+def test_no_fixtures():
+    assert parse_fixtures({}) == ()
+
+
+@pytest.mark.parametrize('json_fixture, message', [
+    ('users', 'must be a json object'),
+    ({'table': 't'}, 'needs a database and a table'),
+    ({'database': 'pg', 'table': 't', 'file': 'a.csv', 'rows': [{'id': 1}]}, 'has both a file and rows'),
+    ({'database': 'pg', 'table': 't', 'rows': {'id': 1}}, 'must be a json array'),
+    ({'database': 'pg', 'table': 't', 'columns': ['a', 'b'], 'rows': [[1]]}, 'must have 2 values'),
+])
+def test_invalid_fixtures_are_rejected(json_fixture, message):
+    with pytest.raises(FixtureError, match=message):
+        _fixtures(json_fixture)
+
+
+def test_fixtures_must_be_a_list():
+    with pytest.raises(FixtureError, match='fixtures must be a json array'):
+        parse_fixtures({'settings': {'fixtures': {'database': 'pg'}}})
+
+
+def test_load_databases_validates_type_and_dsn(tmp_path):
+    databases_file = tmp_path / 'databases.json'
+    databases_file.write_text(json.dumps({'pg': {'type': 'postgres', 'dsn': 'host=localhost'}}))
+    assert load_databases(str(databases_file))['pg']['type'] == 'postgres'
+    databases_file.write_text(json.dumps({'db': {'type': 'oracle', 'dsn': 'x'}}))
+    with pytest.raises(FixtureError, match='needs a type'):
+        load_databases(str(databases_file))
+
+
+def test_open_csv_yields_header_and_rest_of_file(tmp_path):
+    (tmp_path / 'users.csv').write_text(' id ,"full name"\n1,"a, b"\n')
+    with open_csv(tmp_path.as_posix(), 'users.csv') as (columns, csv_file):
+        assert columns == ('id', 'full name')
+        assert csv_file.read() == '1,"a, b"\n'
@@ -0,0 +1,166 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+# Runs flow_unit_test.py against the in-process fake NiFi in every harness mode, each run has a passing test case, one
+# whose output content differs and one whose output attributes differ
+
+import glob
+import json
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmark import generate_test_data, write_properties
+from conftest import SRC_DIR
+from fake_nifi import CONTROLLER_SERVICE, PROCESS_GROUP, FakeNifi, start_fake_nifi, stop_fake_nifi
+from flow_utils import CONTEXT_MAP_NAME
+
+FLOW_COUNT = 2
+PAYLOAD_BYTES = 4096
+HARNESS_MODES = {
+    'nifi compare': {},
+    'reconcile harness': {'reconcile_harness': 'true'},
+    'stream input': {'stream_input': 'true'},
+    'client compare': {'compare_content': 'client'},
+    'batched': {'batch_test_cases': 'true'},
+    'parallel flows': {'parallel_flows': '2'},
+    'pipelined': {'pipeline_depth': '1'},
+}
+
+
+@pytest.fixture(scope='module')
+def test_data(tmp_path_factory):
+    base_dir = tmp_path_factory.mktemp('e2e')
+    flow_names = generate_test_data(str(base_dir / 'test-data'), FLOW_COUNT, 3, 2, PAYLOAD_BYTES)
+    flow_dir = base_dir / 'test-data' / flow_names[0]
+    prefix = flow_names[0] + '_tc'
+    # tc2: one character of the expected output content differs
+    output_file = flow_dir / (prefix + '2_output.txt')
+    content = output_file.read_text()
+    output_file.write_text(content[:100] + ('x' if content[100] != 'x' else 'y') + content[101:])
+    # tc3: an expected output attribute differs
+    test_file = flow_dir / (prefix + '3.json')
+    test_case = json.loads(test_file.read_text())
+    test_case['expected_output']['attributes']['attr_1'] = 'unexpected value'
+    test_file.write_text(json.dumps(test_case))
+    return base_dir, flow_names
+
+
+@pytest.fixture(scope='module')
+def fake_nifi_env(test_data):
+    _, flow_names = test_data
+    fake = FakeNifi()
+    for flow_name in flow_names:
+        fake.add_flow('nifi-testing', flow_name, 1)
+    server = start_fake_nifi(fake, '127.0.0.1', 0)
+    port = str(server.server_address[1])
+    yield dict(os.environ, NIFI_SCHEME='http', NIFI_HOSTNAME='127.0.0.1', NIFI_PORT=port,
+               NIFI_REGISTRY_HOSTNAME='127.0.0.1', NIFI_REGISTRY_PORT=port, NIFI_TEST_API_HOSTNAME='127.0.0.1')
+    stop_fake_nifi(server)
+
+
+def _run_suite(base_dir, flow_names, env, overrides, run_name):
+    run_dir = base_dir / run_name.replace(' ', '_')
+    run_dir.mkdir()
+    properties_file = str(run_dir / 'test.properties')
+    write_properties(os.path.join(SRC_DIR, '..', 'config', 'test.properties'), properties_file, {
+        'repo_base_dir': base_dir.as_posix() + '/', 'test_data_dir': 'test-data', 'skip_test_dirs': '',
+        'include_only': '', 'flow_version_mapping': json.dumps({flow_name: 1 for flow_name in flow_names}),
+        'report_dir': str(run_dir / 'reports'), **overrides})
+    process = subprocess.run([sys.executable, 'flow_unit_test.py', '--properties', properties_file], cwd=SRC_DIR,
+                             env=env, capture_output=True, text=True, timeout=300)
+    reports = glob.glob(str(run_dir / 'reports' / 'report-*.json'))
+    assert reports, process.stdout[-2000:] + process.stderr[-2000:]
+    with open(reports[0]) as report_file:
+        return json.load(report_file), process.stdout
+
+
+@pytest.mark.parametrize('mode', HARNESS_MODES)
+def test_harness_mode(test_data, fake_nifi_env, mode):
+    base_dir, flow_names = test_data
+    report, stdout = _run_suite(base_dir, flow_names, fake_nifi_env, HARNESS_MODES[mode], mode)
+    results = {test_case['name']: test_case for flow in report['flows'] for test_case in flow['test_cases']}
+    failing = {flow_names[0] + '_tc2', flow_names[0] + '_tc3'}
+    assert {name: test_case['result'] for name, test_case in results.items()} == {
+        flow_name + '_tc' + str(index): 'FAILED' if flow_name + '_tc' + str(index) in failing else 'PASSED'
+        for flow_name in flow_names for index in (1, 2, 3)}
+    assert report['result'] == 'FAILURE'
+    assert all(flow['setup_error'] is None for flow in report['flows'])
+    if mode == 'batched':
+        assert results[flow_names[0] + '_tc2']['message'] == 'mismatches: flow content'
+        assert results[flow_names[0] + '_tc3']['message'] == 'mismatches: attr_1'
+    # only a bounded diff of the output content is printed
+    assert len(stdout) < 64 * 1024
+
+
+def test_large_output_is_compared_on_the_client(tmp_path, fake_nifi_env, test_data):
+    _, flow_names = test_data
+    flow_name = flow_names[0]
+    generate_test_data(str(tmp_path / 'test-data'), 1, 1, 1, 3 * 1024 * 1024, flow_prefix=flow_name[:-1])
+    for mode in ('nifi compare', 'batched'):
+        report, _ = _run_suite(tmp_path, [flow_name], fake_nifi_env, HARNESS_MODES[mode], mode)
+        result = report['flows'][0]['test_cases'][0]['result']
+        # ExtractText can't hold content beyond its buffer, the streamed client side comparison can
+        assert result == ('FAILED' if mode == 'nifi compare' else 'PASSED')
+
+
+@pytest.mark.parametrize('deleted', ['deployed flow', 'context map'])
+def test_warm_flow_deleted_out_of_band_is_deployed_again(tmp_path, deleted):
+    flow_name, = generate_test_data(str(tmp_path / 'test-data'), 1, 1, 1, PAYLOAD_BYTES)
+    fake = FakeNifi()
+    fake.add_flow('nifi-testing', flow_name, 1)
+    server = start_fake_nifi(fake, '127.0.0.1', 0)
+    port = str(server.server_address[1])
+    env = dict(os.environ, NIFI_SCHEME='http', NIFI_HOSTNAME='127.0.0.1', NIFI_PORT=port,
+               NIFI_REGISTRY_HOSTNAME='127.0.0.1', NIFI_REGISTRY_PORT=port, NIFI_TEST_API_HOSTNAME='127.0.0.1')
+    try:
+        report, _ = _run_suite(tmp_path, [flow_name], env, {'warm_pool': 'true'}, 'cold run')
+        assert report['result'] == 'SUCCESS'
+        test_pg, = fake._children(fake.root_id, PROCESS_GROUP)
+        if deleted == 'deployed flow':
+            victim, = fake._children(test_pg['id'], PROCESS_GROUP)
+            fake._remove_subtree(victim['id'])
+        else:
+            victim, = [controller for controller in fake._children(test_pg['id'], CONTROLLER_SERVICE)
+                       if controller['name'] == CONTEXT_MAP_NAME]
+        del fake._components[victim['id']]
+
+        report, stdout = _run_suite(tmp_path, [flow_name], env, {'warm_pool': 'true'}, 'warm run')
+        assert 'Unable to reuse warm flow' in stdout
+        assert report['result'] == 'SUCCESS'
+        assert len(fake._children(fake.root_id, PROCESS_GROUP)) == 1
+    finally:
+        stop_fake_nifi(server)
+
+
+def test_pipeline_depth_is_limited_by_listening_ports(test_data, fake_nifi_env):
+    base_dir, flow_names = test_data
+    report, stdout = _run_suite(base_dir, flow_names, fake_nifi_env,
+                                {'pipeline_depth': '2', 'nifi_test_api_ports': '9091'}, 'one port pipelined')
+    assert 'using pipeline depth 0' in stdout
+    assert 'flows with 1 in parallel' in stdout
+    assert all(flow['setup_error'] is None for flow in report['flows'])
+
+
+def test_incrementally_skipped_test_cases_are_reported_as_skipped(test_data, fake_nifi_env):
+    base_dir, flow_names = test_data
+    overrides = {'incremental_db': str(base_dir / 'incremental.db')}
+    _run_suite(base_dir, flow_names, fake_nifi_env, overrides, 'incremental first run')
+    report, _ = _run_suite(base_dir, flow_names, fake_nifi_env, overrides, 'incremental second run')
+    assert {flow_name: sorted(tc_names) for flow_name, tc_names in report['skipped_test_cases'].items()} == {
+        flow_names[0]: [flow_names[0] + '_tc1'],
+        flow_names[1]: [flow_names[1] + '_tc' + str(index) for index in (1, 2, 3)]}
+    junit_file, = glob.glob(str(base_dir / 'incremental_second_run' / 'reports' / 'junit-*.xml'))
+    test_suites = ET.parse(junit_file).getroot()
+    assert (test_suites.get('tests'), test_suites.get('failures'), test_suites.get('skipped')) == ('6', '2', '4')
+    skipped = {(test_suite.get('name'), test_case.get('name'))
+               for test_suite in test_suites for test_case in test_suite.iter('testcase')
+               if test_case.find('skipped') is not None}
+    assert skipped == {(flow_names[0], flow_names[0] + '_tc1')} | {
+        (flow_names[1], flow_names[1] + '_tc' + str(index)) for index in (1, 2, 3)}
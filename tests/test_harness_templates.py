@@ -0,0 +1,93 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from harness_templates import HarnessSpecError, _mark_slots, load_harness_spec
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent / 'config'
+
+
+def _write_spec(tmp_path, spec):
+    spec_file = tmp_path / 'processors.json'
+    spec_file.write_text(spec if isinstance(spec, str) else json.dumps(spec))
+    return str(spec_file)
+
+
+def _processor(name='p', config='{}', location='(1, 2)', p_type='org.apache.nifi.processors.standard.LogAttribute'):
+    return {'name': name, 'type': p_type, 'location': location, 'config': config}
+
+
+def test_mark_slots_replaces_bare_tokens_only():
+    marked = _mark_slots('p', '{"properties":{"Port":test_api_port,"Text":"test_api_port","Flag":true}}')
+    assert json.loads(marked) == {'properties': {'Port': {'$slot': 'test_api_port'}, 'Text': 'test_api_port',
+                                                 'Flag': True}}
+
+
+def test_mark_slots_keeps_escaped_quotes_inside_strings():
+    marked = _mark_slots('p', r'{"Value":"say \"in_attribs\"","Attribs":in_attribs}')
+    assert json.loads(marked) == {'Value': 'say "in_attribs"', 'Attribs': {'$slot': 'in_attribs'}}
+
+
+def test_mark_slots_rejects_unknown_tokens():
+    with pytest.raises(HarnessSpecError, match='Unknown substitution slot "os.system"'):
+        _mark_slots('p', '{"Value":os.system}')
+
+
+def test_render_substitutes_slot_values(tmp_path):
+    spec_file = _write_spec(tmp_path, [_processor(
+        'http_req_processor', r'{"properties":{"HTTP Context Map":ctx_map.id,"Listening Port":test_api_port,'
+                              r'"Report":json.dumps(report_json)},"autoTerminatedRelationships":["failure"]}')])
+    template, = load_harness_spec(spec_file)
+    assert template.location == (1, 2)
+    assert template.slots == frozenset({'ctx_map', 'test_api_port', 'report_json'})
+    config = template.render({'ctx_map': SimpleNamespace(id='ctx-1'), 'test_api_port': '9091',
+                              'report_json': {'match': 'true'}})
+    assert config == {'properties': {'HTTP Context Map': 'ctx-1', 'Listening Port': '9091',
+                                     'Report': '{"match": "true"}'}, 'autoTerminatedRelationships': ['failure']}
+
+
+def test_render_attribute_query_of_report(tmp_path):
+    spec_file = _write_spec(tmp_path, [_processor(config=r'{"properties":{"X-Test-Attributes":attribs_query}}')])
+    template, = load_harness_spec(spec_file)
+    config = template.render({'report_json': {'flow_file_attributes': {'a': '${a}', 'b': '${b}'}}})
+    assert config['properties']['X-Test-Attributes'] == 'a=${a:urlEncode()}&b=${b:urlEncode()}'
+
+
+def test_render_without_slot_value_fails(tmp_path):
+    template, = load_harness_spec(_write_spec(tmp_path, [_processor(config='{"properties":in_attribs}')]))
+    with pytest.raises(HarnessSpecError, match='No value given for slot in_attribs'):
+        template.render({})
+
+
+def test_compiled_spec_is_cached(tmp_path):
+    spec_file = _write_spec(tmp_path, [_processor()])
+    assert load_harness_spec(spec_file) is load_harness_spec(spec_file)
+
+
+@pytest.mark.parametrize('spec, message', [
+    ('{"name": "p"}', 'must be a list of processors'),
+    ('[', 'Invalid harness spec'),
+    ([{'name': 'p', 'type': 't', 'config': '{}'}], "missing \\['location'\\]"),
+    ([_processor(location='(1,')], 'Invalid location of processor p'),
+    ([_processor(location='(1, 2, 3)')], r'must be an \(x, y\) tuple'),
+    ([_processor(config='{"properties":')], 'Invalid config of processor p'),
+    ([_processor(config='[]')], 'must be a json object'),
+    ([_processor(), _processor()], r"Duplicate processor names \['p'\]"),
+])
+def test_invalid_specs_are_rejected(tmp_path, spec, message):
+    with pytest.raises(HarnessSpecError, match=message):
+        load_harness_spec(_write_spec(tmp_path, spec))
+
+
+@pytest.mark.parametrize('spec_file', ['processors.json', 'processors_batched.json',
+                                       'processors_client_compare.json'])
+def test_shipped_specs_compile(spec_file):
+    assert load_harness_spec(str(CONFIG_DIR / spec_file))
@@ -0,0 +1,101 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+import os
+import time
+
+import pytest
+
+from hooks import AFTER, BEFORE, Hook, HookError, HookRunner, parse_hooks, run_hook
+
+posix_only = pytest.mark.skipif(os.name != 'posix', reason='hooks are killed by process group on POSIX only')
+
+
+@pytest.mark.parametrize('json_hooks, hooks', [
+    ('', ()),
+    (None, ()),
+    ('echo a', (Hook('echo a'),)),
+    ({'command': 'echo a', 'timeout_secs': '2.5'}, (Hook('echo a', 2.5),)),
+    (['echo a', ' ', {'command': 'echo b'}], (Hook('echo a'), Hook('echo b'))),
+])
+def test_parse_hooks(json_hooks, hooks):
+    assert parse_hooks(json_hooks) == hooks
+
+
+@pytest.mark.parametrize('json_hooks, message', [
+    ([1], 'hook must be a command or an object with a command'),
+    ({'timeout_secs': 1}, 'hook must be a command'),
+    ({'command': 'echo a', 'timeout_secs': 'soon'}, 'timeout_secs of hook echo a must be a number'),
+])
+def test_invalid_hooks_are_rejected(json_hooks, message):
+    with pytest.raises(HookError, match=message):
+        parse_hooks(json_hooks)
+
+
+def test_hook_output_and_exit_code():
+    result = run_hook(Hook('echo out; echo err >&2; exit 3'), AFTER)
+    assert (result.exit_code, result.stdout, result.stderr, result.timed_out) == (3, 'out\n', 'err\n', False)
+    assert not result.is_ok
+    assert str(result) == 'after hook exited with 3: echo out; echo err >&2; exit 3 - err'
+
+
+def _is_gone(pid):
+    # an orphan that was killed may stay a zombie until init reaps it
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat_file:
+            return stat_file.read().split(') ')[-1].startswith('Z')
+    except FileNotFoundError:
+        return True
+
+
+@posix_only
+def test_timed_out_hook_is_killed_with_its_process_group(tmp_path):
+    pid_file = tmp_path / 'pid'
+    start_time = time.time()
+    result = run_hook(Hook('sleep 30 & echo $! > {}; wait'.format(pid_file), timeout_secs=0.5), BEFORE)
+    assert time.time() - start_time < 10
+    assert result.timed_out and not result.is_ok
+    assert str(result).startswith('before hook timed out after')
+    background_pid = int(pid_file.read_text())
+    deadline = time.time() + 5
+    while not _is_gone(background_pid) and time.time() < deadline:
+        time.sleep(0.05)
+    assert _is_gone(background_pid)
+
+
+def test_hooks_of_a_batch_run_concurrently():
+    runner = HookRunner(default_timeout_secs=10)
+    try:
+        start_time = time.time()
+        batch = runner.start(BEFORE, parse_hooks(['sleep 0.5; echo {}'.format(index) for index in range(16)]))
+        results = batch.wait()
+        assert time.time() - start_time < 1.4
+        assert [result.stdout for result in results] == ['{}\n'.format(index) for index in range(16)]
+        batch.check()
+    finally:
+        runner.shutdown()
+
+
+def test_hooks_started_after_a_batch_wait_for_it(tmp_path):
+    marker = tmp_path / 'after'
+    runner = HookRunner(default_timeout_secs=10)
+    try:
+        after_hooks = runner.start(AFTER, parse_hooks(['sleep 0.5; touch {}'.format(marker)]))
+        before_hooks = runner.start(BEFORE, parse_hooks(['test -f {}'.format(marker)]), after=after_hooks)
+        before_hooks.check()
+    finally:
+        runner.shutdown()
+
+
+def test_batch_check_names_failed_hooks():
+    runner = HookRunner()
+    try:
+        batch = runner.start(AFTER, parse_hooks(['true', 'exit 2']))
+        with pytest.raises(HookError, match='after hook exited with 2: exit 2'):
+            batch.check()
+        assert runner.start(AFTER, ()).wait() == []
+    finally:
+        runner.shutdown()
@@ -0,0 +1,120 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+# modules are imported, so that pytest doesn't collect their Test* classes
+import incremental
+import testcase_loader
+from incremental import harness_fingerprint, record_selection, select_test_cases, test_case_digest as digest_of
+from testcase_loader import load_test_case
+
+TEST_PATHS = testcase_loader.TestPaths('$.input.attributes', '$.expected_output.attributes',
+                                       '$.input.flow_content.file_name', '$.expected_output.flow_content.file_name')
+FINGERPRINT = harness_fingerprint([], {'batch_test_cases': False})
+
+
+def _write_test_case(flow_dir, tc_name, content='payload'):
+    flow_dir.mkdir(exist_ok=True)
+    (flow_dir / (tc_name + '_input.txt')).write_text(content)
+    (flow_dir / (tc_name + '_output.txt')).write_text(content)
+    test_file = flow_dir / (tc_name + '.json')
+    test_file.write_text(json.dumps({
+        'input': {'attributes': {'a': '1'}, 'flow_content': {'file_name': tc_name + '_input.txt'}},
+        'expected_output': {'attributes': {'a': '1'}, 'flow_content': {'file_name': tc_name + '_output.txt'}}}))
+    return test_file
+
+
+@pytest.fixture
+def flow_dir(tmp_path):
+    flow_dir = tmp_path / 'flow'
+    _write_test_case(flow_dir, 'tc1')
+    _write_test_case(flow_dir, 'tc2')
+    return flow_dir
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = incremental.TestSelectionCache(str(tmp_path / 'incremental.db'))
+    yield cache
+    cache.close()
+
+
+def _load(flow_dir):
+    return {'flow': [load_test_case(test_file, TEST_PATHS) for test_file in sorted(flow_dir.glob('*.json'))]}
+
+
+def _select(cache, flow_dir, flow_ids=None, flow_versions=None, force=False):
+    return select_test_cases(_load(flow_dir), cache, flow_ids or {'flow': 'flow-id'},
+                             {'flow': 1} if flow_versions is None else flow_versions, FINGERPRINT, force)
+
+
+def _record(cache, selection, results, flow_id='flow-id', flow_version=1):
+    flow_ctx = SimpleNamespace(flow_name='flow', flow_id=flow_id, flow_version=flow_version,
+                               test_cases={tc_name: [result, 1.0] for tc_name, result in results.items()})
+    record_selection(cache, [flow_ctx], selection.digests)
+
+
+def _to_run(selection):
+    return [test_case.name for test_case in selection.to_run.get('flow', [])]
+
+
+def test_digest_changes_with_referenced_files(flow_dir):
+    test_case, _ = _load(flow_dir)['flow']
+    digest = digest_of(test_case, FINGERPRINT)
+    assert digest == digest_of(test_case, FINGERPRINT)
+    (flow_dir / 'tc1_output.txt').write_text('other payload')
+    assert digest_of(test_case, FINGERPRINT) != digest
+    assert digest_of(test_case, harness_fingerprint([], {'batch_test_cases': True})) != \
+        digest_of(test_case, FINGERPRINT)
+
+
+def test_harness_fingerprint_covers_spec_files(tmp_path):
+    spec_file = tmp_path / 'processors.json'
+    spec_file.write_text('[]')
+    fingerprint = harness_fingerprint([str(spec_file)], {})
+    spec_file.write_text('[ ]')
+    assert harness_fingerprint([str(spec_file)], {}) != fingerprint
+
+
+def test_passed_unchanged_test_cases_are_skipped(cache, flow_dir):
+    selection = _select(cache, flow_dir)
+    assert _to_run(selection) == ['tc1', 'tc2']
+    _record(cache, selection, {'tc1': 'PASSED', 'tc2': 'FAILED'})
+
+    selection = _select(cache, flow_dir)
+    assert _to_run(selection) == ['tc2']
+    assert selection.skipped == {'flow': ['tc1']}
+    assert selection.skipped_count() == 1
+
+
+def test_changed_test_cases_run_again(cache, flow_dir):
+    _record(cache, _select(cache, flow_dir), {'tc1': 'PASSED', 'tc2': 'PASSED'})
+    _write_test_case(flow_dir, 'tc2', 'changed payload')
+    assert _to_run(_select(cache, flow_dir)) == ['tc2']
+
+
+def test_changed_flow_version_or_id_runs_all(cache, flow_dir):
+    _record(cache, _select(cache, flow_dir), {'tc1': 'PASSED', 'tc2': 'PASSED'})
+    assert _to_run(_select(cache, flow_dir)) == []
+    assert _to_run(_select(cache, flow_dir, flow_versions={'flow': 2})) == ['tc1', 'tc2']
+    assert _to_run(_select(cache, flow_dir, flow_ids={'flow': 'other-id'})) == ['tc1', 'tc2']
+
+
+def test_flows_without_mapped_version_always_run(cache, flow_dir):
+    selection = _select(cache, flow_dir, flow_versions={})
+    _record(cache, selection, {'tc1': 'PASSED', 'tc2': 'PASSED'}, flow_version=None)
+    assert _to_run(_select(cache, flow_dir, flow_versions={})) == ['tc1', 'tc2']
+
+
+def test_force_runs_all_and_keeps_digests(cache, flow_dir):
+    _record(cache, _select(cache, flow_dir), {'tc1': 'PASSED', 'tc2': 'PASSED'})
+    selection = _select(cache, flow_dir, force=True)
+    assert _to_run(selection) == ['tc1', 'tc2']
+    assert set(selection.digests) == {('flow', 'tc1'), ('flow', 'tc2')}
@@ -0,0 +1,84 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+from pathlib import Path
+
+import pytest
+
+from scheduler import DEFAULT_FLOW_OVERHEAD_SECS, DEFAULT_TEST_CASE_SECS, CostModel, Shard, ShardError, \
+    order_flows, shard_flows
+
+
+def _tests_by_flow(durations):
+    return {flow_name: [Path(flow_name, tc_name + '.json') for tc_name in tc_durations]
+            for flow_name, tc_durations in durations.items()}
+
+
+def _cost_model(durations, overheads=None):
+    return CostModel(overheads or {flow_name: 0.0 for flow_name in durations},
+                     {(flow_name, tc_name): secs for flow_name, tc_durations in durations.items()
+                      for tc_name, secs in tc_durations.items()})
+
+
+DURATIONS = {'a': {'tc1': 7.0}, 'b': {'tc1': 5.0}, 'c': {'tc1': 4.0}, 'd': {'tc1': 3.0, 'tc2': 1.0},
+             'e': {'tc1': 3.0}, 'f': {'tc1': 2.0}}
+
+
+def test_shard_parse():
+    assert Shard.parse('2/3') == Shard(2, 3)
+
+
+@pytest.mark.parametrize('value', ['0/3', '4/3', '1-3', '', None, '1/0'])
+def test_shard_parse_rejects_invalid_values(value):
+    with pytest.raises(ShardError):
+        Shard.parse(value)
+
+
+def test_flows_are_ordered_longest_first_with_name_as_tie_break():
+    ordered, costs = order_flows(_tests_by_flow(DURATIONS), _cost_model(DURATIONS))
+    assert list(ordered) == ['a', 'b', 'c', 'd', 'e', 'f']
+    assert costs['d'] == 4.0
+
+
+def test_unknown_test_cases_are_estimated_from_file_sizes(tmp_path):
+    small = tmp_path / 'small_tc1.json'
+    small.write_text('{}')
+    large = tmp_path / 'large_tc1.json'
+    large.write_text('{}')
+    (tmp_path / 'large_tc1_input.txt').write_bytes(b'x' * 20 * 1024 * 1024)
+    cost_model = CostModel()
+    assert cost_model.test_case_cost('small', small) == pytest.approx(DEFAULT_TEST_CASE_SECS, abs=0.01)
+    assert cost_model.test_case_cost('large', large) > DEFAULT_TEST_CASE_SECS + 1.9
+    assert cost_model.flow_cost('small', [small]) == pytest.approx(
+        DEFAULT_FLOW_OVERHEAD_SECS + DEFAULT_TEST_CASE_SECS, abs=0.01)
+
+
+def test_flow_overhead_from_history_is_added():
+    cost_model = _cost_model(DURATIONS, {'a': 10.0})
+    assert cost_model.flow_cost('a', [Path('a', 'tc1.json')]) == 17.0
+    assert cost_model.flow_cost('b', [Path('b', 'tc1.json')]) == DEFAULT_FLOW_OVERHEAD_SECS + 5.0
+
+
+def test_shards_split_flows_by_expected_cost():
+    tests_by_flow = _tests_by_flow(DURATIONS)
+    cost_model = _cost_model(DURATIONS)
+    shards = [shard_flows(tests_by_flow, cost_model, Shard(index, 2)) for index in (1, 2)]
+    # LPT: a -> 1, b -> 2, c -> 2, d -> 1, e -> 2, f -> 1
+    assert [list(flows) for flows, _ in shards] == [['a', 'd', 'f'], ['b', 'c', 'e']]
+    assert shards[0][1] == [13.0, 12.0]
+
+
+def test_shards_cover_every_flow_once():
+    tests_by_flow = _tests_by_flow(DURATIONS)
+    cost_model = _cost_model(DURATIONS)
+    assigned = [flow_name for index in (1, 2, 3, 4)
+                for flow_name in shard_flows(tests_by_flow, cost_model, Shard(index, 4))[0]]
+    assert sorted(assigned) == sorted(DURATIONS)
+
+
+def test_more_shards_than_flows_leaves_shards_empty():
+    durations = {'a': {'tc1': 1.0}}
+    assert shard_flows(_tests_by_flow(durations), _cost_model(durations), Shard(2, 3))[0] == {}
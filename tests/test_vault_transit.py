@@ -0,0 +1,59 @@
+#  Copyright (c).
+#  All rights reserved.
+#  This file is part of Nifi Flow Unit Testing Framework,
+#  and is released under the "Apache license 2.0 Agreement". Please see the LICENSE file
+#  that should have been included as part of this package.
+
+import pytest
+
+import vault_transit
+from vault_transit import SecretCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(vault_transit.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SecretCache(ttl_secs=10, max_entries=10)
+    cache.put('key', 'secret')
+    clock[0] += 9.9
+    assert cache.get('key') == 'secret'
+    clock[0] += 0.1
+    assert cache.get('key') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_dropped(clock):
+    cache = SecretCache(ttl_secs=10, max_entries=2)
+    cache.put('a', '1')
+    cache.put('b', '2')
+    assert cache.get('a') == '1'
+    cache.put('c', '3')
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == ('1', None, '3')
+
+
+def test_put_refreshes_ttl(clock):
+    cache = SecretCache(ttl_secs=10, max_entries=2)
+    cache.put('a', '1')
+    clock[0] += 8
+    cache.put('a', '2')
+    clock[0] += 8
+    assert cache.get('a') == '2'
+
+
+@pytest.mark.parametrize('ttl_secs, max_entries', [(0, 10), (10, 0)])
+def test_disabled_cache_keeps_nothing(clock, ttl_secs, max_entries):
+    cache = SecretCache(ttl_secs=ttl_secs, max_entries=max_entries)
+    cache.put('a', '1')
+    assert cache.get('a') is None
+
+
+def test_clear(clock):
+    cache = SecretCache()
+    cache.put('a', '1')
+    cache.clear()
+    assert cache.get('a') is None